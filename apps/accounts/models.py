@@ -1,9 +1,13 @@
 import uuid
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from apps.tenants.models import Tenant
 
 
+# Marker for instances whose stored tenant is not known (deferred field)
+UNKNOWN_TENANT = object()
+
+
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
         if not email:
@@ -54,6 +58,33 @@ class CustomUser(AbstractUser):
     
     def __str__(self):
         return self.email
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored tenant so save() can move the usage counter
+        instance._loaded_tenant_id = instance.__dict__.get('tenant_id', UNKNOWN_TENANT)
+        return instance
+
+    def save(self, *args, **kwargs):
+        """Keep the tenant user quota counter in the same transaction as the row."""
+        from apps.billing.quotas import consume_quota, release_quota
+
+        if self._state.adding:
+            previous_tenant_id = None
+        else:
+            previous_tenant_id = getattr(self, '_loaded_tenant_id', UNKNOWN_TENANT)
+        if previous_tenant_id is UNKNOWN_TENANT or previous_tenant_id == self.tenant_id:
+            super().save(*args, **kwargs)
+            return
+
+        with transaction.atomic(using=kwargs.get('using')):
+            if self.tenant_id:
+                consume_quota(self.tenant_id, 'users')
+            if previous_tenant_id:
+                release_quota(previous_tenant_id, 'users')
+            super().save(*args, **kwargs)
+        self._loaded_tenant_id = self.tenant_id
     
     def get_merged_permissions(self):
         """Get merged permissions from all active roles."""
@@ -1,9 +1,12 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
+from django.db import transaction
+from django.utils import timezone
 from apps.accounts.models import CustomUser, Role
 from apps.tenants.models import Tenant
 from apps.common.constants import PERMISSION_SCHEMA
-from datetime import datetime, timedelta
+from datetime import timedelta
+from rest_framework_simplejwt.serializers import TokenVerifySerializer
 
 
 class RoleSerializer(serializers.ModelSerializer):
@@ -17,7 +20,9 @@ class RoleSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'tenant', 'created_by', 'created_at', 'updated_at']
     
     def get_member_count(self, obj):
-        return obj.users.count()
+        # Annotated where roles are loaded together (see async_me_view)
+        count = getattr(obj, 'member_count', None)
+        return obj.users.count() if count is None else count
     
     def validate_permissions(self, value):
         if not isinstance(value, dict):
@@ -135,47 +140,57 @@ class RegisterSerializer(serializers.Serializer):
         return attrs
     
     def create(self, validated_data):
+        """
+        Create the minimal working tenant atomically: tenant, admin user with
+        admin role and the trial subscription. Everything else runs in a
+        background ProvisioningJob.
+        """
         from apps.billing.models import SubscriptionPlan, Subscription
-        
-        tenant = Tenant.objects.create(
-            name=validated_data['tenant_name'],
-            slug=validated_data['tenant_slug'],
-            enabled_modules=validated_data.get('enabled_modules', ['crm', 'whatsapp', 'meetings']),
-            trial_ends_at=datetime.now() + timedelta(days=14)
-        )
-        
-        admin_user = CustomUser.objects.create_user(
-            email=validated_data['admin_email'],
-            password=validated_data['admin_password'],
-            first_name=validated_data['admin_first_name'],
-            last_name=validated_data.get('admin_last_name', ''),
-            tenant=tenant
-        )
-        
-        admin_role = Role.objects.create(
-            tenant=tenant,
-            name='Admin',
-            description='Full access to all features',
-            permissions={
-                'admin': {'full_access': True}
-            },
-            created_by=admin_user
-        )
-        
-        admin_user.roles.add(admin_role)
-        
-        trial_plan = SubscriptionPlan.objects.filter(is_trial=True, is_active=True).first()
-        if trial_plan:
-            Subscription.objects.create(
+        from apps.tenants.provisioning import enqueue_provisioning
+
+        now = timezone.now()
+        with transaction.atomic():
+            tenant = Tenant.objects.create(
+                name=validated_data['tenant_name'],
+                slug=validated_data['tenant_slug'],
+                enabled_modules=validated_data.get('enabled_modules', ['crm', 'whatsapp', 'meetings']),
+                trial_ends_at=now + timedelta(days=14)
+            )
+
+            admin_user = CustomUser.objects.create_user(
+                email=validated_data['admin_email'],
+                password=validated_data['admin_password'],
+                first_name=validated_data['admin_first_name'],
+                last_name=validated_data.get('admin_last_name', ''),
+                tenant=tenant
+            )
+
+            admin_role = Role.objects.create(
                 tenant=tenant,
-                plan=trial_plan,
-                status='TRIAL',
-                billing_cycle='MONTHLY',
-                current_period_start=datetime.now(),
-                current_period_end=datetime.now() + timedelta(days=14)
+                name='Admin',
+                description='Full access to all features',
+                permissions={
+                    'admin': {'full_access': True}
+                },
+                created_by=admin_user
             )
-        
-        return {'tenant': tenant, 'user': admin_user}
+
+            admin_user.roles.add(admin_role)
+
+            trial_plan = SubscriptionPlan.objects.filter(is_trial=True, is_active=True).first()
+            if trial_plan:
+                Subscription.objects.create(
+                    tenant=tenant,
+                    plan=trial_plan,
+                    status='TRIAL',
+                    billing_cycle='MONTHLY',
+                    current_period_start=now,
+                    current_period_end=now + timedelta(days=14)
+                )
+
+            job = enqueue_provisioning(tenant, admin_user)
+
+        return {'tenant': tenant, 'user': admin_user, 'job': job}
 
 
 class LoginSerializer(serializers.Serializer):
@@ -192,3 +207,10 @@ class ChangePasswordSerializer(serializers.Serializer):
         if attrs['new_password'] != attrs['new_password_confirm']:
             raise serializers.ValidationError({"new_password": "Passwords don't match"})
         return attrs
+
+
+class TokenFieldsSerializer(TokenVerifySerializer):
+    """Field validation of TokenVerifySerializer; the token itself is checked by async_token_verify_view"""
+
+    def validate(self, attrs):
+        return attrs
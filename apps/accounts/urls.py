@@ -9,6 +9,7 @@ router.register('roles', views.RoleViewSet, basename='role')
 
 urlpatterns = [
     path('auth/register/', views.register_view, name='register'),
+    path('auth/register/status/<uuid:job_id>/', views.provisioning_status_view, name='provisioning_status'),
     path('auth/login/', views.login_view, name='login'),
     path('auth/logout/', views.logout_view, name='logout'),
     path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
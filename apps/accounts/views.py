@@ -1,14 +1,29 @@
-from rest_framework import viewsets, status, permissions
+import json
+
+from rest_framework import viewsets, status, permissions, serializers
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken, UntypedToken
+from rest_framework_simplejwt.views import TokenVerifyView
+from asgiref.sync import sync_to_async
 from django.contrib.auth import authenticate
+from django.db.models import Count, IntegerField, OuterRef, Prefetch, Subquery, prefetch_related_objects
+from django.db.models.functions import Coalesce
 from apps.accounts.models import CustomUser, Role
 from apps.accounts.serializers import (
     UserSerializer, UserCreateSerializer, RoleSerializer,
-    RegisterSerializer, LoginSerializer, ChangePasswordSerializer
+    RegisterSerializer, LoginSerializer, ChangePasswordSerializer, TokenFieldsSerializer
 )
 from apps.accounts.services import get_tokens_for_user
+from apps.billing.quotas import QuotaExceeded
+from apps.tenants.provisioning import get_job_status
+from apps.common.async_views import async_api_view, json_response
+from apps.common.response_cache import acache_response, cache_response
+from apps.common.projections import Projection, Column, ProjectedListMixin, Related
 from apps.common.permissions import IsSuperAdmin, IsTenantAdmin, IsTenantMember
 from apps.common.constants import PERMISSION_SCHEMA
 from apps.common.logger import get_logger
@@ -23,17 +38,28 @@ def register_view(request):
     if serializer.is_valid():
         result = serializer.save()
         user = result['user']
-        logger.info(f'New user registered: {user.email}')
+        job = result['job']
+        logger.info('New user registered: %s', user.email)
         tokens = get_tokens_for_user(user)
         return Response({
             'message': 'Registration successful',
             'user': UserSerializer(user).data,
-            'tokens': tokens
+            'tokens': tokens,
+            'provisioning': {'job_id': str(job.id), 'status': job.status}
         }, status=status.HTTP_201_CREATED)
-    logger.warning(f'Registration failed: {serializer.errors}')
+    logger.warning('Registration failed: %s', serializer.errors)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def provisioning_status_view(request, job_id):
+    job = get_job_status(job_id)
+    if not job:
+        return Response({'error': 'Provisioning job not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(job, headers={'Cache-Control': 'no-store'})
+
+
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
 def login_view(request):
@@ -47,23 +73,23 @@ def login_view(request):
         )
 
         if user and user.is_active:
-            logger.info(f'User logged in successfully: {user.email}, tenant: {user.tenant.slug if user.tenant else "No tenant"}')
+            logger.info('User logged in successfully: %s, tenant: %s', user.email, user.tenant.slug if user.tenant else 'No tenant')
             try:
                 tokens = get_tokens_for_user(user)
-                logger.debug(f'JWT tokens generated for user: {user.email}')
+                logger.debug('JWT tokens generated for user: %s', user.email)
                 return Response({
                     'message': 'Login successful',
                     'user': UserSerializer(user).data,
                     'tokens': tokens
                 })
             except Exception as e:
-                logger.error(f'Error generating tokens for user {user.email}: {str(e)}', exc_info=True)
+                logger.error('Error generating tokens for user %s: %s', user.email, e, exc_info=True)
                 return Response({'error': 'Token generation failed'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        logger.warning(f'Failed login attempt for email: {email}')
+        logger.warning('Failed login attempt for email: %s', email)
         return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
 
-    logger.warning(f'Invalid login request data: {serializer.errors}')
+    logger.warning('Invalid login request data: %s', serializer.errors)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -73,10 +99,10 @@ def logout_view(request):
         refresh_token = request.data.get('refresh_token')
         token = RefreshToken(refresh_token)
         token.blacklist()
-        logger.info(f'User logged out: {request.user.email}')
+        logger.info('User logged out: %s', request.user.email)
         return Response({'message': 'Logout successful'})
     except Exception as e:
-        logger.warning(f'Logout failed for user {request.user}: {str(e)}')
+        logger.warning('Logout failed for user %s: %s', request.user, e)
         return Response({'error': 'Invalid token'}, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -94,8 +120,27 @@ def change_password_view(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class UserViewSet(viewsets.ModelViewSet):
+def load_user_roles(keys, request):
+    members = {}
+    for user_id, role_id in CustomUser.roles.through.objects.filter(customuser_id__in=keys).values_list(
+            'customuser_id', 'role_id'):
+        members.setdefault(role_id, []).append(user_id)
+    # Each role is serialized once however many of the users hold it
+    roles = role_projection.keyed(roles_with_member_count().filter(pk__in=members), request)
+    user_roles = {}
+    for role_id, item in roles.items():
+        for user_id in members[role_id]:
+            user_roles.setdefault(user_id, []).append(item)
+    return user_roles
+
+
+role_projection = Projection(RoleSerializer, member_count=Column('member_count'))
+user_projection = Projection(UserSerializer, roles=Related(load_user_roles, default=[]))
+
+
+class UserViewSet(ProjectedListMixin, viewsets.ModelViewSet):
     queryset = CustomUser.objects.all()
+    list_projection = user_projection
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -113,10 +158,10 @@ class UserViewSet(viewsets.ModelViewSet):
             # Validate access: super admins can access any tenant, others only their own
             if not user.is_super_admin:
                 if not user.tenant or str(user.tenant.id) != str(x_tenant_id):
-                    logger.warning(f'User {user.email} attempted to access users from different tenant')
+                    logger.warning('User %s attempted to access users from different tenant', user.email)
                     return CustomUser.objects.none()
 
-            logger.info(f'Filtering users by x-tenant-id header: {x_tenant_id}')
+            logger.info('Filtering users by x-tenant-id header: %s', x_tenant_id)
             return CustomUser.objects.filter(tenant=x_tenant_id)
 
         # Default behavior when no header is present
@@ -140,8 +185,8 @@ class UserViewSet(viewsets.ModelViewSet):
             serializer.save()
 
     def create(self, request, *args, **kwargs):
-        logger.info(f'Create user request from: {request.user.email if request.user.is_authenticated else "Anonymous"}')
-        logger.debug(f'Request data: {request.data}')
+        logger.info('Create user request from: %s', request.user.email if request.user.is_authenticated else 'Anonymous')
+        logger.debug('Request data: %s', request.data)
 
         # Extract tenant_id from x-tenant-id header if present
         x_tenant_id = request.headers.get('x-tenant-id') or request.headers.get('X-Tenant-Id')
@@ -152,7 +197,7 @@ class UserViewSet(viewsets.ModelViewSet):
         # If x-tenant-id header is present and tenant is not in request body, use the header value
         if x_tenant_id and 'tenant' not in request_data:
             request_data['tenant'] = x_tenant_id
-            logger.info(f'Tenant ID extracted from x-tenant-id header: {x_tenant_id}')
+            logger.info('Tenant ID extracted from x-tenant-id header: %s', x_tenant_id)
 
         # Security check: non-super-admins can only create users in their own tenant
         if not request.user.is_super_admin:
@@ -160,14 +205,14 @@ class UserViewSet(viewsets.ModelViewSet):
             if tenant_id:
                 # Validate tenant exists and user has access
                 if not request.user.tenant:
-                    logger.error(f'User {request.user.email} has no tenant assigned')
+                    logger.error('User %s has no tenant assigned', request.user.email)
                     return Response(
                         {'error': 'Your account is not associated with a tenant'},
                         status=status.HTTP_400_BAD_REQUEST
                     )
 
                 if str(request.user.tenant.id) != str(tenant_id):
-                    logger.warning(f'User {request.user.email} attempted to create user in different tenant')
+                    logger.warning('User %s attempted to create user in different tenant', request.user.email)
                     return Response(
                         {'error': 'You can only create users in your own tenant'},
                         status=status.HTTP_403_FORBIDDEN
@@ -186,7 +231,7 @@ class UserViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
                 )
 
-            logger.info(f'User created successfully: {user.email} (ID: {user.id}) in tenant: {user.tenant.slug if user.tenant else "No tenant"}')
+            logger.info('User created successfully: %s (ID: %s) in tenant: %s', user.email, user.id, user.tenant.slug if user.tenant else 'No tenant')
             response_data = UserSerializer(user).data
             # Use UserSerializer for the response (includes id and all fields)
            
@@ -194,16 +239,19 @@ class UserViewSet(viewsets.ModelViewSet):
 
             # Ensure id is in the response
             if 'id' not in response_data:
-                logger.error(f'Serializer did not include id field. Data: {response_data}')
+                logger.error('Serializer did not include id field. Data: %s', response_data)
                 response_data['id'] = str(user.id)
 
-            logger.debug(f'Response data: {response_data}')
+            logger.debug('Response data: %s', response_data)
 
             headers = self.get_success_headers(response_data)
             return Response(response_data, status=status.HTTP_201_CREATED, headers=headers)
 
+        except QuotaExceeded as e:
+            logger.warning('User limit reached for tenant %s', request_data.get('tenant') or request.user.tenant_id)
+            return Response({'error': str(e.detail)}, status=e.status_code)
         except Exception as e:
-            logger.error(f'Error creating user: {str(e)}', exc_info=True)
+            logger.error('Error creating user: %s', e, exc_info=True)
             return Response(
                 {'error': f'Failed to create user: {str(e)}'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -211,6 +259,7 @@ class UserViewSet(viewsets.ModelViewSet):
     
     
     @action(detail=False, methods=['get'])
+    @cache_response('user-me')
     def me(self, request):
         serializer = self.get_serializer(request.user)
         return Response(serializer.data)
@@ -264,3 +313,43 @@ class RoleViewSet(viewsets.ModelViewSet):
         role = self.get_object()
         users = role.users.all()
         return Response(UserSerializer(users, many=True).data)
+
+
+def roles_with_member_count():
+    members = (
+        CustomUser.roles.through.objects.filter(role_id=OuterRef('pk'))
+        .order_by().values('role_id').annotate(count=Count('*')).values('count')
+    )
+    return Role.objects.select_related('created_by').annotate(
+        member_count=Coalesce(Subquery(members, output_field=IntegerField()), 0)
+    )
+
+
+# Async versions of hot read endpoints, routed by config/asgi_urls.py
+
+@async_api_view(UserViewSet.as_view({'get': 'me'}))
+@acache_response('user-me')
+async def async_me_view(request):
+    await sync_to_async(prefetch_related_objects)([request.user], Prefetch('roles', queryset=roles_with_member_count()))
+    return json_response(UserSerializer(request.user, context={'request': request}).data)
+
+
+@async_api_view(TokenVerifyView.as_view(), permission_classes=(), authentication=False, methods=('POST',))
+async def async_token_verify_view(request):
+    if request.content_type != 'application/json':
+        return None
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        # The regular view reports the parse error
+        return None
+    serializer = TokenFieldsSerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+    try:
+        token = UntypedToken(serializer.validated_data['token'])
+    except TokenError as e:
+        raise InvalidToken(e.args[0])
+    if jwt_settings.BLACKLIST_AFTER_ROTATION:
+        if await BlacklistedToken.objects.filter(token__jti=token.get(jwt_settings.JTI_CLAIM)).aexists():
+            raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: ['Token is blacklisted']})
+    return json_response({})
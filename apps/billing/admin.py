@@ -1,5 +1,5 @@
 from django.contrib import admin
-from apps.billing.models import SubscriptionPlan, Subscription, Invoice
+from apps.billing.models import SubscriptionPlan, Subscription, SubscriptionEvent, Invoice, PaymentWebhookEvent
 
 
 @admin.register(SubscriptionPlan)
@@ -12,7 +12,7 @@ class SubscriptionPlanAdmin(admin.ModelAdmin):
     fieldsets = (
         (None, {'fields': ('name', 'slug', 'description', 'is_active', 'sort_order')}),
         ('Pricing', {'fields': ('price_monthly', 'price_yearly', 'currency')}),
-        ('Limits', {'fields': ('max_users', 'max_leads', 'storage_gb')}),
+        ('Limits', {'fields': ('max_users', 'max_leads', 'storage_gb', 'api_rate_limit')}),
         ('Features', {'fields': ('included_modules', 'features')}),
         ('Trial', {'fields': ('is_trial', 'trial_days')}),
     )
@@ -33,6 +33,14 @@ class SubscriptionAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(SubscriptionEvent)
+class SubscriptionEventAdmin(admin.ModelAdmin):
+    list_display = ['subscription', 'tenant', 'from_status', 'to_status', 'reason', 'created_at']
+    list_filter = ['to_status', 'reason', 'created_at']
+    search_fields = ['tenant__name']
+    readonly_fields = ['subscription', 'tenant', 'from_status', 'to_status', 'reason', 'created_at']
+
+
 @admin.register(Invoice)
 class InvoiceAdmin(admin.ModelAdmin):
     list_display = ['invoice_number', 'tenant', 'amount', 'status', 'due_date', 'paid_at']
@@ -51,6 +59,21 @@ class InvoiceAdmin(admin.ModelAdmin):
     
     def mark_as_paid(self, request, queryset):
         from datetime import datetime
-        count = queryset.update(status='PAID', paid_at=datetime.now())
+        from apps.billing.documents import queue_rendering
+        from apps.billing.revenue import record_payments
+        invoice_ids = list(queryset.exclude(status='PAID').values_list('id', flat=True))
+        count = queryset.filter(id__in=invoice_ids).update(status='PAID', paid_at=datetime.now())
+        record_payments(invoice_ids)
+        # update() skips the signal that re-renders the document
+        queue_rendering(invoice_ids)
         self.message_user(request, f'{count} invoices marked as paid.')
     mark_as_paid.short_description = 'Mark selected invoices as paid'
+
+
+@admin.register(PaymentWebhookEvent)
+class PaymentWebhookEventAdmin(admin.ModelAdmin):
+    list_display = ['event_id', 'provider', 'event_type', 'received_at', 'processed_at', 'attempts']
+    list_filter = ['provider', 'event_type', 'processed_at']
+    search_fields = ['event_id']
+    readonly_fields = ['provider', 'event_id', 'event_type', 'payload', 'received_at',
+                       'processed_at', 'attempts', 'last_error']
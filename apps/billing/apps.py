@@ -5,3 +5,6 @@ class BillingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.billing'
     label = 'billing'
+
+    def ready(self):
+        from apps.billing import signals  # noqa: F401
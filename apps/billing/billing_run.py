@@ -0,0 +1,190 @@
+"""
+Period-end billing run.
+
+Subscriptions whose ``current_period_end`` has passed are invoiced for the
+next period and moved forward by one period:
+
+* due rows are found through the ``(status, current_period_end)`` index and
+  walked in keyset order (``id > last_id``) in chunks;
+* each chunk is one transaction. It locks its rows with ``SKIP LOCKED``,
+  reserves all invoice numbers in one round trip, ``bulk_create``s the
+  invoices and advances the periods with one ``UPDATE`` per billing cycle;
+* documents of the new invoices are rendered in the background once the
+  chunk commits;
+* the ``(subscription, period_start)`` unique constraint makes a repeated or
+  overlapping run a no-op for periods that were already invoiced; only the
+  invoices actually inserted are booked, rendered and counted.
+
+``PAST_DUE`` subscriptions are not billed: their period stays put until a
+payment makes them ``ACTIVE`` again, so the lifecycle grace period runs out.
+
+With ``workers > 1`` the UUID key space is split into equal ranges and each
+range is billed by its own process.
+"""
+
+import multiprocessing
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from apps.billing.entitlements import invalidate_entitlements
+from apps.billing.models import Subscription, Invoice
+from apps.billing.documents import queue_rendering
+from apps.billing.lifecycle import subscriptions_changed
+from apps.billing.numbering import allocate_invoice_numbers
+from apps.billing.revenue import record_invoices
+from apps.common.constants import BILLING_PERIOD_DAYS
+from apps.common.response_cache import bump_all
+from apps.common.logger import get_logger
+
+logger = get_logger(__name__)
+
+BILLABLE_STATUSES = ('ACTIVE',)
+
+CHUNK_FIELDS = (
+    'id',
+    'tenant_id',
+    'plan_id',
+    'status',
+    'billing_cycle',
+    'current_period_end',
+    'plan__price_monthly',
+    'plan__price_yearly',
+    'plan__currency',
+)
+
+
+def due_subscriptions(now):
+    return Subscription.objects.filter(
+        status__in=BILLABLE_STATUSES,
+        current_period_end__lte=now,
+        cancel_at_period_end=False,
+    )
+
+
+def bill_chunk(rows, now):
+    """
+    Invoice and advance one chunk of subscription rows (``CHUNK_FIELDS``
+    values). Call inside the transaction that locked them. Returns the
+    number of invoices created.
+    """
+    numbers = allocate_invoice_numbers(len(rows))
+    due_delta = timedelta(days=settings.INVOICE_DUE_DAYS)
+    invoices = []
+    by_cycle = {}
+    for row, number in zip(rows, numbers):
+        cycle = row['billing_cycle']
+        period_start = row['current_period_end']
+        invoices.append(Invoice(
+            tenant_id=row['tenant_id'],
+            subscription_id=row['id'],
+            invoice_number=number,
+            amount=row['plan__price_yearly'] if cycle == 'YEARLY' else row['plan__price_monthly'],
+            currency=row['plan__currency'],
+            period_start=period_start,
+            period_end=period_start + timedelta(days=BILLING_PERIOD_DAYS[cycle]),
+            due_date=period_start + due_delta,
+            created_at=now,
+            updated_at=now,
+        ))
+        by_cycle.setdefault(cycle, []).append(row['id'])
+
+    Invoice.objects.bulk_create(invoices, ignore_conflicts=True)
+    # ignore_conflicts skips periods that were already invoiced without saying
+    # which; the ids are generated here, so the ones found were inserted now
+    inserted = set(
+        Invoice.objects.filter(id__in=[invoice.id for invoice in invoices]).values_list('id', flat=True)
+    )
+    created = [(row, invoice) for row, invoice in zip(rows, invoices) if invoice.id in inserted]
+    record_invoices([
+        (row['plan_id'], invoice.currency, row['status'], invoice.amount)
+        for row, invoice in created
+    ])
+    queue_rendering(invoice.id for _, invoice in created)
+    for cycle, ids in by_cycle.items():
+        Subscription.objects.filter(id__in=ids, current_period_end__lte=now).update(
+            current_period_start=F('current_period_end'),
+            current_period_end=F('current_period_end') + timedelta(days=BILLING_PERIOD_DAYS[cycle]),
+            updated_at=now,
+        )
+    return len(created)
+
+
+def bill_range(now, low=None, high=None, chunk_size=None):
+    """Bill due subscriptions with ``low <= id < high``. Returns ``(subscriptions, invoices)``."""
+    chunk_size = chunk_size or settings.BILLING_RUN_CHUNK_SIZE
+    queryset = due_subscriptions(now).order_by('id')
+    if low is not None:
+        queryset = queryset.filter(id__gte=low)
+    if high is not None:
+        queryset = queryset.filter(id__lt=high)
+
+    billed = invoiced = 0
+    last_id = None
+    while True:
+        with transaction.atomic():
+            chunk = queryset if last_id is None else queryset.filter(id__gt=last_id)
+            rows = list(
+                chunk.select_for_update(skip_locked=True, of=('self',))
+                .values(*CHUNK_FIELDS)[:chunk_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+            invoiced += bill_chunk(rows, now)
+            tenant_ids = [row['tenant_id'] for row in rows]
+            transaction.on_commit(lambda ids=tenant_ids: subscriptions_changed(ids))
+        billed += len(rows)
+    return billed, invoiced
+
+
+def partition_ids(parts):
+    """Split the UUID key space into ``parts`` half-open ``(low, high)`` ranges."""
+    step = (1 << 128) // parts
+    bounds = [uuid.UUID(int=step * i) for i in range(parts)] + [None]
+    return [(bounds[i], bounds[i + 1]) for i in range(parts)]
+
+
+def _bill_partition(now, low, high, chunk_size):
+    try:
+        return bill_range(now, low, high, chunk_size)
+    finally:
+        connections.close_all()
+
+
+def run_billing(now=None, workers=None, chunk_size=None):
+    """
+    Bill everything due at ``now``. Returns ``{'subscriptions', 'invoices'}``.
+
+    Worker processes drop entitlement snapshots and cached responses in
+    their own memory and, with ``INVALIDATION_BUS``, in the web processes;
+    without it those pick up advanced periods within the cache TTLs.
+    """
+    now = now or timezone.now()
+    workers = workers or settings.BILLING_RUN_WORKERS
+    if workers <= 1:
+        billed, invoiced = bill_range(now, chunk_size=chunk_size)
+    else:
+        billed = invoiced = 0
+        # spawn: forked children would share this process's DB connections.
+        # The initializer must not live in a module that imports models.
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+            futures = [
+                pool.submit(_bill_partition, now, low, high, chunk_size)
+                for low, high in partition_ids(workers)
+            ]
+            for future in futures:
+                part_billed, part_invoiced = future.result()
+                billed += part_billed
+                invoiced += part_invoiced
+        invalidate_entitlements()
+        bump_all()
+
+    logger.info('Billing run: %s subscription(s), %s invoice(s)', billed, invoiced)
+    return {'subscriptions': billed, 'invoices': invoiced}
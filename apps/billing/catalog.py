@@ -0,0 +1,85 @@
+"""
+Precomputed public plan catalog.
+
+The plan list is public and hit by every signup and pricing page, yet it
+changes only when an admin edits a plan. It is serialized once into JSON
+bytes (in the same paginated shape as the regular list response) and kept
+per process. Anonymous traffic is then answered without touching the
+database or the serializer.
+
+The ``SubscriptionPlan`` signals in ``apps/billing/signals.py`` drop the
+catalog right away and again on commit, in other processes through the
+invalidation bus (``apps/common/invalidation.py``); ``PLAN_CATALOG_TTL``
+bounds staleness without it.
+"""
+
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from apps.common import invalidation
+from apps.billing.models import SubscriptionPlan
+from apps.billing.serializers import SubscriptionPlanSerializer
+
+_catalog = None
+_version = 0
+
+
+def _etag(body):
+    return '"%s"' % hashlib.sha1(body).hexdigest()
+
+
+def build_catalog():
+    """Serialize all active plans: the list body plus one body per plan."""
+    plans = SubscriptionPlanSerializer(SubscriptionPlan.objects.filter(is_active=True), many=True).data
+    renderer = JSONRenderer()
+    catalog = {'list': None, 'plans': {}, 'expires_at': time.monotonic() + settings.PLAN_CATALOG_TTL}
+    # Larger catalogs than one page are left to the paginated view
+    if len(plans) <= (api_settings.PAGE_SIZE or len(plans)):
+        body = renderer.render({'count': len(plans), 'next': None, 'previous': None, 'results': plans})
+        catalog['list'] = {'etag': _etag(body), 'body': body}
+    for plan in plans:
+        body = renderer.render(plan)
+        catalog['plans'][str(plan['id'])] = {'etag': _etag(body), 'body': body}
+    return catalog
+
+
+def get_catalog():
+    """Return the process-local catalog, building it on a miss."""
+    global _catalog
+    catalog = _catalog
+    if catalog is not None and catalog['expires_at'] > time.monotonic():
+        return catalog
+    version = _version
+    catalog = build_catalog()
+    # Do not keep a catalog built while an invalidation happened
+    if version == _version:
+        _catalog = catalog
+    return catalog
+
+
+async def aget_catalog():
+    """``get_catalog`` for async code: a hit does not leave the event loop."""
+    catalog = _catalog
+    if catalog is not None and catalog['expires_at'] > time.monotonic():
+        return catalog
+    return await sync_to_async(get_catalog)()
+
+
+def invalidate_catalog():
+    """Drop the catalog in every process."""
+    _drop_catalog()
+    # A catalog built after the drop may still have read the old plans
+    transaction.on_commit(_drop_catalog)
+    invalidation.publish('catalog')
+
+
+@invalidation.register_handler('catalog')
+def _drop_catalog(keys=None):
+    global _catalog, _version
+    _version += 1
+    _catalog = None
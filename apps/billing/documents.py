@@ -0,0 +1,172 @@
+"""
+Invoice document rendering.
+
+Invoices are rendered to PDF with Pillow off the request path: creating or
+changing an invoice queues ``render_invoice`` on the background pool once
+the transaction commits. The billing run queues a whole chunk at once.
+
+Each document is stored as ``invoices/<invoice id>/<content hash>.pdf``.
+The hash covers everything printed on the document, so rendering is
+skipped while it still matches ``Invoice.document_hash``. A superseded file
+is handed to the deferred file deletion queue
+(``apps/tenants/cleanup.py``). ``invoice_url`` is set to the absolute
+download link (on ``PUBLIC_BASE_URL``) unless it holds an external link
+entered in the admin. ``render_invoices`` re-renders in bulk, e.g. after a
+layout change (bump ``LAYOUT_VERSION``).
+"""
+
+import hashlib
+import io
+import json
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.urls import reverse
+from PIL import Image, ImageDraw, ImageFont
+from apps.billing.models import Invoice
+from apps.common.logger import get_logger
+from apps.common.tasks import run_on_commit
+from apps.tenants.cleanup import schedule_sweep
+from apps.tenants.models import PendingFileDeletion
+
+logger = get_logger(__name__)
+
+LAYOUT_VERSION = 1
+# A4 at 150 dpi
+PAGE_SIZE = (1240, 1754)
+RESOLUTION = 150.0
+MARGIN = 100
+
+
+def invoice_content(invoice):
+    """Everything printed on the document, as JSON-serialisable values."""
+    subscription = invoice.subscription
+
+    def date(value):
+        return value.date().isoformat() if value else ''
+
+    return {
+        'layout': LAYOUT_VERSION,
+        'number': invoice.invoice_number,
+        'tenant': invoice.tenant.name,
+        'plan': subscription.plan.name,
+        'billing_cycle': subscription.get_billing_cycle_display(),
+        'amount': str(invoice.amount),
+        'currency': invoice.currency,
+        'status': invoice.get_status_display(),
+        'issued': date(invoice.created_at),
+        'due': date(invoice.due_date),
+        'paid': date(invoice.paid_at),
+        'period_start': date(invoice.period_start),
+        'period_end': date(invoice.period_end),
+    }
+
+
+def content_hash(content):
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+def _font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except (TypeError, ImportError, OSError):
+        # Pillow without FreeType only ships the fixed-size bitmap font
+        return ImageFont.load_default()
+
+
+def render_pdf(content):
+    """Render the invoice content to PDF bytes."""
+    page = Image.new('RGB', PAGE_SIZE, 'white')
+    draw = ImageDraw.Draw(page)
+    title, heading, body = _font(56), _font(32), _font(28)
+
+    draw.text((MARGIN, MARGIN), 'INVOICE', fill='black', font=title)
+    draw.text((MARGIN, MARGIN + 90), content['number'], fill='black', font=heading)
+
+    lines = [
+        ('Billed to', content['tenant']),
+        ('Plan', f"{content['plan']} ({content['billing_cycle']})"),
+        ('Period', f"{content['period_start']} - {content['period_end']}" if content['period_start'] else '-'),
+        ('Issued', content['issued']),
+        ('Due', content['due']),
+        ('Status', content['status'] + (f" ({content['paid']})" if content['paid'] else '')),
+    ]
+    y = MARGIN + 220
+    for label, value in lines:
+        draw.text((MARGIN, y), label, fill='#555555', font=body)
+        draw.text((MARGIN + 300, y), value, fill='black', font=body)
+        y += 50
+
+    y += 40
+    draw.line((MARGIN, y, PAGE_SIZE[0] - MARGIN, y), fill='black', width=3)
+    draw.text((MARGIN, y + 30), 'Total', fill='black', font=heading)
+    draw.text((MARGIN + 300, y + 30), f"{content['currency']} {content['amount']}", fill='black', font=heading)
+
+    buffer = io.BytesIO()
+    page.save(buffer, format='PDF', resolution=RESOLUTION)
+    return buffer.getvalue()
+
+
+def document_path(invoice_id):
+    return reverse('invoice-document', args=[invoice_id])
+
+
+def document_url(invoice_id, digest):
+    """Absolute download link of a rendered invoice."""
+    return f"{settings.PUBLIC_BASE_URL.rstrip('/')}{document_path(invoice_id)}?v={digest[:16]}"
+
+
+def is_document_url(invoice_id, url):
+    """Whether ``url`` is empty or a download link written by ``render_invoice``."""
+    return not url or document_path(invoice_id) in url
+
+
+def render_invoice(invoice_id, force=False):
+    """
+    Render one invoice unless its stored document is up to date.
+
+    Returns True if a document was written.
+    """
+    invoice = (
+        Invoice.objects.select_related('tenant', 'subscription__plan')
+        .filter(id=invoice_id).first()
+    )
+    if invoice is None:
+        return False
+    storage = Invoice._meta.get_field('document').storage
+    content = invoice_content(invoice)
+    digest = content_hash(content)
+    old_name = invoice.document.name if invoice.document else ''
+    if not force and digest == invoice.document_hash and old_name and storage.exists(old_name):
+        return False
+
+    name = f'invoices/{invoice.id}/{digest[:16]}.pdf'
+    if not storage.exists(name):
+        name = storage.save(name, ContentFile(render_pdf(content)))
+
+    fields = {'document': name, 'document_hash': digest}
+    if is_document_url(invoice.id, invoice.invoice_url):
+        fields['invoice_url'] = document_url(invoice.id, digest)
+    with transaction.atomic():
+        Invoice.objects.filter(id=invoice.id).update(**fields)
+        if old_name and old_name != name:
+            PendingFileDeletion.objects.create(name=old_name)
+            transaction.on_commit(schedule_sweep)
+    return True
+
+
+def render_invoices(invoice_ids, force=False):
+    """Render several invoices; returns the number of documents written."""
+    rendered = 0
+    for invoice_id in invoice_ids:
+        try:
+            rendered += render_invoice(invoice_id, force=force)
+        except Exception:
+            logger.exception('Rendering invoice %s failed', invoice_id)
+    return rendered
+
+
+def queue_rendering(invoice_ids):
+    """Render the invoices in the background after the current transaction commits."""
+    run_on_commit(render_invoices, list(invoice_ids))
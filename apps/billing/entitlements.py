@@ -0,0 +1,186 @@
+"""
+Per-tenant entitlement snapshots.
+
+What a tenant may use is decided by ``Tenant.is_active``/``enabled_modules``,
+the plan's ``included_modules`` and the subscription status and period. That
+is compiled once per tenant (one joined query) into an immutable
+``Entitlements`` object kept in a process-local dict, so gating a request is a
+dict lookup.
+
+Snapshots are dropped by the signals in ``apps/billing/signals.py`` when a
+tenant, subscription or plan changes, and again when the change commits.
+Code that changes rows with ``QuerySet.update()`` must call
+``invalidate_entitlements`` itself. Other processes drop theirs through the
+invalidation bus (``apps/common/invalidation.py``); a TTL bounds staleness
+without it.
+"""
+
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from apps.billing.models import Invoice
+from apps.common import invalidation
+from apps.tenants.models import Tenant
+
+ACTIVE_STATUSES = ('TRIAL', 'ACTIVE', 'PAST_DUE')
+UNPAID_INVOICE_STATUSES = ('PENDING', 'FAILED')
+
+_snapshots = {}
+_version = 0
+
+
+@dataclass(frozen=True)
+class Entitlements:
+    tenant_id: object
+    tenant_active: bool
+    modules: frozenset
+    status: str = None
+    period_end: datetime = None
+    plan_id: object = None
+    rate_limit: int = None
+    max_users: int = None
+    max_leads: int = None
+    storage_gb: int = None
+    # Due date of the oldest unpaid invoice
+    unpaid_since: datetime = None
+    expires_at: float = 0.0
+
+    def is_active(self, now=None):
+        """True if the tenant currently has a usable subscription."""
+        if not self.tenant_active or self.status not in ACTIVE_STATUSES:
+            return False
+        if self.period_end is None:
+            return True
+        now = now or timezone.now()
+        if self.status == 'TRIAL':
+            return now < self.period_end
+        # Paid subscriptions keep working for a grace period while the
+        # billing run catches up or a payment is retried; past-due ones
+        # count it from their oldest unpaid invoice at the latest
+        grace_start = self.period_end
+        if self.status == 'PAST_DUE' and self.unpaid_since is not None:
+            grace_start = min(grace_start, self.unpaid_since)
+        return now < grace_start + timedelta(days=settings.ENTITLEMENT_PAST_DUE_GRACE_DAYS)
+
+    def allows(self, module, now=None):
+        return module in self.modules and self.is_active(now)
+
+    def as_dict(self):
+        return {
+            'tenant_id': str(self.tenant_id),
+            'is_active': self.is_active(),
+            'status': self.status,
+            'period_end': self.period_end,
+            'plan_id': str(self.plan_id) if self.plan_id else None,
+            'modules': sorted(self.modules),
+            'rate_limit': self.rate_limit,
+        }
+
+
+def compile_entitlements(tenant_id):
+    """Build the snapshot for a tenant with a single query."""
+    oldest_unpaid = (
+        Invoice.objects.filter(tenant=OuterRef('pk'), status__in=UNPAID_INVOICE_STATUSES)
+        .order_by('due_date').values('due_date')[:1]
+    )
+    row = (
+        Tenant.objects.filter(id=tenant_id)
+        .annotate(unpaid_since=Subquery(oldest_unpaid))
+        .values(
+            'is_active',
+            'enabled_modules',
+            'subscription__status',
+            'subscription__current_period_end',
+            'subscription__plan_id',
+            'subscription__plan__included_modules',
+            'subscription__plan__api_rate_limit',
+            'subscription__plan__max_users',
+            'subscription__plan__max_leads',
+            'subscription__plan__storage_gb',
+            'unpaid_since',
+        )
+        .first()
+    )
+    expires_at = time.monotonic() + settings.ENTITLEMENT_CACHE_TTL
+    if row is None:
+        return Entitlements(
+            tenant_id=tenant_id,
+            tenant_active=False,
+            modules=frozenset(),
+            rate_limit=settings.DEFAULT_TENANT_RATE_LIMIT,
+            expires_at=expires_at,
+        )
+
+    modules = frozenset(row['enabled_modules'] or [])
+    if row['subscription__plan_id']:
+        modules &= frozenset(row['subscription__plan__included_modules'] or [])
+    return Entitlements(
+        tenant_id=tenant_id,
+        tenant_active=row['is_active'],
+        modules=modules,
+        status=row['subscription__status'],
+        period_end=row['subscription__current_period_end'],
+        plan_id=row['subscription__plan_id'],
+        rate_limit=(
+            row['subscription__plan__api_rate_limit'] if row['subscription__plan_id']
+            else settings.DEFAULT_TENANT_RATE_LIMIT
+        ),
+        max_users=row['subscription__plan__max_users'],
+        max_leads=row['subscription__plan__max_leads'],
+        storage_gb=row['subscription__plan__storage_gb'],
+        unpaid_since=row['unpaid_since'],
+        expires_at=expires_at,
+    )
+
+
+def get_entitlements(tenant_id):
+    """Return the cached snapshot for a tenant, compiling it on a miss."""
+    snapshot = _snapshots.get(tenant_id)
+    if snapshot is not None and snapshot.expires_at > time.monotonic():
+        return snapshot
+    version = _version
+    snapshot = compile_entitlements(tenant_id)
+    # Do not store a snapshot compiled while an invalidation happened
+    if version == _version:
+        _snapshots[tenant_id] = snapshot
+    return snapshot
+
+
+async def aget_entitlements(tenant_id):
+    """``get_entitlements`` for async code: a hit does not leave the event loop."""
+    snapshot = _snapshots.get(tenant_id)
+    if snapshot is not None and snapshot.expires_at > time.monotonic():
+        return snapshot
+    return await sync_to_async(get_entitlements)(tenant_id)
+
+
+def invalidate_entitlements(tenant_ids=None):
+    """Drop snapshots for the given tenant ids, or all of them if None, in every process."""
+    if tenant_ids is not None:
+        tenant_ids = list(tenant_ids)
+    _drop_snapshots(tenant_ids)
+    # A snapshot compiled after the drop may still have read the old rows
+    transaction.on_commit(lambda: _drop_snapshots(tenant_ids))
+    invalidation.publish('entitlements', tenant_ids)
+
+
+def _drop_snapshots(tenant_ids):
+    global _version
+    _version += 1
+    if tenant_ids is None:
+        _snapshots.clear()
+        return
+    for tenant_id in tenant_ids:
+        _snapshots.pop(tenant_id, None)
+
+
+@invalidation.register_handler('entitlements')
+def _drop_published(keys):
+    _drop_snapshots(None if keys is None else [uuid.UUID(key) for key in keys])
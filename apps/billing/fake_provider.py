@@ -0,0 +1,58 @@
+"""
+Local stand-in for a payment provider.
+
+Builds and signs webhook deliveries exactly like the real integration
+expects them, including retried duplicates and out-of-order bursts, so
+tests and load scripts can exercise ``/api/payments/webhook/`` without
+network access.
+"""
+
+import itertools
+import json
+import random
+import time
+
+WEBHOOK_PATH = '/api/payments/webhook/'
+
+
+class FakePaymentProvider:
+    def __init__(self, secret, path=WEBHOOK_PATH):
+        self.secret = secret
+        self.path = path
+        self._ids = itertools.count(1)
+
+    def event(self, event_type, invoice, amount=None, event_id=None, created=None):
+        """Event payload for an ``Invoice`` (or anything with number, amount and currency)."""
+        return {
+            'id': event_id or f'evt_{next(self._ids):08d}',
+            'type': event_type,
+            'created': int(created or time.time()),
+            'data': {
+                'invoice_number': invoice.invoice_number,
+                'amount': str(amount if amount is not None else invoice.amount),
+                'currency': invoice.currency,
+            },
+        }
+
+    def delivery(self, event, timestamp=None):
+        """Raw body and signature header for one delivery attempt."""
+        from apps.billing.webhooks import sign_payload
+        body = json.dumps(event, separators=(',', ':')).encode()
+        return body, sign_payload(body, int(timestamp or time.time()), self.secret)
+
+    def deliver(self, client, event, attempts=1):
+        """POST the event ``attempts`` times, like a provider retrying; returns the responses."""
+        responses = []
+        for _ in range(attempts):
+            body, signature = self.delivery(event)
+            responses.append(client.post(
+                self.path, data=body, content_type='application/json', HTTP_X_SIGNATURE=signature
+            ))
+        return responses
+
+    def burst(self, client, events, retries=0, seed=None):
+        """Deliver events with ``retries`` duplicates each, duplicates shuffled in after the originals."""
+        rng = random.Random(seed)
+        duplicates = [event for event in events for _ in range(retries)]
+        rng.shuffle(duplicates)
+        return [self.deliver(client, event)[0] for event in list(events) + duplicates]
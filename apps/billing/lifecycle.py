@@ -0,0 +1,111 @@
+"""
+Subscription lifecycle scheduler.
+
+Each tick applies the status edges below as set-based updates:
+
+* ``TRIAL`` -> ``EXPIRED`` when the trial period or ``Tenant.trial_ends_at``
+  has passed;
+* ``ACTIVE``/``PAST_DUE`` -> ``CANCELLED`` at period end for subscriptions
+  with ``cancel_at_period_end``;
+* ``PAST_DUE`` -> ``EXPIRED`` once the grace period
+  (``ENTITLEMENT_PAST_DUE_GRACE_DAYS``) after the due date of the oldest
+  unpaid invoice, or after period end, is over. Both are fixed points: the
+  billing run does not advance past-due subscriptions.
+
+Due rows are found through the ``(status, current_period_end)`` and
+``trial_ends_at`` indexes and leave the result set as soon as their status
+changes, so a tick does work proportional to the number of transitions, not
+to the number of subscriptions. Every transition is recorded in
+``SubscriptionEvent`` and booked in the revenue rollups.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from apps.billing.entitlements import UNPAID_INVOICE_STATUSES, invalidate_entitlements
+from apps.billing.models import Invoice, Subscription, SubscriptionEvent
+from apps.billing.revenue import record_transitions
+from apps.common.logger import get_logger
+from apps.common.response_cache import bump_tenant
+
+logger = get_logger(__name__)
+
+
+def subscriptions_changed(tenant_ids):
+    """Drop entitlements and cached responses of ``tenant_ids`` after an ``update()`` skipped the signals."""
+    invalidate_entitlements(tenant_ids)
+    bump_tenant(*tenant_ids)
+
+
+def lifecycle_rules(now):
+    """``(reason, from statuses, to status, filter Q, extra update kwargs)`` in the order applied."""
+    grace_start = now - timedelta(days=settings.ENTITLEMENT_PAST_DUE_GRACE_DAYS)
+    overdue_invoices = Invoice.objects.filter(
+        subscription=OuterRef('pk'), status__in=UNPAID_INVOICE_STATUSES, due_date__lte=grace_start
+    )
+    return [
+        ('trial_ended', ('TRIAL',), 'EXPIRED', Q(current_period_end__lte=now), {}),
+        ('tenant_trial_ended', ('TRIAL',), 'EXPIRED', Q(tenant__trial_ends_at__lte=now), {}),
+        (
+            'cancelled_at_period_end', ('ACTIVE', 'PAST_DUE'), 'CANCELLED',
+            Q(cancel_at_period_end=True, current_period_end__lte=now),
+            {'cancelled_at': Coalesce('cancelled_at', Value(now))},
+        ),
+        (
+            'grace_period_ended', ('PAST_DUE',), 'EXPIRED',
+            Q(current_period_end__lte=grace_start) | Q(Exists(overdue_invoices)), {},
+        ),
+    ]
+
+
+def apply_transition(reason, from_statuses, to_status, filters, extra, now, batch_size, skip_locked=True):
+    """
+    Move every matching subscription along one edge in batches. Returns the count.
+
+    Rows locked by another transaction are skipped (and picked up by the next
+    tick) unless ``skip_locked`` is False, which waits for them instead.
+    """
+    due = Subscription.objects.filter(filters, status__in=from_statuses).order_by()
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                due.select_for_update(skip_locked=skip_locked, of=('self',))
+                .values_list('id', 'tenant_id', 'status', 'plan_id', 'billing_cycle')[:batch_size]
+            )
+            if not rows:
+                break
+            Subscription.objects.filter(id__in=[row[0] for row in rows]).update(
+                status=to_status, updated_at=now, **extra
+            )
+            SubscriptionEvent.objects.bulk_create([
+                SubscriptionEvent(
+                    subscription_id=subscription_id,
+                    tenant_id=tenant_id,
+                    from_status=from_status,
+                    to_status=to_status,
+                    reason=reason,
+                )
+                for subscription_id, tenant_id, from_status, _, _ in rows
+            ])
+            record_transitions([(plan_id, status, cycle) for _, _, status, plan_id, cycle in rows], to_status)
+            tenant_ids = [row[1] for row in rows]
+            transaction.on_commit(lambda ids=tenant_ids: subscriptions_changed(ids))
+        moved += len(rows)
+    return moved
+
+
+def run_lifecycle(now=None, batch_size=None):
+    """Apply all due transitions. Returns ``{reason: count}``."""
+    now = now or timezone.now()
+    batch_size = batch_size or settings.LIFECYCLE_BATCH_SIZE
+    counts = {}
+    for reason, from_statuses, to_status, filters, extra in lifecycle_rules(now):
+        counts[reason] = apply_transition(reason, from_statuses, to_status, filters, extra, now, batch_size)
+    if any(counts.values()):
+        logger.info('Subscription lifecycle: %s', counts)
+    return counts
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from apps.billing.webhooks import process_webhook_events
+
+
+class Command(BaseCommand):
+    help = 'Apply stored payment webhook events to invoices and subscriptions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--max-attempts', type=int, default=None)
+
+    def handle(self, *args, **options):
+        count = process_webhook_events(batch_size=options['batch_size'], max_attempts=options['max_attempts'])
+        self.stdout.write(self.style.SUCCESS(f'Applied {count} webhook event(s)'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from apps.billing.revenue import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily revenue rollups from subscriptions, their history and invoices'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--days-per-pass', type=int, default=31, help='Invoice date window per grouped query')
+
+    def handle(self, *args, **options):
+        count = rebuild_rollups(chunk_size=options['chunk_size'], days_per_pass=options['days_per_pass'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {count} rollup row(s)'))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+from apps.accounts.models import CustomUser
+from apps.billing.models import TenantUsage
+from apps.common.response_cache import bump_tenant
+from apps.tenants.models import Tenant
+
+
+class Command(BaseCommand):
+    help = 'Recompute tenant user counters from the users table with one grouped query'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        counts = dict(
+            CustomUser.objects.filter(tenant__isnull=False)
+            .values_list('tenant_id')
+            .annotate(n=Count('id'))
+            .order_by()
+        )
+
+        now = timezone.now()
+        batch, total = [], 0
+        for tenant_id in Tenant.objects.values_list('id', flat=True).iterator(chunk_size=options['batch_size']):
+            batch.append(TenantUsage(tenant_id=tenant_id, user_count=counts.get(tenant_id, 0), updated_at=now))
+            if len(batch) >= options['batch_size']:
+                total += self._upsert(batch)
+                batch = []
+        if batch:
+            total += self._upsert(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Recomputed usage for {total} tenant(s)'))
+
+    def _upsert(self, batch):
+        TenantUsage.objects.bulk_create(
+            batch,
+            update_conflicts=True,
+            unique_fields=['tenant'],
+            update_fields=['user_count', 'updated_at'],
+        )
+        # bulk_create sends no signals; cached tenant responses include the usage row
+        bump_tenant(*(usage.tenant_id for usage in batch))
+        return len(batch)
@@ -0,0 +1,82 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from apps.billing.models import TenantUsage
+from apps.billing.quotas import apply_usage_deltas
+from apps.common.response_cache import bump_tenant
+from apps.tenants.models import TenantImage
+
+
+class Command(BaseCommand):
+    help = 'Verify recorded tenant media sizes against storage and repair the storage counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='Only report differences')
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        storage = TenantImage._meta.get_field('image').storage
+        images = (
+            TenantImage.objects.order_by()
+            .values_list('id', 'tenant_id', 'image', 'size_bytes')
+            .iterator(chunk_size=options['batch_size'])
+        )
+
+        batch, resized = [], 0
+        for image_id, tenant_id, name, recorded in images:
+            try:
+                actual = storage.size(name)
+            except OSError:
+                self.stderr.write(f'Missing file {name} for image {image_id}')
+                actual = 0
+            if actual != recorded:
+                batch.append((image_id, tenant_id, actual, recorded))
+            if len(batch) >= options['batch_size']:
+                resized += self._apply_sizes(batch)
+                batch = []
+        if batch:
+            resized += self._apply_sizes(batch)
+
+        repaired = self._repair_counters()
+        action = 'Found' if self.dry_run else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} {resized} image size(s) and {repaired} tenant counter(s)'
+        ))
+
+    def _apply_sizes(self, batch):
+        if self.dry_run:
+            return len(batch)
+        deltas = {}
+        for _, tenant_id, actual, recorded in batch:
+            deltas[tenant_id] = deltas.get(tenant_id, 0) + actual - recorded
+        with transaction.atomic():
+            TenantImage.objects.bulk_update(
+                [TenantImage(id=image_id, size_bytes=actual) for image_id, _, actual, _ in batch],
+                ['size_bytes'],
+            )
+            apply_usage_deltas('storage', deltas)
+        return len(batch)
+
+    def _repair_counters(self):
+        """Set counters that disagree with the recorded sizes; skips rows changed meanwhile."""
+        totals = dict(
+            TenantImage.objects.values_list('tenant_id')
+            .annotate(total=Sum('size_bytes'))
+            .order_by()
+        )
+        repaired = []
+        now = timezone.now()
+        for tenant_id, counted in TenantUsage.objects.values_list('tenant_id', 'storage_bytes').iterator():
+            expected = totals.get(tenant_id, 0)
+            if counted == expected:
+                continue
+            if self.dry_run or TenantUsage.objects.filter(tenant_id=tenant_id, storage_bytes=counted).update(
+                storage_bytes=expected, updated_at=now
+            ):
+                repaired.append(tenant_id)
+        if not self.dry_run:
+            # update() sends no signals; tenants/me shows the counter
+            bump_tenant(*repaired)
+        return len(repaired)
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from apps.billing.documents import render_invoices
+from apps.billing.models import Invoice
+
+
+class Command(BaseCommand):
+    help = 'Render invoice PDFs whose content changed (or all of them with --force)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Re-render even if the content hash matches')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        invoice_ids = Invoice.objects.order_by().values_list('id', flat=True).iterator(
+            chunk_size=options['batch_size']
+        )
+        rendered = render_invoices(invoice_ids, force=options['force'])
+        self.stdout.write(self.style.SUCCESS(f'Rendered {rendered} invoice document(s)'))
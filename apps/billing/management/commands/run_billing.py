@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from apps.billing.billing_run import run_billing
+
+
+class Command(BaseCommand):
+    help = 'Invoice subscriptions whose period has ended and advance them to the next period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Processes to split the run across')
+        parser.add_argument('--chunk-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        result = run_billing(workers=options['workers'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Billed {result['subscriptions']} subscription(s), created {result['invoices']} invoice(s)"
+        ))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from apps.billing.lifecycle import run_lifecycle
+
+
+class Command(BaseCommand):
+    help = 'Apply due subscription transitions (trial end, cancellation, grace period end)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Keep running and tick every N seconds instead of exiting'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            counts = run_lifecycle(batch_size=options['batch_size'])
+            summary = ', '.join(f'{reason}: {count}' for reason, count in counts.items())
+            self.stdout.write(self.style.SUCCESS(f'Applied transitions ({summary})'))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-19 03:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscriptionplan',
+            name='api_rate_limit',
+            field=models.IntegerField(blank=True, help_text='API requests per minute per tenant, null = unlimited', null=True),
+        ),
+    ]
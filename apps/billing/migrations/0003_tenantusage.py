@@ -0,0 +1,27 @@
+# Generated by Django 5.0.14 on 2026-10-19 03:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0002_subscriptionplan_api_rate_limit'),
+        ('tenants', '0004_provisioningjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TenantUsage',
+            fields=[
+                ('tenant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='usage', serialize=False, to='tenants.tenant')),
+                ('user_count', models.IntegerField(default=0)),
+                ('lead_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'tenant_usage',
+            },
+        ),
+    ]
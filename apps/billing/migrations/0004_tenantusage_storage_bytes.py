@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-19 03:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0003_tenantusage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tenantusage',
+            name='storage_bytes',
+            field=models.BigIntegerField(default=0, help_text='Bytes of stored tenant media'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.14 on 2026-10-19 03:21
+
+from django.db import migrations, models
+
+
+def seed_invoice_sequence(apps, schema_editor):
+    """Start the counter after the highest invoice number already issued."""
+    Invoice = apps.get_model('billing', 'Invoice')
+    InvoiceNumberSequence = apps.get_model('billing', 'InvoiceNumberSequence')
+    highest = 0
+    for number in Invoice.objects.values_list('invoice_number', flat=True).iterator():
+        try:
+            highest = max(highest, int(number.rsplit('-', 1)[-1]))
+        except (AttributeError, ValueError):
+            continue
+    InvoiceNumberSequence.objects.create(name='invoice', next_value=highest + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0004_tenantusage_storage_bytes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceNumberSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField(default=1, help_text='First number not yet reserved')),
+            ],
+            options={
+                'db_table': 'invoice_number_sequences',
+            },
+        ),
+        migrations.RunPython(seed_invoice_sequence, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.14 on 2026-10-19 03:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0005_invoicenumbersequence'),
+        ('tenants', '0005_tenantimage_size_bytes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='period_end',
+            field=models.DateTimeField(blank=True, help_text='End of the billed period', null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='period_start',
+            field=models.DateTimeField(blank=True, help_text='Start of the billed period', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['status', 'current_period_end'], name='subscriptio_status_302dc0_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='invoice',
+            constraint=models.UniqueConstraint(condition=models.Q(('period_start__isnull', False)), fields=('subscription', 'period_start'), name='unique_invoice_per_period'),
+        ),
+    ]
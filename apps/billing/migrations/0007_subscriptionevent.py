@@ -0,0 +1,33 @@
+# Generated by Django 5.0.14 on 2026-10-19 03:25
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0006_invoice_periods'),
+        ('tenants', '0006_tenant_trial_ends_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubscriptionEvent',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('from_status', models.CharField(choices=[('TRIAL', 'Trial'), ('ACTIVE', 'Active'), ('PAST_DUE', 'Past Due'), ('CANCELLED', 'Cancelled'), ('EXPIRED', 'Expired')], max_length=20)),
+                ('to_status', models.CharField(choices=[('TRIAL', 'Trial'), ('ACTIVE', 'Active'), ('PAST_DUE', 'Past Due'), ('CANCELLED', 'Cancelled'), ('EXPIRED', 'Expired')], max_length=20)),
+                ('reason', models.CharField(help_text="Lifecycle rule that fired, e.g. 'trial_ended'", max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('subscription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='billing.subscription')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subscription_events', to='tenants.tenant')),
+            ],
+            options={
+                'db_table': 'subscription_events',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['subscription', 'created_at'], name='subscriptio_subscri_462480_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.14 on 2026-10-19 03:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0007_subscriptionevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevenueRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('currency', models.CharField(max_length=3)),
+                ('status', models.CharField(choices=[('TRIAL', 'Trial'), ('ACTIVE', 'Active'), ('PAST_DUE', 'Past Due'), ('CANCELLED', 'Cancelled'), ('EXPIRED', 'Expired')], max_length=20)),
+                ('subscription_delta', models.IntegerField(default=0)),
+                ('mrr_delta', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('new_subscriptions', models.IntegerField(default=0)),
+                ('trial_conversions', models.IntegerField(default=0)),
+                ('churned', models.IntegerField(default=0)),
+                ('invoice_count', models.IntegerField(default=0)),
+                ('invoiced_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('paid_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revenue_rollups', to='billing.subscriptionplan')),
+            ],
+            options={
+                'db_table': 'revenue_rollups',
+                'ordering': ['day'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='revenuerollup',
+            constraint=models.UniqueConstraint(fields=('day', 'plan', 'currency', 'status'), name='unique_revenue_rollup'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-19 03:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0008_revenuerollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='document',
+            field=models.FileField(blank=True, editable=False, help_text='Rendered PDF, stored as invoices/<id>/<content hash>.pdf', null=True, upload_to='invoices/'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='document_hash',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Hash of the content the document was rendered from', max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def clear_document_urls(apps, schema_editor):
+    """Relative document links fail URLField validation in the admin; 0012 writes absolute ones."""
+    Invoice = apps.get_model('billing', 'Invoice')
+    Invoice.objects.filter(invoice_url__startswith='/api/invoices/').update(invoice_url=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0010_paymentwebhookevent'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_document_urls, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Q
+
+
+def fill_invoice_urls(apps, schema_editor):
+    """Point ``invoice_url`` of rendered invoices at their document, as ``render_invoice`` now does."""
+    Invoice = apps.get_model('billing', 'Invoice')
+    base = settings.PUBLIC_BASE_URL.rstrip('/')
+    invoices = (
+        Invoice.objects.exclude(document_hash='')
+        .filter(Q(invoice_url__isnull=True) | Q(invoice_url='') | Q(invoice_url__startswith='/api/invoices/'))
+        .values_list('id', 'document_hash')
+    )
+    for invoice_id, digest in list(invoices):
+        Invoice.objects.filter(id=invoice_id).update(
+            invoice_url=f'{base}/api/invoices/{invoice_id}/document/?v={digest[:16]}'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0011_clear_document_invoice_urls'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_invoice_urls, migrations.RunPython.noop),
+    ]
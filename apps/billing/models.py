@@ -21,6 +21,7 @@ class SubscriptionPlan(models.Model):
     max_users = models.IntegerField(null=True, blank=True, help_text="null = unlimited")
     max_leads = models.IntegerField(null=True, blank=True, help_text="null = unlimited")
     storage_gb = models.IntegerField(null=True, blank=True, help_text="null = unlimited")
+    api_rate_limit = models.IntegerField(null=True, blank=True, help_text="API requests per minute per tenant, null = unlimited")
     
     included_modules = models.JSONField(default=list, help_text="List of module slugs: ['crm', 'whatsapp']")
     features = models.JSONField(default=list, help_text="List of feature descriptions")
@@ -39,6 +40,16 @@ class SubscriptionPlan(models.Model):
     
     def __str__(self):
         return self.name
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember stored prices so revenue rollups can book the MRR change
+        instance._loaded_prices = (
+            instance.__dict__.get('price_monthly'),
+            instance.__dict__.get('price_yearly'),
+        )
+        return instance
 
 
 class Subscription(models.Model):
@@ -61,9 +72,21 @@ class Subscription(models.Model):
     class Meta:
         db_table = 'subscriptions'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'current_period_end']),
+        ]
     
     def __str__(self):
         return f"{self.tenant.name} - {self.plan.name} ({self.status})"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored revenue state so signals can book the difference
+        instance._loaded_state = tuple(
+            instance.__dict__.get(name) for name in ('plan_id', 'status', 'billing_cycle')
+        )
+        return instance
 
 
 class Invoice(models.Model):
@@ -76,9 +99,16 @@ class Invoice(models.Model):
     currency = models.CharField(max_length=3, default='INR')
     status = models.CharField(max_length=20, choices=INVOICE_STATUS_CHOICES, default='PENDING')
     
+    period_start = models.DateTimeField(null=True, blank=True, help_text="Start of the billed period")
+    period_end = models.DateTimeField(null=True, blank=True, help_text="End of the billed period")
+    
     due_date = models.DateTimeField()
     paid_at = models.DateTimeField(null=True, blank=True)
     invoice_url = models.URLField(max_length=500, blank=True, null=True)
+    document = models.FileField(upload_to='invoices/', blank=True, null=True, editable=False,
+                                help_text="Rendered PDF, stored as invoices/<id>/<content hash>.pdf")
+    document_hash = models.CharField(max_length=64, blank=True, default='', editable=False,
+                                     help_text="Hash of the content the document was rendered from")
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -86,19 +116,134 @@ class Invoice(models.Model):
     class Meta:
         db_table = 'invoices'
         ordering = ['-created_at']
+        constraints = [
+            # One invoice per subscription period keeps billing runs idempotent
+            models.UniqueConstraint(
+                fields=['subscription', 'period_start'],
+                condition=models.Q(period_start__isnull=False),
+                name='unique_invoice_per_period',
+            ),
+        ]
     
     def __str__(self):
         return f"Invoice {self.invoice_number} - {self.tenant.name}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+    
     def save(self, *args, **kwargs):
         if not self.invoice_number:
-            last_invoice = Invoice.objects.order_by('-created_at').first()
-            if last_invoice and last_invoice.invoice_number:
-                try:
-                    last_num = int(last_invoice.invoice_number.split('-')[-1])
-                    self.invoice_number = f"INV-{last_num + 1:06d}"
-                except (ValueError, IndexError):
-                    self.invoice_number = f"INV-{Invoice.objects.count() + 1:06d}"
-            else:
-                self.invoice_number = "INV-000001"
+            from apps.billing.numbering import next_invoice_number
+            self.invoice_number = next_invoice_number(using=kwargs.get('using'))
         super().save(*args, **kwargs)
+
+
+class SubscriptionEvent(models.Model):
+    """Status transition of a subscription, written by the lifecycle scheduler"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    subscription = models.ForeignKey(Subscription, on_delete=models.CASCADE, related_name='events')
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='subscription_events')
+    from_status = models.CharField(max_length=20, choices=SUBSCRIPTION_STATUS_CHOICES)
+    to_status = models.CharField(max_length=20, choices=SUBSCRIPTION_STATUS_CHOICES)
+    reason = models.CharField(max_length=50, help_text="Lifecycle rule that fired, e.g. 'trial_ended'")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'subscription_events'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['subscription', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.subscription_id}: {self.from_status} -> {self.to_status}"
+
+
+class RevenueRollup(models.Model):
+    """
+    Daily revenue deltas per plan, currency and subscription status.
+
+    Levels (subscriptions, MRR) are stored as changes and summed up to a day.
+    Flows (new, converted, churned, invoiced, collected) are booked on the day
+    they happen. Churn and trial conversions are booked on the status the
+    subscription left.
+    """
+    day = models.DateField()
+    plan = models.ForeignKey(SubscriptionPlan, on_delete=models.CASCADE, related_name='revenue_rollups')
+    currency = models.CharField(max_length=3)
+    status = models.CharField(max_length=20, choices=SUBSCRIPTION_STATUS_CHOICES)
+
+    subscription_delta = models.IntegerField(default=0)
+    mrr_delta = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    new_subscriptions = models.IntegerField(default=0)
+    trial_conversions = models.IntegerField(default=0)
+    churned = models.IntegerField(default=0)
+    invoice_count = models.IntegerField(default=0)
+    invoiced_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    paid_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = 'revenue_rollups'
+        ordering = ['day']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'plan', 'currency', 'status'], name='unique_revenue_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.plan_id} {self.currency} {self.status}"
+
+
+class PaymentWebhookEvent(models.Model):
+    """Raw payment provider event, stored on receipt and applied later by the batch processor"""
+    provider = models.CharField(max_length=50)
+    event_id = models.CharField(max_length=255, help_text="Provider event id, used to drop retried deliveries")
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'payment_webhook_events'
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['provider', 'event_id'], name='unique_payment_webhook_event'),
+        ]
+        indexes = [
+            models.Index(fields=['processed_at', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.provider} {self.event_type} {self.event_id}"
+
+
+class InvoiceNumberSequence(models.Model):
+    """Counter row handing out invoice numbers in blocks (see apps/billing/numbering.py)"""
+    name = models.CharField(max_length=50, primary_key=True)
+    next_value = models.BigIntegerField(default=1, help_text="First number not yet reserved")
+
+    class Meta:
+        db_table = 'invoice_number_sequences'
+
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
+
+class TenantUsage(models.Model):
+    """Running usage counters per tenant, updated in the same transaction as the change they count"""
+    tenant = models.OneToOneField(Tenant, on_delete=models.CASCADE, primary_key=True, related_name='usage')
+    user_count = models.IntegerField(default=0)
+    lead_count = models.IntegerField(default=0)
+    storage_bytes = models.BigIntegerField(default=0, help_text="Bytes of stored tenant media")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'tenant_usage'
+
+    def __str__(self):
+        return f"{self.tenant.name} usage"
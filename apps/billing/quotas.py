@@ -0,0 +1,135 @@
+"""
+Plan quota enforcement backed by per-tenant usage counters.
+
+``TenantUsage`` keeps running counts (users, leads, storage bytes) that are changed in the
+same transaction as the rows they count. Checking and reserving quota is a
+single conditional ``UPDATE``:
+
+    UPDATE tenant_usage SET user_count = user_count + 1
+    WHERE tenant_id = %s AND user_count <= max_users - 1
+
+Zero updated rows means the quota is exhausted, so concurrent creates can
+never overshoot the limit and no ``COUNT(*)`` is needed. Limits come from the
+cached entitlement snapshot. ``python manage.py recompute_usage`` rebuilds
+the counters if they ever drift.
+"""
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from apps.billing.entitlements import get_entitlements
+from apps.billing.models import TenantUsage
+from apps.common.response_cache import bump_tenant
+
+# resource -> (TenantUsage counter field, Entitlements limit attribute, units per limit unit)
+RESOURCES = {
+    'users': ('user_count', 'max_users', 1),
+    'leads': ('lead_count', 'max_leads', 1),
+    'storage': ('storage_bytes', 'storage_gb', 1024 ** 3),
+}
+
+# Counters that _initial_counts() derives from rows stored in this database
+LIVE_COUNTED_FIELDS = ('user_count', 'storage_bytes')
+
+
+class QuotaExceeded(APIException):
+    status_code = status.HTTP_403_FORBIDDEN
+    default_detail = 'Your subscription plan limit has been reached.'
+    default_code = 'quota_exceeded'
+
+
+def _initial_counts(tenant_id):
+    from apps.accounts.models import CustomUser
+    from apps.tenants.models import TenantImage
+    return {
+        'user_count': CustomUser.objects.filter(tenant_id=tenant_id).count(),
+        'storage_bytes': TenantImage.objects.filter(tenant_id=tenant_id).aggregate(
+            total=Coalesce(Sum('size_bytes'), 0)
+        )['total'],
+    }
+
+
+def _ensure_row(tenant_id):
+    """Create the usage row from live counts if missing. Returns True if this call created it."""
+    if TenantUsage.objects.filter(tenant_id=tenant_id).exists():
+        return False
+    # get_or_create tells a row inserted by a concurrent transaction apart
+    _, created = TenantUsage.objects.get_or_create(tenant_id=tenant_id, defaults=_initial_counts(tenant_id))
+    return created
+
+
+def get_limit(tenant_id, resource):
+    _, limit_attr, unit = RESOURCES[resource]
+    limit = getattr(get_entitlements(tenant_id), limit_attr)
+    return None if limit is None else limit * unit
+
+
+def consume_quota(tenant_id, resource, amount=1):
+    """
+    Reserve ``amount`` units of ``resource`` for a tenant or raise QuotaExceeded.
+
+    Call inside the transaction that creates the counted rows so the counter
+    rolls back with them.
+    """
+    field = RESOURCES[resource][0]
+    limit = get_limit(tenant_id, resource)
+    queryset = TenantUsage.objects.filter(tenant_id=tenant_id)
+    if limit is not None:
+        queryset = queryset.filter(**{f'{field}__lte': limit - amount})
+
+    with transaction.atomic():
+        if queryset.update(**{field: F(field) + amount, 'updated_at': timezone.now()}):
+            return
+        if _ensure_row(tenant_id) and queryset.update(**{field: F(field) + amount, 'updated_at': timezone.now()}):
+            return
+    raise QuotaExceeded(f'Plan limit of {limit} {resource} reached.')
+
+
+def release_quota(tenant_id, resource, amount=1):
+    """
+    Give back ``amount`` units after the counted rows were deleted.
+
+    A missing usage row is left alone: it is initialised from live counts,
+    which already exclude the removed rows, on next use. Recreating it here
+    would also break cascading tenant deletes that removed it already.
+    Counters never go below zero.
+    """
+    field = RESOURCES[resource][0]
+    TenantUsage.objects.filter(tenant_id=tenant_id).update(
+        **{field: Greatest(F(field) - amount, 0), 'updated_at': timezone.now()}
+    )
+
+
+def apply_usage_deltas(resource, deltas):
+    """
+    Apply ``{tenant_id: delta}`` for bulk paths (``bulk_create``, data
+    imports) with one UPDATE per tenant and no limit check. Call after the
+    rows were written. Bumps the cached responses of the changed tenants.
+    """
+    field = RESOURCES[resource][0]
+    now = timezone.now()
+    changed = [tenant_id for tenant_id, delta in deltas.items() if delta]
+    for tenant_id in changed:
+        delta = deltas[tenant_id]
+        queryset = TenantUsage.objects.filter(tenant_id=tenant_id)
+        if queryset.update(**{field: F(field) + delta, 'updated_at': now}):
+            continue
+        # Counters initialised from live rows already include this change
+        if _ensure_row(tenant_id) and field not in LIVE_COUNTED_FIELDS:
+            queryset.update(**{field: F(field) + delta})
+    bump_tenant(*changed)
+
+
+def get_usage(tenant_id):
+    """Counters and limits for a tenant."""
+    _ensure_row(tenant_id)
+    usage = TenantUsage.objects.filter(tenant_id=tenant_id).values(
+        *(field for field, _, _ in RESOURCES.values())
+    ).first()
+    return {
+        resource: {'used': usage[field], 'limit': get_limit(tenant_id, resource)}
+        for resource, (field, _, _) in RESOURCES.items()
+    }
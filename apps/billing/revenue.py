@@ -0,0 +1,328 @@
+"""
+Revenue and churn rollups.
+
+``RevenueRollup`` holds one row of deltas per day, plan, currency and
+subscription status. Subscription and invoice changes add to it as they
+happen: through the signals in ``apps/billing/signals.py``, and explicitly
+from bulk paths that bypass signals (billing run, lifecycle scheduler,
+admin actions). Dashboards then read a few grouped sums over the rollup
+table, whose size depends on days x plans, not on invoice volume.
+
+MRR is booked from the plan's current prices; a price change books the
+difference for all subscriptions of the plan. ``rebuild_revenue_rollups``
+recomputes the table from subscriptions, ``SubscriptionEvent`` history and
+invoices if it ever drifts.
+"""
+
+from collections import Counter, defaultdict, namedtuple
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from apps.billing.models import (
+    SubscriptionPlan, Subscription, SubscriptionEvent, Invoice, RevenueRollup
+)
+
+MRR_STATUSES = ('ACTIVE', 'PAST_DUE')
+CHURNED_STATUSES = ('CANCELLED', 'EXPIRED')
+FLOW_FIELDS = (
+    'new_subscriptions', 'trial_conversions', 'churned',
+    'invoice_count', 'invoiced_amount', 'paid_amount',
+)
+
+# Revenue-relevant state of one subscription
+SubscriptionState = namedtuple('SubscriptionState', 'plan_id currency status mrr')
+
+
+def monthly_value(billing_cycle, price_monthly, price_yearly):
+    """Monthly recurring value of one subscription."""
+    if billing_cycle == 'YEARLY':
+        return (Decimal(price_yearly) / 12).quantize(Decimal('0.01'))
+    return Decimal(price_monthly)
+
+
+def plan_prices(plan_ids):
+    """``{plan_id: (currency, price_monthly, price_yearly)}``"""
+    return {
+        row[0]: row[1:]
+        for row in SubscriptionPlan.objects.filter(id__in=set(plan_ids)).values_list(
+            'id', 'currency', 'price_monthly', 'price_yearly'
+        )
+    }
+
+
+def subscription_state(plan_id, status, billing_cycle, prices):
+    currency, price_monthly, price_yearly = prices[plan_id]
+    return SubscriptionState(plan_id, currency, status, monthly_value(billing_cycle, price_monthly, price_yearly))
+
+
+class RollupDeltas:
+    """Collects deltas in memory and writes one UPDATE per touched rollup row."""
+
+    def __init__(self):
+        self.rows = defaultdict(Counter)
+
+    def add(self, day, plan_id, currency, status, **fields):
+        self.rows[(day, plan_id, currency, status)].update(fields)
+
+    def subscription_changed(self, day, old, new):
+        """Book a subscription moving from state ``old`` to ``new`` (either may be None)."""
+        if old == new:
+            return
+        if old:
+            self.add(day, old.plan_id, old.currency, old.status, subscription_delta=-1, mrr_delta=-old.mrr)
+        if new:
+            self.add(day, new.plan_id, new.currency, new.status, subscription_delta=1, mrr_delta=new.mrr)
+        if old is None and new:
+            self.add(day, new.plan_id, new.currency, new.status, new_subscriptions=1)
+        elif old and new and old.status != new.status:
+            if old.status == 'TRIAL' and new.status in MRR_STATUSES:
+                self.add(day, old.plan_id, old.currency, old.status, trial_conversions=1)
+            elif new.status in CHURNED_STATUSES and old.status not in CHURNED_STATUSES:
+                self.add(day, old.plan_id, old.currency, old.status, churned=1)
+
+    def apply(self):
+        for (day, plan_id, currency, status), fields in self.rows.items():
+            updates = {name: F(name) + value for name, value in fields.items() if value}
+            if not updates:
+                continue
+            queryset = RevenueRollup.objects.filter(day=day, plan_id=plan_id, currency=currency, status=status)
+            if queryset.update(**updates):
+                continue
+            RevenueRollup.objects.bulk_create(
+                [RevenueRollup(day=day, plan_id=plan_id, currency=currency, status=status)],
+                ignore_conflicts=True,
+            )
+            queryset.update(**updates)
+        self.rows.clear()
+
+    def as_rollups(self):
+        return [
+            RevenueRollup(day=day, plan_id=plan_id, currency=currency, status=status, **fields)
+            for (day, plan_id, currency, status), fields in self.rows.items()
+        ]
+
+
+def today():
+    return timezone.localdate()
+
+
+def record_transitions(rows, to_status, day=None):
+    """
+    Book bulk status changes. ``rows`` are ``(plan_id, from_status,
+    billing_cycle)`` tuples of the moved subscriptions.
+    """
+    day = day or today()
+    prices = plan_prices(row[0] for row in rows)
+    deltas = RollupDeltas()
+    for plan_id, from_status, billing_cycle in rows:
+        deltas.subscription_changed(
+            day,
+            subscription_state(plan_id, from_status, billing_cycle, prices),
+            subscription_state(plan_id, to_status, billing_cycle, prices),
+        )
+    deltas.apply()
+
+
+def record_invoices(rows, day=None):
+    """Book created invoices. ``rows`` are ``(plan_id, currency, subscription_status, amount)``."""
+    day = day or today()
+    deltas = RollupDeltas()
+    for plan_id, currency, status, amount in rows:
+        deltas.add(day, plan_id, currency, status, invoice_count=1, invoiced_amount=amount)
+    deltas.apply()
+
+
+def record_payments(invoice_ids, day=None):
+    """Book collected amounts for invoices that just became PAID."""
+    day = day or today()
+    deltas = RollupDeltas()
+    grouped = (
+        Invoice.objects.filter(id__in=invoice_ids)
+        .values_list('subscription__plan_id', 'currency', 'subscription__status')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    )
+    for plan_id, currency, status, total in grouped:
+        deltas.add(day, plan_id, currency, status, paid_amount=total)
+    deltas.apply()
+
+
+def record_price_change(plan, old_prices, day=None):
+    """Book the MRR difference of a plan price change for all its subscriptions."""
+    day = day or today()
+    deltas = RollupDeltas()
+    counts = (
+        Subscription.objects.filter(plan=plan)
+        .values_list('status', 'billing_cycle')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    for status, billing_cycle, n in counts:
+        change = (
+            monthly_value(billing_cycle, plan.price_monthly, plan.price_yearly)
+            - monthly_value(billing_cycle, *old_prices)
+        )
+        deltas.add(day, plan.id, plan.currency, status, mrr_delta=change * n)
+    deltas.apply()
+
+
+def rebuild_rollups(chunk_size=1000, days_per_pass=31):
+    """
+    Recompute every rollup row from history in chunked passes.
+
+    Subscriptions and their events are merge-joined in id order; invoice
+    totals are grouped by the database one date window at a time. Plans'
+    current prices and subscriptions' current plan and cycle are used for
+    the whole history. Returns the number of rollup rows written.
+    """
+    deltas = RollupDeltas()
+    prices = {
+        row[0]: row[1:]
+        for row in SubscriptionPlan.objects.values_list('id', 'currency', 'price_monthly', 'price_yearly')
+    }
+
+    events = iter(
+        SubscriptionEvent.objects.order_by('subscription_id', 'created_at')
+        .values_list('subscription_id', 'from_status', 'to_status', 'created_at')
+        .iterator(chunk_size=chunk_size)
+    )
+    pending_event = next(events, None)
+    subscriptions = (
+        Subscription.objects.order_by('id')
+        .values_list('id', 'plan_id', 'status', 'billing_cycle', 'created_at')
+        .iterator(chunk_size=chunk_size)
+    )
+    for subscription_id, plan_id, status, billing_cycle, created_at in subscriptions:
+        history = []
+        while pending_event and pending_event[0] <= subscription_id:
+            if pending_event[0] == subscription_id:
+                history.append(pending_event)
+            pending_event = next(events, None)
+
+        current = subscription_state(plan_id, history[0][1] if history else status, billing_cycle, prices)
+        deltas.subscription_changed(timezone.localdate(created_at), None, current)
+        for _, from_status, to_status, changed_at in history:
+            moved = subscription_state(plan_id, to_status, billing_cycle, prices)
+            deltas.subscription_changed(timezone.localdate(changed_at), current, moved)
+            current = moved
+
+    first = Invoice.objects.order_by('created_at').values_list('created_at', flat=True).first()
+    if first:
+        start, end = first, timezone.now()
+        while start <= end:
+            window_end = start + timedelta(days=days_per_pass)
+            _add_invoice_window(deltas, 'created_at', start, window_end)
+            _add_invoice_window(deltas, 'paid_at', start, window_end)
+            start = window_end
+
+    rollups = deltas.as_rollups()
+    with transaction.atomic():
+        RevenueRollup.objects.all().delete()
+        RevenueRollup.objects.bulk_create(rollups, batch_size=chunk_size)
+    return len(rollups)
+
+
+def _add_invoice_window(deltas, date_field, start, end):
+    filters = {f'{date_field}__gte': start, f'{date_field}__lt': end}
+    if date_field == 'paid_at':
+        filters['status'] = 'PAID'
+    grouped = (
+        Invoice.objects.filter(**filters)
+        .annotate(day=TruncDate(date_field))
+        .values_list('day', 'subscription__plan_id', 'currency', 'subscription__status')
+        .annotate(n=Count('id'), total=Sum('amount'))
+        .order_by()
+    )
+    for day, plan_id, currency, status, n, total in grouped:
+        if date_field == 'paid_at':
+            deltas.add(day, plan_id, currency, status, paid_amount=total)
+        else:
+            deltas.add(day, plan_id, currency, status, invoice_count=n, invoiced_amount=total)
+
+
+def _levels(queryset):
+    """``{currency: {status: (subscriptions, mrr)}}``"""
+    levels = defaultdict(dict)
+    grouped = queryset.values_list('currency', 'status').annotate(
+        subscriptions=Sum('subscription_delta'), mrr=Sum('mrr_delta')
+    ).order_by()
+    for currency, status, subscriptions, mrr in grouped:
+        levels[currency][status] = (subscriptions or 0, mrr or Decimal('0'))
+    return levels
+
+
+def _rate(part, whole):
+    return round(part / whole, 4) if whole else None
+
+
+def revenue_summary(days=30):
+    """MRR, ARR and subscription counts now, plus flows and rates over the last ``days`` days."""
+    window_start = today() - timedelta(days=days)
+    current = _levels(RevenueRollup.objects.all())
+    opening = _levels(RevenueRollup.objects.filter(day__lte=window_start))
+    flows = defaultdict(dict)
+    grouped = (
+        RevenueRollup.objects.filter(day__gt=window_start)
+        .values_list('currency', 'status')
+        .annotate(**{name: Sum(name) for name in FLOW_FIELDS})
+        .order_by()
+    )
+    for currency, status, *values in grouped:
+        flows[currency][status] = dict(zip(FLOW_FIELDS, values))
+
+    summary = {}
+    for currency in sorted(set(current) | set(flows)):
+        def level(levels, statuses, index):
+            return sum(levels[currency].get(status, (0, Decimal('0')))[index] for status in statuses)
+
+        def flow(name, statuses=None):
+            return sum(
+                values[name] for status, values in flows[currency].items()
+                if statuses is None or status in statuses
+            )
+
+        mrr = level(current, MRR_STATUSES, 1)
+        paid_churn = flow('churned', MRR_STATUSES)
+        trial_churn = flow('churned', ('TRIAL',))
+        conversions = flow('trial_conversions')
+        summary[currency] = {
+            'mrr': mrr,
+            'arr': mrr * 12,
+            'paying_subscriptions': level(current, MRR_STATUSES, 0),
+            'trial_subscriptions': level(current, ('TRIAL',), 0),
+            'new_subscriptions': flow('new_subscriptions'),
+            'churned_subscriptions': paid_churn,
+            'churn_rate': _rate(paid_churn, level(opening, MRR_STATUSES, 0)),
+            'trial_conversions': conversions,
+            'trial_conversion_rate': _rate(conversions, conversions + trial_churn),
+            'invoiced': flow('invoiced_amount'),
+            'collected': flow('paid_amount'),
+        }
+    return {'days': days, 'as_of': today(), 'currencies': summary}
+
+
+def revenue_daily(days=30):
+    """Per day and currency: closing MRR and the day's flows."""
+    window_start = today() - timedelta(days=days)
+    mrr = {
+        currency: sum(mrr for status, (_, mrr) in statuses.items() if status in MRR_STATUSES)
+        for currency, statuses in _levels(RevenueRollup.objects.filter(day__lte=window_start)).items()
+    }
+    grouped = (
+        RevenueRollup.objects.filter(day__gt=window_start)
+        .values_list('day', 'currency')
+        .annotate(
+            mrr_change=Sum('mrr_delta', filter=Q(status__in=MRR_STATUSES)),
+            **{name: Sum(name) for name in FLOW_FIELDS}
+        )
+        .order_by('day', 'currency')
+    )
+    series = []
+    for day, currency, mrr_change, *values in grouped:
+        mrr[currency] = mrr.get(currency, Decimal('0')) + (mrr_change or 0)
+        series.append({'day': day, 'currency': currency, 'mrr': mrr[currency], **dict(zip(FLOW_FIELDS, values))})
+    return series
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from apps.billing.models import SubscriptionPlan, Subscription, Invoice
+from apps.tenants.serializers import get_storage_used_bytes
 
 
 class SubscriptionPlanSerializer(serializers.ModelSerializer):
@@ -12,12 +13,16 @@ class SubscriptionPlanSerializer(serializers.ModelSerializer):
 class SubscriptionSerializer(serializers.ModelSerializer):
     plan_name = serializers.CharField(source='plan.name', read_only=True)
     tenant_name = serializers.CharField(source='tenant.name', read_only=True)
+    storage_used_bytes = serializers.SerializerMethodField()
     
     class Meta:
         model = Subscription
         fields = '__all__'
         read_only_fields = ['id', 'tenant', 'created_at', 'updated_at']
 
+    def get_storage_used_bytes(self, obj):
+        return get_storage_used_bytes(obj.tenant)
+
 
 class InvoiceSerializer(serializers.ModelSerializer):
     tenant_name = serializers.CharField(source='tenant.name', read_only=True)
@@ -0,0 +1,107 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from apps.accounts.models import CustomUser
+from apps.tenants.models import Tenant, TenantImage
+from apps.billing.models import SubscriptionPlan, Subscription, SubscriptionEvent, Invoice
+from apps.billing.entitlements import invalidate_entitlements
+from apps.billing.quotas import release_quota
+from apps.billing import revenue
+from apps.billing.documents import queue_rendering
+from apps.billing.catalog import invalidate_catalog
+
+
+@receiver(post_save, sender=Tenant)
+@receiver(post_delete, sender=Tenant)
+def invalidate_tenant_entitlements(sender, instance, **kwargs):
+    invalidate_entitlements([instance.id])
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def invalidate_subscription_entitlements(sender, instance, **kwargs):
+    invalidate_entitlements([instance.tenant_id])
+
+
+@receiver(post_save, sender=SubscriptionPlan)
+@receiver(post_delete, sender=SubscriptionPlan)
+def invalidate_plan_entitlements(sender, instance, **kwargs):
+    # Plans change rarely and are shared by many tenants
+    invalidate_entitlements()
+    invalidate_catalog()
+
+
+@receiver(post_delete, sender=CustomUser)
+def release_user_quota(sender, instance, **kwargs):
+    # Runs inside the deletion's transaction, also for queryset deletes
+    if instance.tenant_id:
+        release_quota(instance.tenant_id, 'users')
+
+
+@receiver(post_delete, sender=TenantImage)
+def release_storage_quota(sender, instance, **kwargs):
+    if instance.size_bytes:
+        release_quota(instance.tenant_id, 'storage', instance.size_bytes)
+
+
+@receiver(post_save, sender=Subscription)
+def book_subscription_revenue(sender, instance, created, **kwargs):
+    loaded = None if created else getattr(instance, '_loaded_state', None)
+    if loaded is None and not created:
+        return
+    current = (instance.plan_id, instance.status, instance.billing_cycle)
+    instance._loaded_state = current
+    if loaded == current:
+        return
+
+    prices = revenue.plan_prices([instance.plan_id] + ([loaded[0]] if loaded else []))
+    deltas = revenue.RollupDeltas()
+    deltas.subscription_changed(
+        revenue.today(),
+        revenue.subscription_state(*loaded, prices) if loaded else None,
+        revenue.subscription_state(*current, prices),
+    )
+    deltas.apply()
+    if loaded and loaded[1] != instance.status:
+        SubscriptionEvent.objects.create(
+            subscription=instance,
+            tenant_id=instance.tenant_id,
+            from_status=loaded[1],
+            to_status=instance.status,
+            reason='updated',
+        )
+
+
+@receiver(post_delete, sender=Subscription)
+def unbook_subscription_revenue(sender, instance, **kwargs):
+    state = getattr(instance, '_loaded_state', None) or (instance.plan_id, instance.status, instance.billing_cycle)
+    deltas = revenue.RollupDeltas()
+    deltas.subscription_changed(revenue.today(), revenue.subscription_state(*state, revenue.plan_prices([state[0]])), None)
+    deltas.apply()
+
+
+@receiver(post_save, sender=Invoice)
+def book_invoice_revenue(sender, instance, created, **kwargs):
+    loaded_status = None if created else getattr(instance, '_loaded_status', instance.status)
+    instance._loaded_status = instance.status
+    if created:
+        plan_id, status = Subscription.objects.filter(id=instance.subscription_id).values_list(
+            'plan_id', 'status'
+        ).get()
+        revenue.record_invoices([(plan_id, instance.currency, status, instance.amount)])
+    if instance.status == 'PAID' and loaded_status != 'PAID':
+        revenue.record_payments([instance.id])
+
+
+@receiver(post_save, sender=SubscriptionPlan)
+def book_plan_price_change(sender, instance, created, **kwargs):
+    loaded_prices = getattr(instance, '_loaded_prices', None)
+    current = (instance.price_monthly, instance.price_yearly)
+    instance._loaded_prices = current
+    if loaded_prices and loaded_prices != current:
+        revenue.record_price_change(instance, loaded_prices)
+
+
+@receiver(post_save, sender=Invoice)
+def render_invoice_document(sender, instance, **kwargs):
+    # Skipped by the worker if nothing printed on the document changed
+    queue_rendering([instance.id])
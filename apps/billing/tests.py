@@ -0,0 +1,669 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework import status
+from apps.accounts.models import CustomUser
+from apps.billing.entitlements import get_entitlements, invalidate_entitlements
+from apps.billing.catalog import invalidate_catalog
+from apps.billing.fake_provider import FakePaymentProvider
+from apps.billing.webhooks import process_webhook_events, store_event
+from apps.billing.documents import render_invoice
+from apps.billing.billing_run import run_billing, partition_ids
+from apps.billing.lifecycle import run_lifecycle
+from apps.billing.models import (
+    SubscriptionPlan, Subscription, SubscriptionEvent, Invoice, PaymentWebhookEvent, TenantUsage
+)
+from apps.billing.numbering import allocate_invoice_numbers, next_invoice_number, reset_blocks
+from apps.billing.quotas import QuotaExceeded, consume_quota, release_quota
+from apps.billing.revenue import revenue_summary, revenue_daily, rebuild_rollups
+from apps.common.throttling import tenant_rate_limiter
+from apps.tenants.models import Tenant, PendingFileDeletion
+
+
+class BillingTestMixin:
+    def setUp(self):
+        invalidate_entitlements()
+        self.plan = SubscriptionPlan.objects.create(
+            name='Starter',
+            slug='starter',
+            price_monthly=Decimal('999.00'),
+            price_yearly=Decimal('9999.00'),
+            included_modules=['crm', 'meetings']
+        )
+        self.tenant = Tenant.objects.create(
+            name='Test Company',
+            slug='test-company',
+            enabled_modules=['crm', 'whatsapp']
+        )
+        now = timezone.now()
+        self.subscription = Subscription.objects.create(
+            tenant=self.tenant,
+            plan=self.plan,
+            status='ACTIVE',
+            current_period_start=now,
+            current_period_end=now + timedelta(days=30)
+        )
+        self.user = CustomUser.objects.create_user(
+            email='admin@example.com',
+            password='TestPass123!',
+            tenant=self.tenant
+        )
+        self.client.force_authenticate(user=self.user)
+
+
+class EntitlementTests(BillingTestMixin, APITestCase):
+    def test_modules_are_tenant_and_plan_intersection(self):
+        entitlements = get_entitlements(self.tenant.id)
+        self.assertTrue(entitlements.is_active())
+        self.assertEqual(entitlements.modules, frozenset(['crm']))
+        self.assertTrue(entitlements.allows('crm'))
+        self.assertFalse(entitlements.allows('whatsapp'))
+
+    def test_snapshot_cached_until_subscription_changes(self):
+        get_entitlements(self.tenant.id)
+        with self.assertNumQueries(0):
+            get_entitlements(self.tenant.id)
+
+        self.subscription.status = 'EXPIRED'
+        self.subscription.save()
+        self.assertFalse(get_entitlements(self.tenant.id).is_active())
+
+    def test_snapshot_compiled_before_commit_is_dropped_on_commit(self):
+        from apps.billing import entitlements
+        stale = get_entitlements(self.tenant.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.subscription.status = 'EXPIRED'
+            self.subscription.save()
+            # Stands in for a request that read the subscription before the save committed
+            entitlements._snapshots[self.tenant.id] = stale
+        self.assertFalse(get_entitlements(self.tenant.id).is_active())
+
+    def test_plan_change_invalidates_all_tenants(self):
+        get_entitlements(self.tenant.id)
+        self.plan.included_modules = ['crm', 'whatsapp']
+        self.plan.save()
+        self.assertEqual(get_entitlements(self.tenant.id).modules, frozenset(['crm', 'whatsapp']))
+
+    def test_expired_trial_is_inactive(self):
+        self.subscription.status = 'TRIAL'
+        self.subscription.current_period_end = timezone.now() - timedelta(minutes=1)
+        self.subscription.save()
+        self.assertFalse(get_entitlements(self.tenant.id).is_active())
+
+    def test_entitlements_endpoint(self):
+        response = self.client.get('/api/subscriptions/entitlements/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['is_active'])
+        self.assertEqual(response.data['modules'], ['crm'])
+
+
+class PlanThrottleTests(BillingTestMixin, APITestCase):
+    def test_requests_over_plan_rate_are_throttled(self):
+        tenant_rate_limiter.reset()
+        self.plan.api_rate_limit = 2
+        self.plan.save()
+        for _ in range(2):
+            self.assertEqual(self.client.get('/api/subscriptions/entitlements/').status_code, status.HTTP_200_OK)
+        response = self.client.get('/api/subscriptions/entitlements/')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+
+
+class QuotaTests(BillingTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.plan.max_users = 2
+        self.plan.max_leads = 10
+        self.plan.save()
+
+    def create_user(self, email):
+        return self.client.post('/api/users/', {
+            'email': email,
+            'password': 'TestPass123!',
+            'password_confirm': 'TestPass123!',
+            'tenant': str(self.tenant.id),
+        }, format='json')
+
+    def test_user_quota_enforced_and_released(self):
+        self.assertEqual(self.create_user('second@example.com').status_code, status.HTTP_201_CREATED)
+        response = self.create_user('third@example.com')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(TenantUsage.objects.get(tenant=self.tenant).user_count, 2)
+
+        CustomUser.objects.filter(email='second@example.com').delete()
+        self.assertEqual(TenantUsage.objects.get(tenant=self.tenant).user_count, 1)
+        self.assertEqual(self.create_user('third@example.com').status_code, status.HTTP_201_CREATED)
+
+    def test_moving_user_between_tenants(self):
+        other = Tenant.objects.create(name='Other', slug='other')
+        self.user.tenant = other
+        self.user.save()
+        self.assertEqual(TenantUsage.objects.get(tenant=self.tenant).user_count, 0)
+        self.assertEqual(TenantUsage.objects.get(tenant=other).user_count, 1)
+
+    def test_lead_quota(self):
+        self.user.cached_permissions = {'admin.full_access': True}
+        response = self.client.post('/api/subscriptions/usage/leads/', {'delta': 10}, format='json')
+        self.assertEqual(response.data, {'used': 10, 'limit': 10})
+        response = self.client.post('/api/subscriptions/usage/leads/', {'delta': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_lead_quota_requires_admin(self):
+        response = self.client.post('/api/subscriptions/usage/leads/', {'delta': -1000000}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_lead_release_never_goes_negative(self):
+        consume_quota(self.tenant.id, 'leads', 3)
+        release_quota(self.tenant.id, 'leads', 1000000)
+        self.assertEqual(TenantUsage.objects.get(tenant=self.tenant).lead_count, 0)
+        consume_quota(self.tenant.id, 'leads', 10)
+        with self.assertRaises(QuotaExceeded):
+            consume_quota(self.tenant.id, 'leads', 1)
+
+    def test_lead_quota_requires_crm_module(self):
+        self.user.cached_permissions = {'admin.full_access': True}
+        self.plan.included_modules = ['meetings']
+        self.plan.save()
+        response = self.client.post('/api/subscriptions/usage/leads/', {'delta': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(TenantUsage.objects.get(tenant=self.tenant).lead_count, 0)
+
+    def test_recompute_usage(self):
+        from unittest import mock
+        TenantUsage.objects.filter(tenant=self.tenant).update(user_count=42)
+        with mock.patch('apps.billing.management.commands.recompute_usage.bump_tenant') as bump_tenant:
+            call_command('recompute_usage', stdout=open(os.devnull, 'w'))
+        self.assertEqual(TenantUsage.objects.get(tenant=self.tenant).user_count, 1)
+        bump_tenant.assert_called_once_with(self.tenant.id)
+
+
+class PlanCatalogTests(BillingTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        invalidate_catalog()
+        self.client.force_authenticate(user=None)
+
+    def test_anonymous_catalog_served_without_queries(self):
+        first = self.client.get('/api/plans/')
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.json()['results'][0]['slug'], 'starter')
+        self.assertIn('public', first['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            again = self.client.get('/api/plans/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+        with self.assertNumQueries(0):
+            detail = self.client.get(f'/api/plans/{self.plan.id}/')
+        self.assertEqual(detail.json()['name'], 'Starter')
+
+    def test_plan_change_rebuilds_catalog(self):
+        etag = self.client.get('/api/plans/')['ETag']
+        self.plan.name = 'Starter Plus'
+        self.plan.save()
+        response = self.client.get('/api/plans/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['results'][0]['name'], 'Starter Plus')
+
+    def test_catalog_built_before_commit_is_dropped_on_commit(self):
+        from apps.billing import catalog
+        stale = catalog.get_catalog()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plan.price_monthly = Decimal('1299.00')
+            self.plan.save()
+            # Stands in for a request that read the plans before the save committed
+            catalog._catalog = stale
+        self.assertEqual(self.client.get('/api/plans/').json()['results'][0]['price_monthly'], '1299.00')
+
+    def test_inactive_plan_not_listed(self):
+        self.plan.is_active = False
+        self.plan.save()
+        self.assertEqual(self.client.get('/api/plans/').json()['count'], 0)
+        self.assertEqual(self.client.get(f'/api/plans/{self.plan.id}/').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class InvoiceNumberTests(BillingTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        reset_blocks()
+
+    def make_invoice(self, **kwargs):
+        return Invoice(
+            tenant=self.tenant, subscription=self.subscription,
+            amount=Decimal('999.00'), due_date=timezone.now(), **kwargs
+        )
+
+    def test_block_reserved_in_one_round_trip(self):
+        numbers = allocate_invoice_numbers(50)
+        self.assertEqual(len(set(numbers)), 50)
+        self.assertEqual(numbers[0], 'INV-000001')
+        self.assertEqual(allocate_invoice_numbers(1), ['INV-000051'])
+
+        Invoice.objects.bulk_create([self.make_invoice(invoice_number=n) for n in numbers])
+        self.assertEqual(Invoice.objects.count(), 50)
+
+    def test_saves_draw_from_process_block_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = next_invoice_number()
+        with self.assertNumQueries(0):
+            second = next_invoice_number()
+        self.assertEqual((first, second), ('INV-000001', 'INV-000002'))
+
+    def test_rolled_back_block_is_not_reused(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.make_invoice().save()
+                transaction.set_rollback(True)
+        invoice = self.make_invoice()
+        invoice.save()
+        self.assertEqual(invoice.invoice_number, 'INV-000001')
+        self.assertFalse(Invoice.objects.exclude(pk=invoice.pk).exists())
+
+
+class BillingRunTests(BillingTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.period_end = timezone.now() - timedelta(hours=1)
+        Subscription.objects.filter(pk=self.subscription.pk).update(
+            current_period_end=self.period_end, billing_cycle='YEARLY'
+        )
+
+    def test_invoices_due_subscription_and_advances_period(self):
+        result = run_billing()
+        self.assertEqual(result['subscriptions'], 1)
+
+        invoice = Invoice.objects.get(subscription=self.subscription)
+        self.assertEqual(invoice.amount, self.plan.price_yearly)
+        self.assertEqual(invoice.period_start, self.period_end)
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.subscription.current_period_start, self.period_end)
+        self.assertEqual(self.subscription.current_period_end, self.period_end + timedelta(days=365))
+
+    def test_rerun_is_idempotent(self):
+        run_billing()
+        self.assertEqual(run_billing()['subscriptions'], 0)
+        self.assertEqual(Invoice.objects.count(), 1)
+
+    def test_already_invoiced_period_is_not_booked_again(self):
+        from unittest import mock
+        Invoice.objects.create(tenant=self.tenant, subscription=self.subscription, amount=self.plan.price_yearly,
+                               period_start=self.period_end, due_date=self.period_end)
+        invoiced = revenue_summary(30)['currencies']['INR']['invoiced']
+        with mock.patch('apps.billing.billing_run.queue_rendering') as queue_rendering:
+            result = run_billing()
+        self.assertEqual(result, {'subscriptions': 1, 'invoices': 0})
+        self.assertEqual(Invoice.objects.count(), 1)
+        self.assertEqual(revenue_summary(30)['currencies']['INR']['invoiced'], invoiced)
+        self.assertEqual(list(queue_rendering.call_args.args[0]), [])
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.subscription.current_period_start, self.period_end)
+
+    def test_cancelled_at_period_end_is_not_billed(self):
+        Subscription.objects.filter(pk=self.subscription.pk).update(cancel_at_period_end=True)
+        self.assertEqual(run_billing()['subscriptions'], 0)
+
+    def test_partitions_cover_key_space(self):
+        parts = partition_ids(4)
+        self.assertEqual(len(parts), 4)
+        self.assertIsNone(parts[-1][1])
+        self.assertEqual([high for _, high in parts[:-1]], [low for low, _ in parts[1:]])
+
+
+class LifecycleTests(BillingTestMixin, APITestCase):
+    def set_subscription(self, **fields):
+        Subscription.objects.filter(pk=self.subscription.pk).update(**fields)
+
+    def test_trial_expires_at_period_end(self):
+        self.set_subscription(status='TRIAL', current_period_end=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(run_lifecycle()['trial_ended'], 1)
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.subscription.status, 'EXPIRED')
+
+        event = SubscriptionEvent.objects.get(subscription=self.subscription)
+        self.assertEqual((event.from_status, event.to_status), ('TRIAL', 'EXPIRED'))
+
+    def test_tenant_trial_end(self):
+        self.set_subscription(status='TRIAL')
+        Tenant.objects.filter(pk=self.tenant.pk).update(trial_ends_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(run_lifecycle()['tenant_trial_ended'], 1)
+
+    def test_cancel_at_period_end(self):
+        self.set_subscription(cancel_at_period_end=True, current_period_end=timezone.now() - timedelta(minutes=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            run_lifecycle()
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.subscription.status, 'CANCELLED')
+        self.assertIsNotNone(self.subscription.cancelled_at)
+        self.assertFalse(get_entitlements(self.tenant.id).is_active())
+
+    def test_past_due_expires_after_grace(self):
+        self.set_subscription(status='PAST_DUE', current_period_end=timezone.now() - timedelta(days=1))
+        self.assertEqual(run_lifecycle()['grace_period_ended'], 0)
+        self.set_subscription(current_period_end=timezone.now() - timedelta(days=30))
+        self.assertEqual(run_lifecycle()['grace_period_ended'], 1)
+
+    def test_past_due_is_not_billed_and_expires(self):
+        now = timezone.now()
+        period_end = now - timedelta(days=20)
+        self.set_subscription(status='PAST_DUE', current_period_end=period_end)
+        Invoice.objects.create(tenant=self.tenant, subscription=self.subscription, amount=Decimal('999.00'),
+                               due_date=now - timedelta(days=10))
+        self.assertEqual(run_billing()['subscriptions'], 0)
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.subscription.current_period_end, period_end)
+        self.assertEqual(Invoice.objects.count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(run_lifecycle()['grace_period_ended'], 1)
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.subscription.status, 'EXPIRED')
+
+    def test_past_due_grace_counts_from_oldest_unpaid_invoice(self):
+        now = timezone.now()
+        self.set_subscription(status='PAST_DUE', current_period_end=now + timedelta(days=20))
+        invalidate_entitlements()
+        self.assertTrue(get_entitlements(self.tenant.id).is_active())
+        Invoice.objects.create(tenant=self.tenant, subscription=self.subscription, amount=Decimal('999.00'),
+                               due_date=now - timedelta(days=10))
+        invalidate_entitlements()
+        self.assertFalse(get_entitlements(self.tenant.id).is_active())
+        self.assertEqual(run_lifecycle()['grace_period_ended'], 1)
+
+    @override_settings(RESPONSE_CACHE_ENABLED=True)
+    def test_transition_refreshes_cached_subscription_response(self):
+        self.user.cached_permissions = {'admin.full_access': True}
+        self.set_subscription(status='TRIAL', current_period_end=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(self.client.get('/api/subscriptions/my_subscription/').json()['status'], 'TRIAL')
+        with self.captureOnCommitCallbacks(execute=True):
+            run_lifecycle()
+        self.assertEqual(self.client.get('/api/subscriptions/my_subscription/').json()['status'], 'EXPIRED')
+
+    def test_idle_tick_touches_nothing(self):
+        self.assertEqual(sum(run_lifecycle().values()), 0)
+        self.assertFalse(SubscriptionEvent.objects.exists())
+
+
+class RevenueRollupTests(BillingTestMixin, APITestCase):
+    def summary(self):
+        return revenue_summary(30)['currencies']['INR']
+
+    def test_active_subscription_counts_towards_mrr(self):
+        summary = self.summary()
+        self.assertEqual(summary['mrr'], Decimal('999.00'))
+        self.assertEqual(summary['arr'], Decimal('11988.00'))
+        self.assertEqual(summary['paying_subscriptions'], 1)
+        self.assertEqual(summary['new_subscriptions'], 1)
+
+    def test_cycle_and_price_changes_move_mrr(self):
+        self.subscription.billing_cycle = 'YEARLY'
+        self.subscription.save()
+        self.assertEqual(self.summary()['mrr'], Decimal('833.25'))
+
+        self.plan.price_yearly = Decimal('12000.00')
+        self.plan.save()
+        self.assertEqual(self.summary()['mrr'], Decimal('1000.00'))
+
+    def test_cancellation_is_churn(self):
+        self.subscription.status = 'CANCELLED'
+        self.subscription.save()
+        summary = self.summary()
+        self.assertEqual(summary['mrr'], 0)
+        self.assertEqual(summary['churned_subscriptions'], 1)
+        self.assertTrue(SubscriptionEvent.objects.filter(subscription=self.subscription, to_status='CANCELLED').exists())
+
+    def test_trial_conversion(self):
+        self.subscription.status = 'TRIAL'
+        self.subscription.save()
+        self.subscription.status = 'ACTIVE'
+        self.subscription.save()
+        summary = self.summary()
+        self.assertEqual(summary['trial_conversions'], 1)
+        self.assertEqual(summary['trial_conversion_rate'], 1.0)
+
+    def test_invoiced_and_collected(self):
+        Subscription.objects.filter(pk=self.subscription.pk).update(current_period_end=timezone.now())
+        run_billing()
+        invoice = Invoice.objects.get()
+        invoice.status = 'PAID'
+        invoice.save()
+        summary = self.summary()
+        self.assertEqual(summary['invoiced'], Decimal('999.00'))
+        self.assertEqual(summary['collected'], Decimal('999.00'))
+        self.assertEqual(revenue_daily(30)[-1]['mrr'], Decimal('999.00'))
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.subscription.status = 'PAST_DUE'
+        self.subscription.save()
+        Subscription.objects.filter(pk=self.subscription.pk).update(current_period_end=timezone.now())
+        run_billing()
+        before = self.summary()
+        rebuild_rollups(chunk_size=2)
+        self.assertEqual(self.summary(), before)
+
+    def test_summary_endpoint_is_super_admin_only(self):
+        self.assertEqual(self.client.get('/api/revenue/summary/').status_code, status.HTTP_403_FORBIDDEN)
+        admin = CustomUser.objects.create_superuser(email='root@example.com', password='TestPass123!')
+        self.client.force_authenticate(user=admin)
+        response = self.client.get('/api/revenue/summary/?days=7')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['days'], 7)
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class InvoiceDocumentTests(BillingTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def create_invoice(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            invoice = Invoice.objects.create(
+                tenant=self.tenant, subscription=self.subscription,
+                amount=Decimal('999.00'), due_date=timezone.now()
+            )
+        invoice.refresh_from_db()
+        return invoice
+
+    def test_rendered_after_create(self):
+        invoice = self.create_invoice()
+        self.assertTrue(invoice.document.name.startswith(f'invoices/{invoice.id}/'))
+        self.assertEqual(
+            invoice.invoice_url,
+            f'http://localhost:5000/api/invoices/{invoice.id}/document/?v={invoice.document_hash[:16]}'
+        )
+        with invoice.document.open('rb') as fh:
+            self.assertEqual(fh.read(5), b'%PDF-')
+
+    def test_external_invoice_url_is_kept(self):
+        invoice = self.create_invoice()
+        invoice.invoice_url = 'https://payments.example.com/invoices/42'
+        invoice.status = 'PAID'
+        with self.captureOnCommitCallbacks(execute=True):
+            invoice.save()
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.invoice_url, 'https://payments.example.com/invoices/42')
+
+    def test_unchanged_invoice_is_not_rerendered(self):
+        invoice = self.create_invoice()
+        self.assertFalse(render_invoice(invoice.id))
+        self.assertTrue(render_invoice(invoice.id, force=True))
+
+    def test_content_change_replaces_document(self):
+        invoice = self.create_invoice()
+        old_name = invoice.document.name
+        invoice.status = 'PAID'
+        invoice.paid_at = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            invoice.save()
+        invoice.refresh_from_db()
+        self.assertNotEqual(invoice.document.name, old_name)
+        self.assertFalse(PendingFileDeletion.objects.filter(name=old_name).exists())
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, old_name)))
+
+    def test_admin_mark_as_paid_rerenders(self):
+        from unittest import mock
+        from django.contrib.admin.sites import site
+
+        invoice = self.create_invoice()
+        invoice_admin = site._registry[Invoice]
+        with self.captureOnCommitCallbacks(execute=True), mock.patch.object(invoice_admin, 'message_user'):
+            invoice_admin.mark_as_paid(None, Invoice.objects.filter(id=invoice.id))
+        old_hash = invoice.document_hash
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.status, 'PAID')
+        self.assertNotEqual(invoice.document_hash, old_hash)
+
+    def test_download_endpoint(self):
+        invoice = self.create_invoice()
+        admin = CustomUser.objects.create_superuser(email='root@example.com', password='TestPass123!')
+        self.client.force_authenticate(user=admin)
+        url = self.client.get(f'/api/invoices/{invoice.id}/').json()['invoice_url']
+        self.assertEqual(url, invoice.invoice_url)
+        listed = self.client.get('/api/invoices/').json()['results']
+        self.assertEqual([item['invoice_url'] for item in listed], [url])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF-'))
+
+
+@override_settings(PAYMENT_WEBHOOK_SECRET='whsec_test')
+class PaymentWebhookTests(BillingTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=None)
+        self.provider = FakePaymentProvider('whsec_test')
+        self.invoice = Invoice.objects.create(
+            tenant=self.tenant, subscription=self.subscription,
+            amount=Decimal('999.00'), due_date=timezone.now()
+        )
+
+    def test_invalid_signature_rejected(self):
+        body, _ = self.provider.delivery(self.provider.event('payment.succeeded', self.invoice))
+        response = self.client.post('/api/payments/webhook/', data=body, content_type='application/json',
+                                    HTTP_X_SIGNATURE='t=1,v1=bad')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertFalse(PaymentWebhookEvent.objects.exists())
+
+    def test_retried_deliveries_stored_once(self):
+        event = self.provider.event('payment.succeeded', self.invoice)
+        responses = self.provider.deliver(self.client, event, attempts=3)
+        self.assertEqual([r.status_code for r in responses], [200, 200, 200])
+        self.assertEqual(PaymentWebhookEvent.objects.count(), 1)
+
+    def test_payment_marks_invoice_paid_and_reactivates_subscription(self):
+        Subscription.objects.filter(pk=self.subscription.pk).update(status='PAST_DUE')
+        self.provider.deliver(self.client, self.provider.event('payment.succeeded', self.invoice))
+        self.assertEqual(process_webhook_events(), 1)
+
+        self.invoice.refresh_from_db()
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.invoice.status, 'PAID')
+        self.assertIsNotNone(self.invoice.paid_at)
+        self.assertEqual(self.subscription.status, 'ACTIVE')
+        self.assertFalse(PaymentWebhookEvent.objects.filter(processed_at__isnull=True).exists())
+
+    def test_burst_applied_in_order_with_late_failure_ignored(self):
+        events = [
+            self.provider.event('payment.failed', self.invoice),
+            self.provider.event('payment.succeeded', self.invoice),
+            self.provider.event('payment.failed', self.invoice),
+        ]
+        self.provider.burst(self.client, events, retries=2, seed=1)
+        self.assertEqual(PaymentWebhookEvent.objects.count(), 3)
+        process_webhook_events()
+        self.invoice.refresh_from_db()
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.invoice.status, 'PAID')
+        self.assertEqual(self.subscription.status, 'ACTIVE')
+
+    def test_failure_moves_subscription_past_due(self):
+        self.provider.deliver(self.client, self.provider.event('payment.failed', self.invoice))
+        process_webhook_events()
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.subscription.status, 'PAST_DUE')
+
+    def test_unknown_invoice_retried_and_amount_mismatch_rejected(self):
+        missing = Invoice(invoice_number='INV-999999', amount=Decimal('1.00'), currency='INR')
+        self.provider.deliver(self.client, self.provider.event('payment.succeeded', missing))
+        self.provider.deliver(self.client, self.provider.event('payment.succeeded', self.invoice, amount='1.00'))
+        self.assertEqual(process_webhook_events(), 0)
+
+        pending = PaymentWebhookEvent.objects.get(processed_at__isnull=True)
+        self.assertEqual((pending.attempts, pending.last_error), (1, 'Unknown invoice'))
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.status, 'PENDING')
+
+
+@unittest.skipIf(connection.vendor == 'sqlite', 'SQLite serialises writers; run against PostgreSQL')
+class WebhookLockTests(TransactionTestCase):
+    def test_payment_waits_for_locked_subscription(self):
+        plan = SubscriptionPlan.objects.create(name='Starter', slug='starter', price_monthly=Decimal('999.00'),
+                                               price_yearly=Decimal('9999.00'))
+        tenant = Tenant.objects.create(name='Locked', slug='locked')
+        subscription = Subscription.objects.create(tenant=tenant, plan=plan, status='PAST_DUE')
+        invoice = Invoice.objects.create(tenant=tenant, subscription=subscription, amount=Decimal('999.00'),
+                                         due_date=timezone.now())
+        event = FakePaymentProvider('whsec_test').event('payment.succeeded', invoice)
+        store_event(json.dumps(event).encode())
+        locked, release = threading.Event(), threading.Event()
+
+        def hold_lock():
+            try:
+                with transaction.atomic():
+                    list(Subscription.objects.select_for_update().filter(id=subscription.id))
+                    locked.set()
+                    release.wait(5)
+            finally:
+                connection.close()
+
+        holder = threading.Thread(target=hold_lock)
+        holder.start()
+        locked.wait(5)
+        threading.Timer(0.5, release.set).start()
+        self.assertEqual(process_webhook_events(), 1)
+        holder.join()
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.status, 'ACTIVE')
+
+
+@unittest.skipIf(connection.vendor == 'sqlite', 'SQLite serialises writers; run against PostgreSQL')
+class InvoiceNumberStressTests(TransactionTestCase):
+    def test_parallel_workers_never_collide(self):
+        reset_blocks()
+        results, errors = [], []
+
+        def worker():
+            try:
+                for _ in range(20):
+                    results.extend(allocate_invoice_numbers(5))
+                    results.append(next_invoice_number())
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), 8 * 20 * 6)
+        self.assertEqual(len(set(results)), len(results))
@@ -6,7 +6,9 @@ router = DefaultRouter()
 router.register('plans', views.SubscriptionPlanViewSet, basename='plan')
 router.register('subscriptions', views.SubscriptionViewSet, basename='subscription')
 router.register('invoices', views.InvoiceViewSet, basename='invoice')
+router.register('revenue', views.RevenueViewSet, basename='revenue')
 
 urlpatterns = [
+    path('payments/webhook/', views.payment_webhook_view, name='payment_webhook'),
     path('', include(router.urls)),
 ]
@@ -1,41 +1,125 @@
 from rest_framework import viewsets, permissions, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, authentication_classes, permission_classes, throttle_classes
 from rest_framework.response import Response
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
 from apps.billing.models import SubscriptionPlan, Subscription, Invoice
 from apps.billing.serializers import SubscriptionPlanSerializer, SubscriptionSerializer, InvoiceSerializer
-from apps.common.permissions import IsTenantAdmin
+from apps.billing.entitlements import get_entitlements
+from apps.billing.quotas import consume_quota, release_quota, get_usage, QuotaExceeded
+from apps.billing.revenue import revenue_summary, revenue_daily
+from apps.billing.documents import queue_rendering
+from apps.billing.catalog import aget_catalog, get_catalog
+from apps.billing.webhooks import verify_signature, store_event
+from apps.tenants.media import PassthroughRenderer, serve_media_file, etag_matches
+from apps.common.async_views import async_api_view, json_response
+from apps.common.response_cache import acache_response, cache_response
+from apps.common.projections import Projection, Column, ProjectedListMixin
+from apps.common.permissions import HasModuleEntitlement, IsSuperAdmin, IsTenantAdmin, IsTenantMember
 from datetime import datetime, timedelta
 
 
+def catalog_response(request, entry):
+    if etag_matches(request.headers.get('If-None-Match'), entry['etag']):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(entry['body'], content_type='application/json')
+    response['ETag'] = entry['etag']
+    response['Cache-Control'] = f'public, max-age={settings.PLAN_CATALOG_MAX_AGE}'
+    return response
+
+
 class SubscriptionPlanViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = SubscriptionPlan.objects.filter(is_active=True)
     serializer_class = SubscriptionPlanSerializer
     permission_classes = [permissions.AllowAny]
+    
+    def list(self, request, *args, **kwargs):
+        """Served from the precomputed catalog unless a specific page is requested"""
+        entry = get_catalog()['list']
+        if entry is None or request.query_params:
+            return super().list(request, *args, **kwargs)
+        return catalog_response(request, entry)
+    
+    def retrieve(self, request, *args, **kwargs):
+        entry = get_catalog()['plans'].get(str(kwargs.get('pk')))
+        if entry is None:
+            return super().retrieve(request, *args, **kwargs)
+        return catalog_response(request, entry)
+
 
+subscription_projection = Projection(
+    SubscriptionSerializer, storage_used_bytes=Column('tenant__usage__storage_bytes', default=0)
+)
+invoice_projection = Projection(InvoiceSerializer)
 
-class SubscriptionViewSet(viewsets.ModelViewSet):
+
+class SubscriptionViewSet(ProjectedListMixin, viewsets.ModelViewSet):
     serializer_class = SubscriptionSerializer
+    list_projection = subscription_projection
     permission_classes = [IsTenantAdmin]
+    # Set per action for HasModuleEntitlement
+    required_module = None
+    
+    def get_permissions(self):
+        if self.action in ['entitlements', 'usage']:
+            return [IsTenantMember()]
+        if self.action == 'leads':
+            return [IsTenantAdmin(), HasModuleEntitlement()]
+        return super().get_permissions()
     
     def get_queryset(self):
         user = self.request.user
+        queryset = Subscription.objects.select_related('plan', 'tenant__usage')
         if user.is_super_admin:
-            return Subscription.objects.all()
+            return queryset
         elif user.tenant:
-            return Subscription.objects.filter(tenant=user.tenant)
+            return queryset.filter(tenant=user.tenant)
         return Subscription.objects.none()
     
     @action(detail=False, methods=['get'])
+    @cache_response('subscription-my-subscription', scopes=('tenant',))
     def my_subscription(self, request):
         if not request.user.tenant:
             return Response({'error': 'No tenant associated'}, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            subscription = Subscription.objects.get(tenant=request.user.tenant)
+            subscription = Subscription.objects.select_related('plan', 'tenant__usage').get(tenant=request.user.tenant)
             return Response(self.get_serializer(subscription).data)
         except Subscription.DoesNotExist:
             return Response({'error': 'No active subscription'}, status=status.HTTP_404_NOT_FOUND)
     
+    @action(detail=False, methods=['get'])
+    def entitlements(self, request):
+        if not request.user.tenant_id:
+            return Response({'error': 'No tenant associated'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(get_entitlements(request.user.tenant_id).as_dict())
+    
+    @action(detail=False, methods=['get'])
+    def usage(self, request):
+        if not request.user.tenant_id:
+            return Response({'error': 'No tenant associated'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(get_usage(request.user.tenant_id))
+    
+    @action(detail=False, methods=['post'], url_path='usage/leads', required_module='crm')
+    def leads(self, request):
+        """Reserve (positive delta) or release (negative delta) lead quota; tenant admins only"""
+        if not request.user.tenant_id:
+            return Response({'error': 'No tenant associated'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            delta = int(request.data.get('delta', 1))
+        except (TypeError, ValueError):
+            return Response({'delta': 'Must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if delta > 0:
+            try:
+                consume_quota(request.user.tenant_id, 'leads', delta)
+            except QuotaExceeded as e:
+                return Response({'error': str(e.detail)}, status=e.status_code)
+        elif delta < 0:
+            release_quota(request.user.tenant_id, 'leads', -delta)
+        return Response(get_usage(request.user.tenant_id)['leads'])
+    
     @action(detail=False, methods=['post'])
     def subscribe(self, request):
         plan_id = request.data.get('plan_id')
@@ -69,7 +153,7 @@ class SubscriptionViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def cancel(self, request):
         try:
-            subscription = Subscription.objects.get(tenant=request.user.tenant)
+            subscription = Subscription.objects.select_related('plan', 'tenant__usage').get(tenant=request.user.tenant)
             subscription.cancel_at_period_end = True
             subscription.cancelled_at = datetime.now()
             subscription.save()
@@ -78,8 +162,9 @@ class SubscriptionViewSet(viewsets.ModelViewSet):
             return Response({'error': 'No active subscription'}, status=status.HTTP_404_NOT_FOUND)
 
 
-class InvoiceViewSet(viewsets.ReadOnlyModelViewSet):
+class InvoiceViewSet(ProjectedListMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = InvoiceSerializer
+    list_projection = invoice_projection
     permission_classes = [IsTenantAdmin]
     
     def get_queryset(self):
@@ -89,3 +174,77 @@ class InvoiceViewSet(viewsets.ReadOnlyModelViewSet):
         elif user.tenant:
             return Invoice.objects.filter(tenant=user.tenant)
         return Invoice.objects.none()
+    
+    @action(detail=True, methods=['get'], renderer_classes=[PassthroughRenderer])
+    def document(self, request, pk=None):
+        """Download the rendered invoice PDF"""
+        invoice = self.get_object()
+        if not invoice.document:
+            queue_rendering([invoice.id])
+            response = JsonResponse({'message': 'Invoice document is being generated'}, status=status.HTTP_202_ACCEPTED)
+            response['Retry-After'] = '5'
+            return response
+        return serve_media_file(request, invoice.document.name, storage=invoice.document.storage)
+
+
+class RevenueViewSet(viewsets.ViewSet):
+    """Revenue and churn metrics for super admins, read from the daily rollups"""
+    permission_classes = [IsSuperAdmin]
+
+    def _days(self, request):
+        try:
+            return min(max(int(request.query_params.get('days', 30)), 1), 366)
+        except ValueError:
+            return 30
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        return Response(revenue_summary(self._days(request)))
+
+    @action(detail=False, methods=['get'])
+    def daily(self, request):
+        return Response(revenue_daily(self._days(request)))
+
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([permissions.AllowAny])
+@throttle_classes([])
+def payment_webhook_view(request):
+    """Verify and store a payment provider event; it is applied in the background"""
+    body = request.body
+    if not verify_signature(body, request.headers.get('X-Signature', '')):
+        return Response({'error': 'Invalid signature'}, status=status.HTTP_401_UNAUTHORIZED)
+    try:
+        store_event(body)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'received': True})
+
+
+# Async versions of hot read endpoints, routed by config/asgi_urls.py
+
+@async_api_view(SubscriptionViewSet.as_view({'get': 'my_subscription'}), permission_classes=(IsTenantAdmin,))
+@acache_response('subscription-my-subscription', scopes=('tenant',))
+async def async_my_subscription_view(request):
+    if not request.user.tenant_id:
+        return json_response({'error': 'No tenant associated'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        subscription = await Subscription.objects.select_related('plan', 'tenant__usage').aget(
+            tenant_id=request.user.tenant_id
+        )
+    except Subscription.DoesNotExist:
+        return json_response({'error': 'No active subscription'}, status=status.HTTP_404_NOT_FOUND)
+    return json_response(SubscriptionSerializer(subscription, context={'request': request}).data)
+
+
+@async_api_view(SubscriptionPlanViewSet.as_view({'get': 'list'}), permission_classes=(permissions.AllowAny,))
+async def async_plan_list_view(request):
+    entry = (await aget_catalog())['list']
+    return catalog_response(request, entry) if entry is not None else None
+
+
+@async_api_view(SubscriptionPlanViewSet.as_view({'get': 'retrieve'}), permission_classes=(permissions.AllowAny,))
+async def async_plan_detail_view(request, pk):
+    entry = (await aget_catalog())['plans'].get(pk)
+    return catalog_response(request, entry) if entry is not None else None
@@ -0,0 +1,244 @@
+"""
+Payment provider webhook ingestion.
+
+The endpoint only verifies the signature and appends the raw event to
+``PaymentWebhookEvent``. The ``(provider, event_id)`` unique constraint turns
+retried deliveries into no-ops, so a burst costs one INSERT per delivery.
+
+``process_webhook_events`` applies stored events in arrival (id) order, so
+events of one tenant are applied in the order they were received. Each
+batch runs in one transaction:
+
+* the batch's invoices are loaded and locked with one query, events are
+  folded onto them in order and written back with one ``bulk_update``;
+* a paid invoice is never downgraded by a late failure event;
+* subscriptions move ``PAST_DUE`` -> ``ACTIVE`` on payment and
+  ``ACTIVE`` -> ``PAST_DUE`` on failure through the lifecycle transitions,
+  which record history and revenue.
+
+Events for invoices that do not exist (yet) are retried up to
+``PAYMENT_WEBHOOK_MAX_ATTEMPTS`` times.
+
+Signatures follow the common ``t=<unix time>,v1=<hex HMAC-SHA256>`` scheme
+over ``"<t>.<raw body>"`` with ``PAYMENT_WEBHOOK_SECRET``.
+"""
+
+import hashlib
+import hmac
+import json
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from apps.billing.documents import queue_rendering
+from apps.billing.lifecycle import apply_transition
+from apps.billing.models import Invoice, PaymentWebhookEvent
+from apps.billing.revenue import record_payments
+from apps.common.logger import get_logger
+from apps.common.tasks import run_in_background
+
+logger = get_logger(__name__)
+
+# event type -> invoice status
+INVOICE_STATUS_BY_EVENT = {
+    'payment.succeeded': 'PAID',
+    'payment.failed': 'FAILED',
+}
+
+# invoice status -> (reason, from statuses, to status) of the subscription
+SUBSCRIPTION_TRANSITIONS = {
+    'PAID': ('payment_succeeded', ('PAST_DUE',), 'ACTIVE'),
+    'FAILED': ('payment_failed', ('ACTIVE',), 'PAST_DUE'),
+}
+
+_processing_lock = threading.Lock()
+_processing_pending = False
+
+
+def sign_payload(body, timestamp, secret=None):
+    """Signature header value for ``body`` (bytes) sent at ``timestamp``."""
+    secret = secret if secret is not None else settings.PAYMENT_WEBHOOK_SECRET
+    digest = hmac.new(secret.encode(), b'%d.' % timestamp + body, hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={digest}'
+
+
+def verify_signature(body, header, secret=None, now=None):
+    """True if ``header`` is a valid, recent signature of ``body``."""
+    secret = secret if secret is not None else settings.PAYMENT_WEBHOOK_SECRET
+    if not secret or not header:
+        return False
+    parts = dict(part.split('=', 1) for part in header.split(',') if '=' in part)
+    try:
+        timestamp = int(parts.get('t', ''))
+    except ValueError:
+        return False
+    now = now or time.time()
+    if abs(now - timestamp) > settings.PAYMENT_WEBHOOK_TOLERANCE:
+        return False
+    expected = sign_payload(body, timestamp, secret).split('v1=', 1)[1]
+    return hmac.compare_digest(expected, parts.get('v1', ''))
+
+
+def store_event(body, provider=None):
+    """
+    Append a verified raw event to the inbox. Duplicates are ignored.
+
+    Raises ValueError for bodies that are not a JSON event with ``id`` and
+    ``type``.
+    """
+    payload = json.loads(body)
+    if not isinstance(payload, dict) or not payload.get('id') or not payload.get('type'):
+        raise ValueError('Event must be an object with "id" and "type"')
+    PaymentWebhookEvent.objects.bulk_create([
+        PaymentWebhookEvent(
+            provider=provider or settings.PAYMENT_WEBHOOK_PROVIDER,
+            event_id=str(payload['id'])[:255],
+            event_type=str(payload['type'])[:100],
+            payload=payload,
+        )
+    ], ignore_conflicts=True)
+    transaction.on_commit(schedule_processing)
+
+
+def _event_time(payload, default):
+    try:
+        return datetime.fromtimestamp(int(payload['created']), tz=dt_timezone.utc)
+    except (KeyError, TypeError, ValueError, OverflowError):
+        return default
+
+
+def _check_amount(data, invoice):
+    """Error message if the event amount does not match the invoice, else None."""
+    if 'amount' not in data:
+        return None
+    try:
+        amount = Decimal(str(data['amount']))
+    except InvalidOperation:
+        return 'Invalid amount'
+    if amount != invoice.amount or data.get('currency', invoice.currency) != invoice.currency:
+        return f"Amount {data.get('currency', '')} {amount} does not match invoice"
+    return None
+
+
+def _apply_batch(events, now, batch_size):
+    """
+    Fold a batch of events onto invoices and subscriptions.
+
+    Returns ``(done, rejected, retry)``: ids of applied or ignored events,
+    ``(id, error)`` of events that will not be applied, ``(id, error)`` of
+    events to retry.
+    """
+    numbers = {event.payload.get('data', {}).get('invoice_number') for event in events}
+    invoices = {
+        invoice.invoice_number: invoice
+        for invoice in Invoice.objects.select_for_update()
+        .filter(invoice_number__in=numbers - {None})
+        .only('id', 'invoice_number', 'status', 'paid_at', 'amount', 'currency', 'subscription_id')
+    }
+    original_status = {invoice.id: invoice.status for invoice in invoices.values()}
+    subscription_status = {}
+    done, rejected, retry = [], [], []
+
+    for event in events:
+        new_status = INVOICE_STATUS_BY_EVENT.get(event.event_type)
+        if new_status is None:
+            done.append(event.id)
+            continue
+        data = event.payload.get('data', {})
+        invoice = invoices.get(data.get('invoice_number'))
+        if invoice is None:
+            retry.append((event.id, 'Unknown invoice'))
+            continue
+        error = _check_amount(data, invoice)
+        if error:
+            rejected.append((event.id, error))
+            continue
+        done.append(event.id)
+        if invoice.status == 'PAID':
+            # Late or retried failure of an invoice that was paid meanwhile
+            continue
+        invoice.status = new_status
+        if new_status == 'PAID':
+            invoice.paid_at = _event_time(event.payload, now)
+        subscription_status[invoice.subscription_id] = new_status
+
+    changed = [invoice for invoice in invoices.values() if invoice.status != original_status[invoice.id]]
+    if changed:
+        for invoice in changed:
+            invoice.updated_at = now
+        Invoice.objects.bulk_update(changed, ['status', 'paid_at', 'updated_at'])
+        record_payments([invoice.id for invoice in changed if invoice.status == 'PAID'])
+        queue_rendering(invoice.id for invoice in changed)
+
+    for new_status, (reason, from_statuses, to_status) in SUBSCRIPTION_TRANSITIONS.items():
+        subscription_ids = [sid for sid, status in subscription_status.items() if status == new_status]
+        if subscription_ids:
+            # Wait for rows the billing run or lifecycle holds: the events are marked processed
+            apply_transition(reason, from_statuses, to_status, Q(id__in=subscription_ids), {}, now, batch_size,
+                             skip_locked=False)
+    return done, rejected, retry
+
+
+def process_webhook_events(batch_size=None, max_attempts=None):
+    """
+    Apply pending events in batches. Rows are claimed with
+    ``SELECT ... FOR UPDATE SKIP LOCKED`` so several processors can run.
+
+    Returns:
+        int: number of events applied or ignored
+    """
+    batch_size = batch_size or settings.PAYMENT_WEBHOOK_BATCH_SIZE
+    max_attempts = max_attempts or settings.PAYMENT_WEBHOOK_MAX_ATTEMPTS
+    processed = 0
+    last_id = 0
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            events = list(
+                PaymentWebhookEvent.objects.select_for_update(skip_locked=True)
+                .filter(processed_at__isnull=True, attempts__lt=max_attempts, id__gt=last_id)
+                .order_by('id')[:batch_size]
+            )
+            if not events:
+                break
+            last_id = events[-1].id
+            done, rejected, retry = _apply_batch(events, now, batch_size)
+            PaymentWebhookEvent.objects.filter(id__in=done).update(
+                processed_at=now, attempts=F('attempts') + 1
+            )
+            for event_id, error in rejected:
+                PaymentWebhookEvent.objects.filter(id=event_id).update(
+                    processed_at=now, attempts=F('attempts') + 1, last_error=error
+                )
+            for event_id, error in retry:
+                PaymentWebhookEvent.objects.filter(id=event_id).update(
+                    attempts=F('attempts') + 1, last_error=error
+                )
+        processed += len(done)
+        if len(events) < batch_size:
+            break
+    if processed:
+        logger.info('Applied %d payment webhook event(s)', processed)
+    return processed
+
+
+def _run_scheduled_processing():
+    global _processing_pending
+    with _processing_lock:
+        _processing_pending = False
+    process_webhook_events()
+
+
+def schedule_processing():
+    """Queue one background processing run; calls made while one is pending are coalesced."""
+    global _processing_pending
+    with _processing_lock:
+        if _processing_pending:
+            return
+        _processing_pending = True
+    run_in_background(_run_scheduled_processing)
@@ -0,0 +1,10 @@
+from django.contrib import admin
+from apps.common.models import RequestProfile
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'method', 'path', 'view_name', 'status_code', 'duration_ms', 'peak_memory_kb', 'trigger']
+    list_filter = ['trigger', 'method', 'status_code']
+    search_fields = ['path', 'view_name']
+    readonly_fields = [field.name for field in RequestProfile._meta.fields]
@@ -0,0 +1,18 @@
+from django.apps import AppConfig
+from django.conf import settings
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
+
+
+class CommonConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.common'
+    label = 'common'
+
+    def ready(self):
+        from apps.common import signals  # noqa: F401
+        from apps.common.middleware import install_query_timer
+        connection_created.connect(install_query_timer, dispatch_uid='common.install_query_timer')
+        if settings.INVALIDATION_BUS:
+            from apps.common.invalidation import start_listener
+            request_started.connect(start_listener, dispatch_uid='common.start_invalidation_listener')
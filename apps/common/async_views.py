@@ -0,0 +1,161 @@
+"""
+Async fast path for hot read endpoints.
+
+Under ``config.asgi`` a sync DRF view runs on a worker thread and holds it for
+the whole request. ``async_api_view`` turns an ``async def`` handler into a
+view that does what the DRF view it stands in for does up front: JWT
+authentication with the user loaded through the async ORM, permission
+classes and the tenant throttle, with errors rendered as DRF renders them.
+The handler then runs on the event loop and only hops to a thread for the
+ORM calls it makes itself.
+
+Anything the fast path does not cover (other methods, query strings, HTML
+clients) goes to the regular DRF view, as does a handler returning ``None``.
+Handlers of cached responses are wrapped in ``acache_response``
+(``apps/common/response_cache.py``), so hits and misses alike stay on the
+event loop.
+
+The async views are routed by ``config/asgi_urls.py``, which ``ASYNC_VIEWS``
+(on by default in ``config.asgi``) selects as the URLconf.
+"""
+
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException, NotAuthenticated, PermissionDenied, Throttled
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.views import exception_handler
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from apps.common.throttling import TenantPlanRateThrottle
+
+_jwt = JWTAuthentication()
+_renderer = JSONRenderer()
+
+
+def json_response(data, status=200):
+    """JSON response with the same body DRF's ``JSONRenderer`` produces."""
+    return body_response(_renderer.render(data), status)
+
+
+def body_response(body, status=200):
+    """JSON response with an already encoded body, e.g. from the response cache."""
+    response = HttpResponse(body, status=status, content_type='application/json')
+    patch_vary_headers(response, ('Accept',))
+    return response
+
+
+def error_response(exc):
+    """Render an ``APIException`` like ``APIView.handle_exception``."""
+    if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+        exc.auth_header = _jwt.authenticate_header(None)
+    response = exception_handler(exc, {})
+    rendered = json_response(response.data, status=response.status_code)
+    for header in ('WWW-Authenticate', 'Retry-After'):
+        if header in response:
+            rendered[header] = response[header]
+    return rendered
+
+
+async def authenticate(request, queryset):
+    """
+    The user of the request's bearer token (``AnonymousUser`` without one),
+    loaded from ``queryset``. Raises like ``JWTAuthentication.authenticate``.
+    """
+    header = _jwt.get_header(request)
+    raw_token = _jwt.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        return AnonymousUser()
+    token = _jwt.get_validated_token(raw_token)
+    try:
+        user_id = token[jwt_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken('Token contained no recognizable user identification')
+    try:
+        user = await queryset.aget(**{jwt_settings.USER_ID_FIELD: user_id})
+    except queryset.model.DoesNotExist:
+        raise AuthenticationFailed('User not found', code='user_not_found')
+    if jwt_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+        raise AuthenticationFailed('User is inactive', code='user_inactive')
+    if jwt_settings.CHECK_REVOKE_TOKEN and (
+        token.get(jwt_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password)
+    ):
+        raise AuthenticationFailed("The user's password has been changed.", code='password_changed')
+    return user
+
+
+def check_permissions(request, permission_classes):
+    for permission_class in permission_classes:
+        permission = permission_class()
+        if not permission.has_permission(request, None):
+            if not request.user.is_authenticated:
+                raise NotAuthenticated()
+            raise PermissionDenied(getattr(permission, 'message', None), getattr(permission, 'code', None))
+
+
+async def check_throttle(request):
+    user = request.user
+    if user.is_authenticated and user.tenant_id and not user.is_super_admin:
+        from apps.billing.entitlements import aget_entitlements
+        # Loads the snapshot the throttle reads, so allow_request does not query
+        await aget_entitlements(user.tenant_id)
+    throttle = TenantPlanRateThrottle()
+    if not throttle.allow_request(request, None):
+        raise Throttled(throttle.wait())
+    # A fallback to the regular view does not count the request again
+    request.tenant_throttle_consumed = True
+
+
+def _fast_path_applies(request, methods):
+    if request.method not in methods or request.GET:
+        return False
+    # The browsable API is rendered by the regular view
+    return 'text/html' not in request.headers.get('Accept', '')
+
+
+def async_api_view(fallback, permission_classes=(IsAuthenticated,), authentication=True, user_queryset=None,
+                   methods=('GET', 'HEAD')):
+    """
+    Decorate an ``async def handler(request, *args, **kwargs)`` standing in
+    for the sync view ``fallback``.
+
+    ``user_queryset`` loads the authenticated user, e.g. with the relations
+    the handler serializes (default: with the tenant). Without
+    ``authentication`` the user is anonymous, as in a DRF view with empty
+    ``authentication_classes``.
+    """
+    if user_queryset is None:
+        from apps.accounts.models import CustomUser
+        user_queryset = CustomUser.objects.select_related('tenant')
+    run_fallback = sync_to_async(fallback)
+
+    def decorator(handler):
+        @csrf_exempt
+        @wraps(handler)
+        async def view(request, *args, **kwargs):
+            if not _fast_path_applies(request, methods):
+                return await run_fallback(request, *args, **kwargs)
+            try:
+                if authentication:
+                    request.user = await authenticate(request, user_queryset)
+                else:
+                    request.user = AnonymousUser()
+                check_permissions(request, permission_classes)
+                await check_throttle(request)
+                response = await handler(request, *args, **kwargs)
+            except APIException as exc:
+                return error_response(exc)
+            if response is None:
+                return await run_fallback(request, *args, **kwargs)
+            return response
+
+        return view
+
+    return decorator
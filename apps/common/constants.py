@@ -101,8 +101,44 @@ BILLING_CYCLE_CHOICES = [
     ('YEARLY', 'Yearly'),
 ]
 
+# Length of a billing period per cycle, used by the billing run
+BILLING_PERIOD_DAYS = {
+    'MONTHLY': 30,
+    'YEARLY': 365,
+}
+
 INVOICE_STATUS_CHOICES = [
     ('PENDING', 'Pending'),
     ('PAID', 'Paid'),
     ('FAILED', 'Failed'),
 ]
+
+PROVISIONING_STATUS_CHOICES = [
+    ('PENDING', 'Pending'),
+    ('RUNNING', 'Running'),
+    ('SUCCEEDED', 'Succeeded'),
+    ('FAILED', 'Failed'),
+]
+
+# Roles created for every new tenant next to the synchronous "Admin" role.
+# Scope actions get `scope`, boolean actions get True if listed in `actions`.
+DEFAULT_TENANT_ROLES = [
+    {
+        'name': 'Manager',
+        'description': 'Manage all records in enabled modules',
+        'scope': 'all',
+        'actions': None,  # all boolean actions
+    },
+    {
+        'name': 'Member',
+        'description': 'Work on own records in enabled modules',
+        'scope': 'own',
+        'actions': ['view', 'create', 'send'],
+    },
+]
+
+DEFAULT_TENANT_SETTINGS = {
+    'timezone': 'Asia/Kolkata',
+    'currency': 'INR',
+    'date_format': 'DD/MM/YYYY',
+}
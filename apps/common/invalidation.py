@@ -0,0 +1,231 @@
+"""
+Cross-process cache invalidation over PostgreSQL LISTEN/NOTIFY.
+
+Process-local caches (entitlement snapshots, the plan catalog, response
+cache versions in LocMem, branding manifests) are dropped by signals in the
+process that made the change; other workers and nodes would serve stale
+data until a TTL ran out. Such caches register a handler per kind and
+``publish`` their invalidations. After the transaction commits, one
+statement bumps the ``CacheVersion`` counter and sends a ``NOTIFY`` carrying
+the event and the new counter value. A listener thread in every process,
+started on its first request, keeps a dedicated connection in ``LISTEN``
+and runs the handlers for events of other processes, typically within
+milliseconds and without a separate broker.
+
+Notifications arrive in counter order, so a gap means events were missed;
+the listener then runs every handler with ``None`` ("everything"). While the
+LISTEN connection is down, and without PostgreSQL or with
+``INVALIDATION_LISTEN=False`` (poolers in transaction mode do not support
+LISTEN), the listener polls the counter every ``INVALIDATION_POLL_INTERVAL``
+seconds instead and drops everything when it moved.
+
+``INVALIDATION_BUS=True`` turns this on.
+Invalidations published when the process exits between commit and the
+``NOTIFY`` are lost, as are caches changed with ``QuerySet.update()``; TTLs
+still bound both.
+"""
+
+import json
+import os
+import select
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import F
+from apps.common.logger import get_logger
+from apps.common.models import CacheVersion
+
+logger = get_logger(__name__)
+
+CHANNEL = 'cache_invalidation'
+COUNTER = 'invalidation'
+# NOTIFY payloads are limited to 8000 bytes; longer key lists are sent as "everything"
+MAX_PAYLOAD = 7500
+
+_handlers = {}
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def _node():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def register_handler(kind):
+    """Decorator: run ``handler(keys)`` for invalidations of ``kind`` published by other processes."""
+    def decorator(handler):
+        _handlers[kind] = handler
+        return handler
+    return decorator
+
+
+def publish(kind, keys=None):
+    """Have the other processes invalidate ``keys`` (None: everything) of ``kind`` once this transaction commits."""
+    if not settings.INVALIDATION_BUS:
+        return
+    keys = None if keys is None else [str(key) for key in keys]
+    transaction.on_commit(lambda: send(kind, keys))
+
+
+def _payload(kind, keys):
+    event = {'node': _node(), 'kind': kind, 'keys': keys, 'sent': time.time()}
+    payload = json.dumps(event, separators=(',', ':'))
+    if len(payload) > MAX_PAYLOAD:
+        event['keys'] = None
+        payload = json.dumps(event, separators=(',', ':'))
+    return payload
+
+
+def send(kind, keys):
+    """Bump the counter and notify the listeners, in one statement."""
+    try:
+        if connection.vendor == 'postgresql':
+            table = CacheVersion._meta.db_table
+            with connection.cursor() as cursor:
+                # One transaction: the row lock orders counter values and notifications alike
+                cursor.execute(
+                    f'WITH bumped AS ('
+                    f'  INSERT INTO {table} (name, value) VALUES (%s, 1)'
+                    f'  ON CONFLICT (name) DO UPDATE SET value = {table}.value + 1 RETURNING value'
+                    f') SELECT pg_notify(%s, bumped.value || %s) FROM bumped',
+                    [COUNTER, CHANNEL, ':' + _payload(kind, keys)],
+                )
+        elif not CacheVersion.objects.filter(name=COUNTER).update(value=F('value') + 1):
+            CacheVersion.objects.get_or_create(name=COUNTER, defaults={'value': 1})
+    except DatabaseError:
+        logger.warning('Could not publish the %s invalidation', kind, exc_info=True)
+
+
+def current_version():
+    return CacheVersion.objects.filter(name=COUNTER).values_list('value', flat=True).first() or 0
+
+
+def apply(kind, keys):
+    handler = _handlers.get(kind)
+    if handler is None:
+        return
+    try:
+        handler(keys)
+    except Exception:
+        logger.exception('Applying the %s invalidation failed', kind)
+
+
+def apply_all():
+    for kind in list(_handlers):
+        apply(kind, None)
+
+
+class Listener(threading.Thread):
+    """Applies the invalidations of other processes; one per process."""
+
+    def __init__(self):
+        super().__init__(name='cache-invalidation', daemon=True)
+        self.pid = os.getpid()
+        # Last counter value seen; None until the first poll
+        self.version = None
+        self.delay = 1.0
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.is_set():
+                listening = settings.INVALIDATION_LISTEN and connection.vendor == 'postgresql'
+                if listening:
+                    try:
+                        self.listen()
+                    except Exception:
+                        logger.warning('Invalidation listener disconnected; polling until it reconnects',
+                                       exc_info=True)
+                self.poll()
+                interval = settings.INVALIDATION_POLL_INTERVAL
+                self.stopped.wait(min(self.delay, interval) if listening else interval)
+                self.delay = min(self.delay * 2, interval)
+        finally:
+            connection.close()
+
+    def listen(self):
+        raw = connection.get_new_connection(connection.get_connection_params())
+        try:
+            raw.autocommit = True
+            with raw.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+            self.delay = 1.0
+            # Catch up on what was published while not listening
+            self.poll()
+            next_check = time.monotonic() + settings.INVALIDATION_POLL_INTERVAL
+            while not self.stopped.is_set():
+                self.drain(raw, timeout=1.0)
+                if time.monotonic() >= next_check:
+                    self.check(raw)
+                    next_check = time.monotonic() + settings.INVALIDATION_POLL_INTERVAL
+        finally:
+            raw.close()
+
+    def drain(self, raw, timeout):
+        if select.select([raw], [], [], timeout)[0]:
+            raw.poll()
+        while raw.notifies:
+            self.receive(raw.notifies.pop(0).payload)
+
+    def check(self, raw):
+        """Detect a dead connection, and notifications lost without a later one showing the gap."""
+        with raw.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        version = self.read_version()
+        # Notifications of commits the query saw may still be on their way
+        self.drain(raw, timeout=0.1)
+        if version is not None and self.version is not None and version > self.version:
+            self.missed(self.version + 1, version)
+            self.version = version
+
+    def receive(self, payload):
+        version, _, body = payload.partition(':')
+        version = int(version)
+        event = json.loads(body)
+        if self.version is not None and version > self.version + 1:
+            self.missed(self.version + 1, version - 1)
+        elif event['node'] != _node():
+            apply(event['kind'], event['keys'])
+            logger.debug('Applied %s invalidation %.1f ms after commit', event['kind'],
+                         (time.time() - event['sent']) * 1000)
+        if self.version is None or version > self.version:
+            self.version = version
+
+    def missed(self, first, last):
+        logger.warning('Missed cache invalidations %d-%d; dropping all caches', first, last)
+        apply_all()
+
+    def read_version(self):
+        close_old_connections()
+        try:
+            return current_version()
+        except DatabaseError:
+            logger.warning('Could not read the invalidation counter', exc_info=True)
+            connection.close()
+            return None
+
+    def poll(self):
+        version = self.read_version()
+        if version is None:
+            return
+        if self.version is not None and version != self.version:
+            apply_all()
+        self.version = version
+
+    def stop(self):
+        self.stopped.set()
+
+
+def start_listener(**kwargs):
+    """``request_started`` receiver (connected in ``CommonConfig.ready``): start this process's listener."""
+    global _listener
+    if _listener is not None and _listener.pid == os.getpid():
+        return
+    with _listener_lock:
+        # A listener inherited through fork is not running in this process
+        if _listener is None or _listener.pid != os.getpid():
+            _listener = Listener()
+            _listener.start()
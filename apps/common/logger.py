@@ -21,18 +21,39 @@ Examples:
     logger = get_logger(__name__)
 
     def my_view(request):
-        logger.info(f'User {request.user} accessed my_view')
+        logger.info('User %s accessed my_view', request.user)
         try:
             # Your code here
             result = process_data()
-            logger.debug(f'Processed data: {result}')
+            logger.debug('Processed data: %s', result)
             return Response(result)
         except Exception as e:
-            logger.error(f'Error processing data: {str(e)}', exc_info=True)
+            logger.error('Error processing data: %s', e, exc_info=True)
             raise
+
+Pass values as arguments instead of building f-strings: the message is then
+only formatted if a handler actually emits the record.
+
+File output goes through ``QueueListenerHandler``: request threads only put
+the record on a queue, a listener thread formats it (``JsonFormatter``) and
+writes it to the rotating files, whose backups are gzipped
+(``CompressingRotatingFileHandler``).
 """
 
+import atexit
+import copy
+import gzip
+import json
 import logging
+import os
+import queue
+import shutil
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+_exception_formatter = logging.Formatter()
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
 
 
 def get_logger(name):
@@ -52,6 +73,101 @@ def get_logger(name):
     return logging.getLogger(name)
 
 
+class JsonFormatter(logging.Formatter):
+    """
+    Format records as one JSON object per line.
+
+    Values passed through ``extra`` are added as top-level keys; values that
+    are not JSON serialisable are written with ``str()``.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'function': record.funcName,
+            'line': record.lineno,
+            'process': record.process,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc_info'] = record.exc_text
+        if record.stack_info:
+            entry['stack_info'] = self.formatStack(record.stack_info)
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        return json.dumps(entry, default=str)
+
+
+class CompressingRotatingFileHandler(RotatingFileHandler):
+    """``RotatingFileHandler`` that gzips the backups (``info.log.1.gz`` ...)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.namer = self._gzip_name
+        self.rotator = self._gzip_rotate
+
+    @staticmethod
+    def _gzip_name(name):
+        return f'{name}.gz'
+
+    @staticmethod
+    def _gzip_rotate(source, dest):
+        with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(source)
+
+
+class QueueListenerHandler(QueueHandler):
+    """
+    Hand records to a background thread that emits them to ``handlers``.
+
+    Used from ``LOGGING`` as::
+
+        'queue': {
+            '()': 'apps.common.logger.QueueListenerHandler',
+            'handlers': ['cfg://handlers.file_info', 'cfg://handlers.file_error'],
+        }
+
+    ``dictConfig`` configures handlers in name order, so the queue handler
+    needs a name that sorts after its targets. Each target keeps its own
+    level and filters.
+    """
+
+    def __init__(self, handlers, respect_handler_level=True):
+        super().__init__(queue.SimpleQueue())
+        # Index the dictConfig ConvertingList so cfg:// references are resolved
+        targets = [handlers[i] for i in range(len(handlers))]
+        for target in targets:
+            if not isinstance(target, logging.Handler):
+                raise ValueError(f'Queue target {target!r} is not a configured handler')
+        self.listener = QueueListener(self.queue, *targets, respect_handler_level=respect_handler_level)
+        self.listener.start()
+        atexit.register(self.close)
+
+    def prepare(self, record):
+        # Resolve the arguments now, they may change once the call returns;
+        # the target handlers still apply their own formatters.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def close(self):
+        # Drains the queue before the target handlers are closed
+        if self.listener._thread is not None:
+            self.listener.stop()
+        super().close()
+
+
 # Pre-configured loggers for common use cases
 django_logger = logging.getLogger('django')
 db_logger = logging.getLogger('django.db.backends')
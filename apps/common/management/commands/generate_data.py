@@ -0,0 +1,43 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from apps.common.synthetic import generate
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic tenants, users, roles, subscriptions and invoices for scale testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tenants', type=int, default=100)
+        parser.add_argument('--users', type=int, default=10000, help='Users in total, spread unevenly over tenants')
+        parser.add_argument('--roles', type=int, default=5, help='Roles per tenant')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='gen', help='Slug prefix of generated tenants and plans')
+        parser.add_argument('--anchor', help='"Today" of the generated history (YYYY-MM-DD); default today')
+        parser.add_argument('--history-days', type=int, default=730)
+        parser.add_argument('--batch-size', type=int, default=50000)
+        parser.add_argument('--skip-rollups', action='store_true', help='Do not rebuild the revenue rollups')
+
+    def handle(self, *args, **options):
+        anchor = None
+        if options['anchor']:
+            try:
+                anchor = datetime.strptime(options['anchor'], '%Y-%m-%d').replace(tzinfo=dt_timezone.utc)
+            except ValueError:
+                raise CommandError('--anchor must be YYYY-MM-DD')
+        try:
+            counts = generate(
+                tenants=options['tenants'],
+                users=options['users'],
+                roles_per_tenant=options['roles'],
+                seed=options['seed'],
+                prefix=options['prefix'],
+                anchor=anchor,
+                history_days=options['history_days'],
+                batch_size=options['batch_size'],
+                rebuild_revenue=not options['skip_rollups'],
+                progress=self.stdout.write,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f'Generated {counts}'))
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.common import query_stats
+
+
+class Command(BaseCommand):
+    help = 'Report SQL fingerprints by total time per view, from the workers\' files in METRICS_DIR'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--view', help='Only this view name (e.g. user-list)')
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--slow', action='store_true', help='Also list the slowest query samples')
+
+    def handle(self, *args, **options):
+        if not settings.METRICS_DIR:
+            self.stderr.write('METRICS_DIR is not set; the workers\' statistics are not shared')
+            return
+        report = query_stats.report(view=options['view'], limit=options['limit'], from_files_only=True)
+        if not report['queries']:
+            self.stdout.write('No queries recorded')
+        for row in report['queries']:
+            self.stdout.write(
+                f"{row['total_ms']:>12.1f} ms {row['count']:>8} x  mean {row['mean_ms']:.2f}  "
+                f"p95 <={row['p95_ms']:.2f}  {row['view']}\n    {row['fingerprint'][:300]}"
+            )
+        if options['slow']:
+            self.stdout.write('\nSlowest samples:')
+            for sample in report['slow']:
+                self.stdout.write(
+                    f"{sample['duration_ms']:>10.1f} ms  {sample['time']}  {sample['view']}  "
+                    f"tenant={sample['tenant_id']}\n    {sample['sql'][:300]}"
+                )
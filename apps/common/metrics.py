@@ -0,0 +1,227 @@
+"""
+Per-route request metrics in the Prometheus text format.
+
+``MetricsMiddleware`` (``apps/common/middleware.py``) records, per
+method/route/status:
+
+* request latency (histogram)
+* database queries per request (histogram) and database time (counter),
+  measured by an ``execute_wrapper`` installed on every connection
+* response size (histogram)
+
+Each thread aggregates into its own dict, so recording takes no lock; a
+scrape merges the per-thread dicts. Series are plain lists of numbers
+(sums followed by bucket counts) so they can be merged by adding them up.
+
+With several worker processes, set ``METRICS_DIR`` to a directory shared by
+them: every process writes its totals to ``metrics-<pid>.json`` there at
+most every ``METRICS_FLUSH_INTERVAL`` seconds (and on exit), and ``/metrics``
+adds up the files of all processes. Files of stopped processes are kept so
+counters never go backwards; clear the directory when deploying.
+"""
+
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from concurrent.futures import Future, wait
+
+from django.conf import settings
+from apps.common.tasks import run_in_background
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000)
+
+# Layout of one series
+COUNT, LATENCY_SUM, QUERIES_SUM, DB_SECONDS_SUM, SIZE_SUM = range(5)
+LATENCY_AT = 5
+QUERIES_AT = LATENCY_AT + len(LATENCY_BUCKETS) + 1
+SIZE_AT = QUERIES_AT + len(QUERY_BUCKETS) + 1
+WIDTH = SIZE_AT + len(SIZE_BUCKETS) + 1
+
+_local = threading.local()
+# One {(method, route, status): series} dict per thread that recorded a request
+_stores = []
+_stores_lock = threading.Lock()
+_next_flush = 0.0
+# Other per-process aggregates written along with the metrics
+_flushers = []
+# Flushes queued on the background pool and not finished yet
+_pending = set()
+
+
+def _thread_store():
+    store = getattr(_local, 'store', None)
+    if store is None:
+        store = _local.store = {}
+        with _stores_lock:
+            _stores.append(store)
+    return store
+
+
+def observe(method, route, status, seconds, queries, db_seconds, size):
+    """Record one request in the calling thread's aggregate."""
+    store = getattr(_local, 'store', None) or _thread_store()
+    key = (method, route, str(status))
+    series = store.get(key)
+    if series is None:
+        series = store[key] = [0] * WIDTH
+    series[COUNT] += 1
+    series[LATENCY_SUM] += seconds
+    series[QUERIES_SUM] += queries
+    series[DB_SECONDS_SUM] += db_seconds
+    series[SIZE_SUM] += size
+    series[LATENCY_AT + bisect_left(LATENCY_BUCKETS, seconds)] += 1
+    series[QUERIES_AT + bisect_left(QUERY_BUCKETS, queries)] += 1
+    series[SIZE_AT + bisect_left(SIZE_BUCKETS, size)] += 1
+    if settings.METRICS_DIR:
+        _maybe_flush()
+
+
+def _merge(into, key, series):
+    target = into.get(key)
+    if target is None:
+        into[key] = list(series)
+    else:
+        for i, value in enumerate(series):
+            target[i] += value
+
+
+def snapshot():
+    """Totals of this process: ``{(method, route, status): series}``."""
+    with _stores_lock:
+        stores = list(_stores)
+    totals = {}
+    for store in stores:
+        # dict.items() copied in one step; the owner thread may be adding keys
+        for key, series in list(store.items()):
+            _merge(totals, key, series)
+    return totals
+
+
+def write_process_file(prefix, data):
+    """Atomically write ``data`` as ``<prefix>-<pid>.json`` in ``METRICS_DIR``."""
+    directory = settings.METRICS_DIR
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=f'.{prefix}-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, os.path.join(directory, f'{prefix}-{os.getpid()}.json'))
+
+
+def read_process_files(prefix, include_own=False):
+    """Yield the data of every ``<prefix>-<pid>.json`` file in ``METRICS_DIR``."""
+    directory = settings.METRICS_DIR
+    if not directory or not os.path.isdir(directory):
+        return
+    own = f'{prefix}-{os.getpid()}.json'
+    for name in os.listdir(directory):
+        if not (name.startswith(f'{prefix}-') and name.endswith('.json')):
+            continue
+        if name == own and not include_own:
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                yield json.load(f)
+        except (OSError, ValueError):
+            continue
+
+
+def register_flusher(fn):
+    """Call ``fn`` on every flush, e.g. to write its own ``write_process_file``."""
+    _flushers.append(fn)
+    return fn
+
+
+def flush():
+    """Write this process's totals to ``METRICS_DIR``."""
+    if not settings.METRICS_DIR:
+        return
+    write_process_file('metrics', [[list(key), series] for key, series in snapshot().items()])
+    for fn in _flushers:
+        fn()
+
+
+def _maybe_flush():
+    global _next_flush
+    now = time.monotonic()
+    if now < _next_flush:
+        return
+    # Racing threads may both queue a flush; that is harmless
+    _next_flush = now + settings.METRICS_FLUSH_INTERVAL
+    future = run_in_background(flush)
+    if isinstance(future, Future):
+        _pending.add(future)
+        future.add_done_callback(_pending.discard)
+
+
+def wait_for_flushes(timeout=None):
+    """Wait for the background flushes queued so far, e.g. before ``METRICS_DIR`` is removed."""
+    wait(list(_pending), timeout)
+
+
+@atexit.register
+def _flush_at_exit():
+    if settings.configured and settings.METRICS_DIR:
+        flush()
+
+
+def collect():
+    """Totals of this process plus, with ``METRICS_DIR``, all other processes."""
+    totals = snapshot()
+    for data in read_process_files('metrics'):
+        for key, series in data:
+            if len(series) == WIDTH:
+                _merge(totals, tuple(key), series)
+    return totals
+
+
+def reset():
+    """Drop all recorded data of this process (used by tests)."""
+    with _stores_lock:
+        for store in _stores:
+            store.clear()
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _histogram(lines, name, help_text, totals, at, buckets, sum_index):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for (method, route, status), series in totals:
+        labels = f'method="{_escape(method)}",route="{_escape(route)}",status="{status}"'
+        cumulative = 0
+        for i, bound in enumerate(buckets):
+            cumulative += series[at + i]
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {series[COUNT]}')
+        lines.append(f'{name}_sum{{{labels}}} {_format_number(series[sum_index])}')
+        lines.append(f'{name}_count{{{labels}}} {series[COUNT]}')
+
+
+def render(totals):
+    """Render ``collect()`` output in the Prometheus text exposition format."""
+    ordered = sorted(totals.items())
+    lines = []
+    _histogram(lines, 'http_request_duration_seconds', 'Request latency.',
+               ordered, LATENCY_AT, LATENCY_BUCKETS, LATENCY_SUM)
+    _histogram(lines, 'http_request_db_queries', 'Database queries per request.',
+               ordered, QUERIES_AT, QUERY_BUCKETS, QUERIES_SUM)
+    lines.append('# HELP http_request_db_duration_seconds_total Time spent in database queries.')
+    lines.append('# TYPE http_request_db_duration_seconds_total counter')
+    for (method, route, status), series in ordered:
+        labels = f'method="{_escape(method)}",route="{_escape(route)}",status="{status}"'
+        lines.append(f'http_request_db_duration_seconds_total{{{labels}}} {_format_number(series[DB_SECONDS_SUM])}')
+    _histogram(lines, 'http_response_size_bytes', 'Response body size.',
+               ordered, SIZE_AT, SIZE_BUCKETS, SIZE_SUM)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,106 @@
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from apps.common import metrics, query_stats
+
+KNOWN_METHODS = frozenset(['GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'])
+
+
+class QueryTimer:
+    """
+    ``execute_wrapper`` that counts queries and the time spent in them and,
+    when given a request, records them in ``apps/common/query_stats.py``.
+    """
+
+    __slots__ = ('queries', 'seconds', 'request')
+
+    def __init__(self, request=None):
+        self.queries = 0
+        self.seconds = 0.0
+        self.request = request
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.seconds += elapsed
+            if self.request is not None:
+                query_stats.record(self.request, sql, elapsed)
+
+
+# Timer of the request being served. A context variable rather than a
+# per-connection wrapper because under ASGI the ORM runs on worker threads,
+# each with its own connection, which inherit the request's context.
+_current_timer = ContextVar('query_timer', default=None)
+
+
+def time_queries(execute, sql, params, many, context):
+    """``execute_wrapper`` on every connection; feeds the current request's ``QueryTimer``."""
+    timer = _current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """``connection_created`` receiver, connected in ``CommonConfig.ready``."""
+    if time_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_queries)
+
+
+class MetricsMiddleware:
+    """
+    Record latency, database cost and response size per route
+    (see ``apps/common/metrics.py``). Keep it first in ``MIDDLEWARE``.
+
+    Routes are labelled by URL pattern, not path, and requests that match no
+    pattern share one label, so the number of series stays bounded.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = QueryTimer(request if settings.QUERY_STATS_ENABLED else None)
+        token = _current_timer.set(timer)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_timer.reset(token)
+        self.observe(request, response, timer, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        timer = QueryTimer(request if settings.QUERY_STATS_ENABLED else None)
+        token = _current_timer.set(timer)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_timer.reset(token)
+        self.observe(request, response, timer, time.perf_counter() - start)
+        return response
+
+    def observe(self, request, response, timer, elapsed):
+        match = request.resolver_match
+        route = match.route if match is not None else '<unmatched>'
+        method = request.method if request.method in KNOWN_METHODS else 'OTHER'
+        if response.streaming:
+            # File downloads set it; other streams are not buffered to measure them
+            size = int(response.get('Content-Length') or 0)
+        else:
+            size = len(response.content)
+        metrics.observe(method, route, response.status_code, elapsed, timer.queries, timer.seconds, size)
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.14 on 2026-10-19 03:41
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('tenants', '0006_tenant_trial_ends_at_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=500)),
+                ('view_name', models.CharField(blank=True, default='', max_length=200)),
+                ('status_code', models.IntegerField()),
+                ('duration_ms', models.FloatField()),
+                ('peak_memory_kb', models.FloatField(default=0, help_text='Peak traced memory while the request ran')),
+                ('trigger', models.CharField(choices=[('header', 'Requested by header'), ('sample', 'Sampled')], max_length=10)),
+                ('profile', models.FileField(help_text='pstats file, open with pstats or snakeviz', upload_to='profiles/')),
+                ('top_functions', models.JSONField(default=list, help_text='Functions with the highest cumulative time')),
+                ('top_allocations', models.JSONField(default=list, help_text='Source lines that allocated the most memory')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('tenant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='request_profiles', to='tenants.tenant')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='request_profiles', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'request_profiles',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+import uuid
+
+from django.conf import settings
+from django.db import models
+from apps.tenants.models import Tenant
+
+
+class RequestProfile(models.Model):
+    """cProfile and tracemalloc capture of one request (apps/common/profiling.py)"""
+    TRIGGER_CHOICES = [
+        ('header', 'Requested by header'),
+        ('sample', 'Sampled'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    view_name = models.CharField(max_length=200, blank=True, default='')
+    status_code = models.IntegerField()
+    duration_ms = models.FloatField()
+    peak_memory_kb = models.FloatField(default=0, help_text="Peak traced memory while the request ran")
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                             related_name='request_profiles')
+    tenant = models.ForeignKey(Tenant, on_delete=models.SET_NULL, null=True, blank=True,
+                               related_name='request_profiles')
+    profile = models.FileField(upload_to='profiles/', help_text="pstats file, open with pstats or snakeviz")
+    top_functions = models.JSONField(default=list, help_text="Functions with the highest cumulative time")
+    top_allocations = models.JSONField(default=list, help_text="Source lines that allocated the most memory")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'request_profiles'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+
+class CacheVersion(models.Model):
+    """Counter bumped by every published cache invalidation (apps/common/invalidation.py)"""
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'cache_versions'
+
+    def __str__(self):
+        return f"{self.name}={self.value}"
@@ -130,3 +130,32 @@ class IsTenantMember(BasePermission):
         return request.user and request.user.is_authenticated and (
             request.user.tenant is not None or request.user.is_super_admin
         )
+
+
+class HasModuleEntitlement(BasePermission):
+    """
+    Permission class for module features.
+    Requires an active subscription whose plan and tenant both include the
+    view's `required_module` (e.g. required_module = 'crm'). Views without
+    `required_module` only require an active subscription.
+    """
+    message = 'Your subscription does not include this module.'
+
+    def has_permission(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            return False
+
+        if request.user.is_super_admin:
+            return True
+
+        if not request.user.tenant_id:
+            return False
+
+        from apps.billing.entitlements import get_entitlements
+        entitlements = get_entitlements(request.user.tenant_id)
+        request.entitlements = entitlements
+
+        module = getattr(view, 'required_module', None)
+        if module is None:
+            return entitlements.is_active()
+        return entitlements.allows(module)
@@ -0,0 +1,229 @@
+"""
+On-demand request profiling.
+
+``ProfilingMiddleware`` runs a request under ``cProfile`` and ``tracemalloc``
+when
+
+* a super admin sends ``X-Profile: 1`` (session or JWT authentication), or
+* the request is picked at random with probability ``PROFILING_SAMPLE_RATE``
+  (0 disables sampling).
+
+Only one request per process is profiled at a time because tracemalloc is
+process wide; allocations made concurrently by other threads are still
+included in the allocation sites. The response carries ``X-Profile-Id``.
+Under ASGI the call profile covers the event loop thread only: sync views
+and ORM calls run on worker threads and show up as time spent waiting.
+
+The pstats file, the functions with the highest cumulative time and the top
+allocation sites are stored as ``RequestProfile`` in the background once the
+response is returned. Only the newest ``PROFILING_MAX_PROFILES`` are kept.
+Super admins list and download them through ``/api/profiles/``.
+"""
+
+import cProfile
+import marshal
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils.functional import SimpleLazyObject, empty
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from apps.common.logger import get_logger
+from apps.common.models import RequestProfile
+from apps.common.tasks import run_in_background
+from apps.tenants.cleanup import schedule_sweep
+from apps.tenants.models import PendingFileDeletion
+
+logger = get_logger(__name__)
+
+PROFILE_HEADER = 'X-Profile'
+
+_busy = threading.Lock()
+_allocation_filters = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+)
+
+
+def _resolved_user(request):
+    user = getattr(request, 'user', None)
+    # Do not load a lazy session user just for this
+    if isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+        return None
+    return user if user is not None and user.is_authenticated else None
+
+
+def header_user(request):
+    """The super admin asking for a profile through the header, or None."""
+    if request.headers.get(PROFILE_HEADER) != '1':
+        return None
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        try:
+            result = JWTAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return None
+        user = result[0] if result else None
+    return user if user is not None and user.is_super_admin else None
+
+
+def top_functions(profiler, limit):
+    stats = pstats.Stats(profiler)
+    stats.sort_stats('cumulative')
+    rows = []
+    for func in stats.fcn_list[:limit]:
+        _, calls, total, cumulative, _ = stats.stats[func]
+        filename, line, name = func
+        rows.append({
+            'function': f'{filename}:{line}({name})',
+            'calls': calls,
+            'total_ms': round(total * 1000, 3),
+            'cumulative_ms': round(cumulative * 1000, 3),
+        })
+    return rows
+
+
+def top_allocations(snapshot, limit):
+    stats = snapshot.filter_traces(_allocation_filters).statistics('lineno')
+    return [
+        {
+            'site': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}',
+            'size_kb': round(stat.size / 1024, 1),
+            'count': stat.count,
+        }
+        for stat in stats[:limit]
+    ]
+
+
+def prune_profiles(keep=None):
+    """Delete all but the newest ``keep`` profiles; their files go to the deletion queue."""
+    keep = settings.PROFILING_MAX_PROFILES if keep is None else keep
+    stale = list(RequestProfile.objects.values_list('id', 'profile')[keep:])
+    if not stale:
+        return 0
+    with transaction.atomic():
+        RequestProfile.objects.filter(id__in=[profile_id for profile_id, _ in stale]).delete()
+        PendingFileDeletion.objects.bulk_create([PendingFileDeletion(name=name) for _, name in stale if name])
+        transaction.on_commit(schedule_sweep)
+    return len(stale)
+
+
+def save_profile(profile_id, details, profiler, snapshot):
+    """Store one captured request (runs in the background)."""
+    limit = settings.PROFILING_TOP_N
+    profiler.create_stats()
+    # pstats.Stats takes the stats dict over, so serialise it first
+    data = marshal.dumps(profiler.stats)
+    profile = RequestProfile(
+        id=profile_id,
+        top_functions=top_functions(profiler, limit),
+        top_allocations=top_allocations(snapshot, limit),
+        **details,
+    )
+    profile.profile.save(f'{profile_id}.prof', ContentFile(data), save=False)
+    profile.save()
+    prune_profiles()
+    return profile
+
+
+class ProfilingMiddleware:
+    """See the module docstring. Place it after ``AuthenticationMiddleware``."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        user = header_user(request)
+        trigger = self.trigger(user)
+        if trigger is None or not _busy.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            state = self.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                self.stop(state)
+            return self.finish(request, response, trigger, user, state)
+        finally:
+            _busy.release()
+
+    async def __acall__(self, request):
+        user = None
+        if request.headers.get(PROFILE_HEADER) == '1':
+            # Authenticating may load the session or the user
+            user = await sync_to_async(header_user)(request)
+        trigger = self.trigger(user)
+        if trigger is None or not _busy.acquire(blocking=False):
+            return await self.get_response(request)
+        try:
+            state = self.start()
+            try:
+                response = await self.get_response(request)
+            finally:
+                self.stop(state)
+            # Saving may run eagerly (BACKGROUND_TASKS_EAGER) and query
+            return await sync_to_async(self.finish)(request, response, trigger, user, state)
+        finally:
+            _busy.release()
+
+    def trigger(self, user):
+        if user is not None:
+            return 'header'
+        if settings.PROFILING_SAMPLE_RATE and random.random() < settings.PROFILING_SAMPLE_RATE:
+            return 'sample'
+        return None
+
+    def start(self):
+        state = {'started_tracing': not tracemalloc.is_tracing(), 'profiler': cProfile.Profile()}
+        if state['started_tracing']:
+            tracemalloc.start()
+        else:
+            tracemalloc.reset_peak()
+        state['start'] = time.perf_counter()
+        state['profiler'].enable()
+        return state
+
+    def stop(self, state):
+        state['profiler'].disable()
+        state['elapsed'] = time.perf_counter() - state['start']
+        state['snapshot'] = tracemalloc.take_snapshot()
+        state['peak'] = tracemalloc.get_traced_memory()[1]
+        if state['started_tracing']:
+            tracemalloc.stop()
+
+    def finish(self, request, response, trigger, user, state):
+        elapsed = state['elapsed']
+        user = user or _resolved_user(request)
+        match = request.resolver_match
+        profile_id = uuid.uuid4()
+        details = {
+            'method': request.method,
+            'path': request.path[:500],
+            'view_name': (match.view_name or match.route) if match else '',
+            'status_code': response.status_code,
+            'duration_ms': round(elapsed * 1000, 3),
+            'peak_memory_kb': round(state['peak'] / 1024, 1),
+            'trigger': trigger,
+            'user_id': user.pk if user else None,
+            'tenant_id': getattr(user, 'tenant_id', None),
+        }
+        run_in_background(save_profile, profile_id, details, state['profiler'], state['snapshot'])
+        response['X-Profile-Id'] = str(profile_id)
+        logger.info('Profiled %s %s in %.1f ms (%s)', request.method, request.path, elapsed * 1000, profile_id)
+        return response
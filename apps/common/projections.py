@@ -0,0 +1,283 @@
+"""
+Projection-based read serialization for list endpoints.
+
+``Projection(SerializerClass)`` compiles a ``ModelSerializer`` into the
+``values_list()`` columns its readable fields read plus one converter per
+field (UUID, datetime, Decimal, file URL, ...), and builds the serializer's
+output from the value tuples: no model instances and no per-field
+``to_representation`` dispatch. Fields that are not a plain column are given
+as keyword arguments:
+
+* ``Column(path, default=...)`` for a value read from another column, e.g. an
+  annotation or a field across a one-to-one;
+* ``Related(loader, default)`` for values loaded for a whole page at once,
+  e.g. nested serializers or counts. ``loader(keys, request)`` gets the
+  primary keys of the page and returns ``{key: value}``.
+
+``ProjectedListMixin`` serves a viewset's ``list`` from its
+``list_projection`` when the response is rendered by
+``PreEncodedJSONRenderer``: the page is filtered and paginated as usual, and
+its rows are JSON-encoded once (see ``apps/common/renderers.py``). Other
+renderers (the browsable API) go through the serializer.
+
+Tests compare each projection with its serializer, so a field added to a
+serializer is covered as soon as the projection can map it; fields it cannot
+map raise ``ImproperlyConfigured`` until given a ``Column`` or ``Related``.
+"""
+
+import decimal
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+from django.utils import timezone
+from rest_framework import fields, relations, serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from apps.common.renderers import PreEncoded, PreEncodedJSONRenderer, encode
+
+
+# Column default that leaves the key out, as DRF does for a read-only field
+# whose source crosses a null relation
+OMIT = object()
+
+
+class Column:
+    """Field read from the column ``path``; ``NULL`` becomes ``default``."""
+
+    def __init__(self, path, converter=None, default=None):
+        self.path = path
+        # converter(context) returns the function applied to non-null values, or None
+        self.converter = converter
+        self.default = default
+
+
+class Related:
+    """Field loaded per page by ``loader(keys, request)``; missing keys get ``default``."""
+
+    def __init__(self, loader, default=None):
+        self.loader = loader
+        self.default = default
+
+
+def file_url(model, path):
+    """``Column`` with the absolute URL of the file in ``model.<path>`` (as ``FileField`` renders it)."""
+    return Column(path, _file_url_converter(_model_field(model, path).storage))
+
+
+def _model_field(model, path):
+    *relations, name = path.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+def _file_url_converter(storage):
+    def build(context):
+        request = context['request']
+
+        def convert(name):
+            if not name:
+                return None
+            url = storage.url(name)
+            return request.build_absolute_uri(url) if request is not None else url
+        return convert
+    return build
+
+
+def _datetime_converter(field):
+    def build(context):
+        if getattr(field, 'format', api_settings.DATETIME_FORMAT) != fields.ISO_8601:
+            return field.to_representation
+        tz = field.timezone if hasattr(field, 'timezone') else context['timezone']
+        if tz is None:
+            return field.to_representation
+
+        def convert(value):
+            text = value.astimezone(tz).isoformat()
+            return text[:-6] + 'Z' if text.endswith('+00:00') else text
+        return convert
+    return build
+
+
+def _decimal_converter(field):
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if not coerce_to_string or field.localize or field.normalize_output or field.decimal_places is None:
+        return lambda context: field.to_representation
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+
+    def build(context):
+        # Like DecimalField.quantize, in the decimal context of the request
+        quantize_context = decimal.getcontext().copy()
+        if field.max_digits is not None:
+            quantize_context.prec = field.max_digits
+        rounding = field.rounding
+        return lambda value: format(value.quantize(exponent, rounding=rounding, context=quantize_context), 'f')
+    return build
+
+
+def _iso_converter(field, setting):
+    if getattr(field, 'format', setting) != fields.ISO_8601:
+        return lambda context: field.to_representation
+    return lambda context: _isoformat
+
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+def _to_str(context):
+    return str
+
+
+def _passthrough(context):
+    return None
+
+
+def _column_for(name, field, model):
+    """The ``Column`` rendering ``field`` as the serializer does."""
+    if isinstance(field, (serializers.BaseSerializer, relations.ManyRelatedField, fields.SerializerMethodField)) \
+            or field.source == '*':
+        raise ImproperlyConfigured(f'Projection of {model.__name__}: give "{name}" a Column or Related')
+    path = '__'.join(field.source_attrs)
+    column = _column_for_path(field, model, path)
+    if len(field.source_attrs) > 1 and not field.allow_null and field.default is fields.empty \
+            and not _model_field(model, path).null:
+        # A NULL here means the relation is null: DRF skips the field
+        column.default = OMIT
+    return column
+
+
+def _column_for_path(field, model, path):
+    if isinstance(field, relations.PrimaryKeyRelatedField):
+        target = _model_field(model, path).target_field
+        return Column(path, _to_str if isinstance(target, models.UUIDField) else _passthrough)
+    if isinstance(field, fields.FileField):
+        if not getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+            return Column(path, lambda context: lambda name: name or None)
+        return file_url(model, path)
+    if isinstance(field, fields.DateTimeField):
+        return Column(path, _datetime_converter(field))
+    if isinstance(field, fields.DateField):
+        return Column(path, _iso_converter(field, api_settings.DATE_FORMAT))
+    if isinstance(field, fields.DecimalField):
+        return Column(path, _decimal_converter(field))
+    if isinstance(field, fields.UUIDField) and field.uuid_format == 'hex_verbose':
+        return Column(path, _to_str)
+    if isinstance(field, fields.ChoiceField) and not isinstance(field, fields.MultipleChoiceField) \
+            and all(key == value for key, value in field.choice_strings_to_values.items()):
+        # String choices render as stored
+        return Column(path, _passthrough)
+    if isinstance(field, (fields.CharField, fields.IntegerField, fields.BooleanField, fields.ReadOnlyField)) \
+            or (isinstance(field, fields.JSONField) and not field.binary):
+        return Column(path, _passthrough)
+    return Column(path, lambda context: field.to_representation)
+
+
+class Projection:
+    """Read-only rendering of ``serializer_class`` from ``values_list()`` rows."""
+
+    def __init__(self, serializer_class, **overrides):
+        self.serializer_class = serializer_class
+        self.overrides = overrides
+        self._plan = None
+
+    def _compile(self):
+        # Lazily: building serializer fields needs the app registry
+        if self._plan is not None:
+            return self._plan
+        serializer = self.serializer_class()
+        model = serializer.Meta.model
+        unknown = set(self.overrides) - set(serializer.fields)
+        if unknown:
+            raise ImproperlyConfigured(f'Projection of {model.__name__}: no serializer fields {sorted(unknown)}')
+        paths = []
+        plan = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            spec = self.overrides.get(name) or _column_for(name, field, model)
+            if isinstance(spec, Related):
+                plan.append((name, None, spec))
+                continue
+            if spec.path not in paths:
+                paths.append(spec.path)
+            # Index 0 of every row is the primary key
+            plan.append((name, paths.index(spec.path) + 1, spec))
+        self._plan = tuple(paths), plan
+        return self._plan
+
+    @property
+    def paths(self):
+        return self._compile()[0]
+
+    def values(self, queryset):
+        """``queryset`` as the rows ``serialize`` reads."""
+        return queryset.values_list('pk', *self.paths)
+
+    def serialize(self, rows, request=None):
+        """Serializer output (list of dicts) for ``rows`` of ``values()``."""
+        _, plan = self._compile()
+        rows = rows if isinstance(rows, list) else list(rows)
+        context = {
+            'request': request,
+            'timezone': timezone.get_current_timezone() if settings.USE_TZ else None,
+        }
+        keys = [row[0] for row in rows]
+        steps = []
+        for name, index, spec in plan:
+            if index is None:
+                loaded = spec.loader(keys, request) if keys else {}
+                steps.append((name, None, loaded, spec.default))
+            else:
+                convert = spec.converter(context) if spec.converter else None
+                steps.append((name, index, convert, spec.default))
+
+        items = []
+        for row in rows:
+            item = {}
+            for name, index, convert, default in steps:
+                if index is None:
+                    item[name] = convert.get(row[0], default)
+                    continue
+                value = row[index]
+                if value is None:
+                    if default is not OMIT:
+                        item[name] = default
+                elif convert is None:
+                    item[name] = value
+                else:
+                    item[name] = convert(value)
+            items.append(item)
+        return items
+
+    def keyed(self, queryset, request=None):
+        """``{pk: item}`` in the order of ``queryset``."""
+        rows = list(self.values(queryset))
+        return dict(zip((row[0] for row in rows), self.serialize(rows, request)))
+
+    def grouped(self, queryset, by, request=None):
+        """``{value of by: [item, ...]}``, e.g. nested items keyed by their parent."""
+        rows = list(queryset.values_list('pk', *self.paths, by))
+        groups = {}
+        for row, item in zip(rows, self.serialize(rows, request)):
+            groups.setdefault(row[-1], []).append(item)
+        return groups
+
+    def encode(self, rows, request=None):
+        return PreEncoded(encode(self.serialize(rows, request)))
+
+
+class ProjectedListMixin:
+    """Serve ``list`` from ``list_projection`` for ``PreEncodedJSONRenderer`` responses."""
+
+    list_projection = None
+
+    def list(self, request, *args, **kwargs):
+        if self.list_projection is None or not isinstance(request.accepted_renderer, PreEncodedJSONRenderer):
+            return super().list(request, *args, **kwargs)
+        queryset = self.list_projection.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.list_projection.encode(page, request))
+        return Response(self.list_projection.encode(queryset, request))
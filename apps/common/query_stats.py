@@ -0,0 +1,202 @@
+"""
+Per-view SQL statistics by query fingerprint.
+
+``MetricsMiddleware`` passes every query of a request to ``record``. The SQL
+is reduced to a fingerprint (literals and placeholders replaced by ``?``,
+``IN`` lists collapsed) and count, total time and a latency histogram (for
+p95) are kept per ``(view, fingerprint)``. Queries slower than
+``QUERY_STATS_SLOW_MS`` are also kept as samples with their view, tenant and
+SQL. Parameters are never stored, so samples hold no user data.
+
+Like ``apps/common/metrics.py``, each thread aggregates into its own dict
+and, with ``METRICS_DIR``, each process writes its data to
+``querystats-<pid>.json`` so reports cover all workers. Reports are served by
+``GET /api/query-stats/`` and the ``query_report`` command.
+"""
+
+import re
+import threading
+from bisect import bisect_left
+from collections import deque
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject, empty
+from apps.common import metrics
+
+# 0.1 ms doubling up to ~13 s
+DURATION_BUCKETS = tuple(0.0001 * 2 ** i for i in range(18))
+
+# Layout of one series
+COUNT, SECONDS = 0, 1
+BUCKETS_AT = 2
+WIDTH = BUCKETS_AT + len(DURATION_BUCKETS) + 1
+
+# Distinct (view, fingerprint) pairs kept per thread; later ones are folded into OVERFLOW
+MAX_SERIES = 5000
+OVERFLOW = '<other>'
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|%\(\w+\)s')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+_local = threading.local()
+_stores = []
+_stores_lock = threading.Lock()
+_samples = deque(maxlen=settings.QUERY_STATS_SAMPLES)
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(sql):
+    """Normalize ``sql`` so that queries differing only in values are equal."""
+    sql = _STRING.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def _thread_store():
+    store = getattr(_local, 'store', None)
+    if store is None:
+        store = _local.store = {}
+        with _stores_lock:
+            _stores.append(store)
+    return store
+
+
+def _tenant_id(request):
+    user = getattr(request, 'user', None)
+    # Loading a lazy session user would run queries from inside the wrapper
+    if isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+        return None
+    return getattr(user, 'tenant_id', None)
+
+
+def request_view(request):
+    match = request.resolver_match
+    if match is None:
+        return '<middleware>'
+    return match.view_name or match.route
+
+
+def record(request, sql, seconds):
+    """Record one query run while serving ``request``."""
+    store = getattr(_local, 'store', None) or _thread_store()
+    view = request_view(request)
+    shape = fingerprint(sql)
+    key = (view, shape)
+    series = store.get(key)
+    if series is None:
+        if len(store) >= MAX_SERIES:
+            key = (view, OVERFLOW)
+            series = store.get(key)
+        if series is None:
+            series = store[key] = [0] * WIDTH
+    series[COUNT] += 1
+    series[SECONDS] += seconds
+    series[BUCKETS_AT + bisect_left(DURATION_BUCKETS, seconds)] += 1
+
+    if seconds * 1000 >= settings.QUERY_STATS_SLOW_MS:
+        tenant_id = _tenant_id(request)
+        _samples.append({
+            'time': timezone.now().isoformat(),
+            'view': view,
+            'tenant_id': str(tenant_id) if tenant_id else None,
+            'duration_ms': round(seconds * 1000, 3),
+            'fingerprint': shape,
+            'sql': sql[:2000],
+        })
+
+
+def _merge(into, key, series):
+    target = into.get(key)
+    if target is None:
+        into[key] = list(series)
+    else:
+        for i, value in enumerate(series):
+            target[i] += value
+
+
+def snapshot():
+    """Data of this process: ``({(view, fingerprint): series}, [sample, ...])``."""
+    with _stores_lock:
+        stores = list(_stores)
+    totals = {}
+    for store in stores:
+        for key, series in list(store.items()):
+            _merge(totals, key, series)
+    return totals, list(_samples)
+
+
+@metrics.register_flusher
+def flush():
+    totals, samples = snapshot()
+    metrics.write_process_file('querystats', {
+        'series': [[list(key), series] for key, series in totals.items()],
+        'samples': samples,
+    })
+
+
+def collect(from_files_only=False):
+    """
+    Data of this process plus, with ``METRICS_DIR``, all other processes.
+    ``from_files_only`` reads just the files, as a separate reporting process.
+    """
+    totals, samples = ({}, []) if from_files_only else snapshot()
+    for data in metrics.read_process_files('querystats', include_own=from_files_only):
+        for key, series in data.get('series', []):
+            if len(series) == WIDTH:
+                _merge(totals, tuple(key), series)
+        samples.extend(data.get('samples', []))
+    samples.sort(key=lambda sample: sample['duration_ms'], reverse=True)
+    return totals, samples[:settings.QUERY_STATS_SAMPLES]
+
+
+def reset():
+    """Drop all recorded data of this process (used by tests)."""
+    with _stores_lock:
+        for store in _stores:
+            store.clear()
+    _samples.clear()
+
+
+def percentile(series, fraction):
+    """Upper bound in ms of the histogram bucket holding the ``fraction`` quantile."""
+    threshold = series[COUNT] * fraction
+    cumulative = 0
+    for i, bound in enumerate(DURATION_BUCKETS):
+        cumulative += series[BUCKETS_AT + i]
+        if cumulative >= threshold:
+            return round(bound * 1000, 3)
+    return round(DURATION_BUCKETS[-1] * 1000, 3)
+
+
+def report(view=None, limit=50, from_files_only=False):
+    """
+    Fingerprints ordered by total time, plus the slowest samples.
+
+    Returns:
+        dict: ``{'queries': [...], 'slow': [...]}``
+    """
+    totals, samples = collect(from_files_only)
+    rows = []
+    for (row_view, shape), series in totals.items():
+        if view and row_view != view:
+            continue
+        count = series[COUNT]
+        rows.append({
+            'view': row_view,
+            'fingerprint': shape,
+            'count': count,
+            'total_ms': round(series[SECONDS] * 1000, 3),
+            'mean_ms': round(series[SECONDS] * 1000 / count, 3) if count else 0.0,
+            'p95_ms': percentile(series, 0.95),
+        })
+    rows.sort(key=lambda row: row['total_ms'], reverse=True)
+    if view:
+        samples = [sample for sample in samples if sample['view'] == view]
+    return {'queries': rows[:limit], 'slow': samples[:limit]}
@@ -0,0 +1,63 @@
+"""
+JSON rendering of pre-encoded response data.
+
+List endpoints served from a projection (``apps/common/projections.py``)
+encode their rows once with ``encode`` and hand the bytes to the response as
+``PreEncoded``. ``PreEncodedJSONRenderer`` writes them out unchanged, so the
+page is not walked a second time by ``JSONRenderer``; everything else renders
+exactly as with ``JSONRenderer``.
+"""
+
+import json
+
+from rest_framework.compat import LONG_SEPARATORS, SHORT_SEPARATORS
+from rest_framework.renderers import JSONRenderer
+
+
+class PreEncoded(bytes):
+    """JSON bytes that ``PreEncodedJSONRenderer`` writes out as they are."""
+
+
+def encode(data):
+    """Encode ``data`` as ``JSONRenderer`` does without indentation."""
+    renderer = JSONRenderer
+    text = json.dumps(
+        data, cls=renderer.encoder_class, ensure_ascii=renderer.ensure_ascii, allow_nan=not renderer.strict,
+        separators=SHORT_SEPARATORS if renderer.compact else LONG_SEPARATORS,
+    )
+    # Same escaping as JSONRenderer: valid JSON, but not valid JavaScript
+    return text.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+
+def _holds_pre_encoded(data):
+    return isinstance(data, PreEncoded) or (
+        isinstance(data, dict) and any(isinstance(value, PreEncoded) for value in data.values())
+    )
+
+
+def _decoded(data):
+    if isinstance(data, PreEncoded):
+        return json.loads(data)
+    return {key: json.loads(value) if isinstance(value, PreEncoded) else value for key, value in data.items()}
+
+
+class PreEncodedJSONRenderer(JSONRenderer):
+    """
+    ``JSONRenderer`` that splices in ``PreEncoded`` response data, or
+    ``PreEncoded`` values of a top-level dict such as the ``results`` of a
+    paginated response.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not _holds_pre_encoded(data):
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            # Rare (e.g. ``Accept: application/json; indent=4``): re-encode the whole response
+            return super().render(_decoded(data), accepted_media_type, renderer_context)
+        if isinstance(data, PreEncoded):
+            return bytes(data)
+        parts = [
+            encode(key) + b':' + (value if isinstance(value, PreEncoded) else encode(value))
+            for key, value in data.items()
+        ]
+        return b'{' + b','.join(parts) + b'}'
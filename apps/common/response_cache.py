@@ -0,0 +1,355 @@
+"""
+Versioned response cache for per-user and per-tenant reads.
+
+``users/me``, ``tenants/me`` and ``subscriptions/my_subscription`` are
+requested on every page load but change rarely. ``cache_response(name,
+scopes)`` wraps such a DRF action and keeps its JSON body in the Django
+cache, keyed by the request's user and/or tenant plus a version counter per
+scope (and a global one). Nothing is deleted on a change: the receivers in
+``apps/common/signals.py`` bump the counter of the changed user or tenant,
+which moves readers to new keys, and old entries expire after
+``RESPONSE_CACHE_TTL``. Counters are bumped right away and again on commit,
+so a response read while the change was not yet visible is not kept under
+the new version. Other processes bump them too through the invalidation bus
+(``apps/common/invalidation.py``), which LocMem caches need. Code that
+changes rows with ``QuerySet.update()`` must call ``bump_user``/``bump_tenant``
+itself.
+
+The cache is ``CACHES['default']``: LocMem (per process) unless
+``CACHE_DIR`` selects the file-based backend, which the processes of one
+host share. ``RESPONSE_CACHE_ENABLED`` therefore defaults to on only with
+``CACHE_DIR`` or ``INVALIDATION_BUS``; with neither, another worker would
+keep serving the old body after a change.
+
+A miss is computed once: threads of a process wait on a striped lock, and
+processes sharing the cache wait up to ``RESPONSE_CACHE_LOCK_WAIT`` seconds
+for the process holding a short-lived lock key before computing themselves.
+The async views of ``config/asgi_urls.py`` use the same keys through
+``acache_response``; their coroutines wait on the lock key alone.
+
+Hits, misses and coalesced waits are counted per view and exported on
+``/metrics``; like ``apps/common/metrics.py``, each thread counts into its
+own dict and ``METRICS_DIR`` adds up all processes.
+"""
+
+import asyncio
+import hashlib
+import threading
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+from apps.common import invalidation, metrics
+from apps.common.async_views import body_response
+from apps.common.renderers import PreEncoded, PreEncodedJSONRenderer, encode
+
+GLOBAL = 'rcv:global'
+USER = 'rcv:user:{}'
+TENANT = 'rcv:tenant:{}'
+# Seconds a crashed computation can hold the cross-process lock
+LOCK_TIMEOUT = 30
+POLL_INTERVAL = 0.01
+HIT, MISS, COALESCED = 'hit', 'miss', 'coalesced'
+
+_locks = [threading.Lock() for _ in range(64)]
+_local = threading.local()
+_stores = []
+_stores_lock = threading.Lock()
+
+
+def _new_version():
+    # Random rather than incremented: an evicted counter never comes back to an old value
+    return uuid.uuid4().hex[:12]
+
+
+def _bump(keys):
+    versions = {key: _new_version() for key in keys}
+    cache.set_many(versions, None)
+
+
+def bump(keys):
+    """Move readers of the version ``keys`` to new cache keys, now and on commit."""
+    _bump(keys)
+    transaction.on_commit(lambda: _bump(keys))
+    invalidation.publish('response-cache', keys)
+
+
+@invalidation.register_handler('response-cache')
+def _bump_published(keys):
+    # Every key includes the global version
+    _bump([GLOBAL] if keys is None else keys)
+
+
+def bump_user(*user_ids):
+    bump([USER.format(user_id) for user_id in user_ids])
+
+
+def bump_tenant(*tenant_ids):
+    bump([TENANT.format(tenant_id) for tenant_id in tenant_ids if tenant_id])
+
+
+def bump_all():
+    bump([GLOBAL])
+
+
+def _version_keys(request, scopes):
+    user = request.user
+    keys = [GLOBAL]
+    if 'user' in scopes:
+        keys.append(USER.format(user.pk))
+    if 'tenant' in scopes:
+        keys.append(TENANT.format(user.tenant_id))
+    return keys
+
+
+def _response_key(request, name, scopes, versions):
+    user = request.user
+    parts = [
+        # Bodies hold absolute URLs
+        request.build_absolute_uri('/'),
+        str(user.pk) if 'user' in scopes else '',
+        str(user.tenant_id) if 'tenant' in scopes else '',
+        *versions,
+    ]
+    return f'rc:{name}:' + hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+
+def _missing_versions(keys, found):
+    created = {key: _new_version() for key in keys if key not in found}
+    for key, version in created.items():
+        found[key] = version if cache.add(key, version, None) else cache.get(key, version)
+    return found
+
+
+def response_key(request, name, scopes):
+    """Cache key of ``request``'s response, or None if it is not cached."""
+    if not settings.RESPONSE_CACHE_ENABLED or request.method not in ('GET', 'HEAD') or request.GET:
+        return None
+    keys = _version_keys(request, scopes)
+    found = _missing_versions(keys, cache.get_many(keys))
+    return _response_key(request, name, scopes, [found[key] for key in keys])
+
+
+async def _amissing_versions(keys, found):
+    for key in keys:
+        if key not in found:
+            version = _new_version()
+            found[key] = version if await cache.aadd(key, version, None) else await cache.aget(key, version)
+    return found
+
+
+async def aresponse_key(request, name, scopes):
+    """``response_key`` for async views."""
+    if not settings.RESPONSE_CACHE_ENABLED or request.method not in ('GET', 'HEAD') or request.GET:
+        return None
+    keys = _version_keys(request, scopes)
+    found = await _amissing_versions(keys, await cache.aget_many(keys))
+    return _response_key(request, name, scopes, [found[key] for key in keys])
+
+
+def _wait_for(key):
+    deadline = time.monotonic() + settings.RESPONSE_CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        body = cache.get(key)
+        if body is not None:
+            return body
+    return None
+
+
+async def _await_for(key):
+    deadline = time.monotonic() + settings.RESPONSE_CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(POLL_INTERVAL)
+        body = await cache.aget(key)
+        if body is not None:
+            return body
+    return None
+
+
+def get_or_compute(key, name, compute):
+    """
+    The cached body for ``key``, or ``compute()``'s, stored if not None.
+    Returns ``(body, computed)``.
+    """
+    body = cache.get(key)
+    if body is not None:
+        count(name, HIT)
+        return body, False
+    with _locks[hash(key) % len(_locks)]:
+        body = cache.get(key)
+        if body is not None:
+            count(name, COALESCED)
+            return body, False
+        lock_key = f'{key}:lock'
+        locked = cache.add(lock_key, 1, LOCK_TIMEOUT)
+        if not locked:
+            body = _wait_for(key)
+            if body is not None:
+                count(name, COALESCED)
+                return body, False
+        count(name, MISS)
+        try:
+            body = compute()
+            if body is not None:
+                cache.set(key, body, settings.RESPONSE_CACHE_TTL)
+        finally:
+            if locked:
+                cache.delete(lock_key)
+        return body, True
+
+
+def cache_response(name, scopes=('user', 'tenant')):
+    """
+    Decorate a DRF view method whose ``200`` JSON response depends only on
+    the request's ``scopes`` (``'user'``, ``'tenant'``) and the data their
+    counters cover. ``name`` labels keys and metrics.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            key = None
+            if isinstance(request.accepted_renderer, PreEncodedJSONRenderer):
+                key = response_key(request, name, scopes)
+            if key is None:
+                return method(view, request, *args, **kwargs)
+            responses = []
+
+            def compute():
+                response = method(view, request, *args, **kwargs)
+                responses.append(response)
+                return encode(response.data) if response.status_code == 200 else None
+
+            body, computed = get_or_compute(key, name, compute)
+            if computed:
+                return responses[0]
+            return Response(PreEncoded(body))
+
+        return wrapper
+
+    return decorator
+
+
+async def aget_or_compute(key, name, compute):
+    """
+    ``get_or_compute`` for async code, with an awaitable ``compute``.
+    Coroutines and processes computing the same key wait on the lock key.
+    """
+    body = await cache.aget(key)
+    if body is not None:
+        count(name, HIT)
+        return body, False
+    lock_key = f'{key}:lock'
+    locked = await cache.aadd(lock_key, 1, LOCK_TIMEOUT)
+    if not locked:
+        body = await _await_for(key)
+        if body is not None:
+            count(name, COALESCED)
+            return body, False
+    count(name, MISS)
+    try:
+        body = await compute()
+        if body is not None:
+            await cache.aset(key, body, settings.RESPONSE_CACHE_TTL)
+    finally:
+        if locked:
+            await cache.adelete(lock_key)
+    return body, True
+
+
+def acache_response(name, scopes=('user', 'tenant')):
+    """
+    ``cache_response`` for ``async_api_view`` handlers, which return a JSON
+    ``HttpResponse``: a miss runs the handler on the event loop and stores
+    its ``200`` body in the same keys the sync view uses.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(request, *args, **kwargs):
+            key = await aresponse_key(request, name, scopes)
+            if key is None:
+                return await handler(request, *args, **kwargs)
+            responses = []
+
+            async def compute():
+                response = await handler(request, *args, **kwargs)
+                responses.append(response)
+                return response.content if response.status_code == 200 else None
+
+            body, computed = await aget_or_compute(key, name, compute)
+            if computed:
+                return responses[0]
+            return body_response(body)
+
+        return wrapper
+
+    return decorator
+
+
+def _thread_store():
+    store = getattr(_local, 'store', None)
+    if store is None:
+        store = _local.store = {}
+        with _stores_lock:
+            _stores.append(store)
+    return store
+
+
+def count(name, result):
+    store = getattr(_local, 'store', None) or _thread_store()
+    store[(name, result)] = store.get((name, result), 0) + 1
+
+
+def snapshot():
+    with _stores_lock:
+        stores = list(_stores)
+    totals = {}
+    for store in stores:
+        for key, value in list(store.items()):
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+@metrics.register_flusher
+def flush():
+    metrics.write_process_file('responsecache', [[list(key), value] for key, value in snapshot().items()])
+
+
+def collect():
+    """Counts of this process plus, with ``METRICS_DIR``, all other processes."""
+    totals = snapshot()
+    for data in metrics.read_process_files('responsecache'):
+        for key, value in data:
+            key = tuple(key)
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def reset():
+    """Drop all counts of this process (used by tests)."""
+    with _stores_lock:
+        for store in _stores:
+            store.clear()
+
+
+def render(totals):
+    """``collect()`` output in the Prometheus text format."""
+    lines = [
+        '# HELP response_cache_requests_total Cached responses by view and result.',
+        '# TYPE response_cache_requests_total counter',
+    ]
+    views = {}
+    for (name, result), value in sorted(totals.items()):
+        lines.append(f'response_cache_requests_total{{view="{name}",result="{result}"}} {value}')
+        views.setdefault(name, {})[result] = value
+    lines.append('# HELP response_cache_hit_ratio Share of requests answered from the cache.')
+    lines.append('# TYPE response_cache_hit_ratio gauge')
+    for name, results in views.items():
+        served = results.get(HIT, 0) + results.get(COALESCED, 0)
+        ratio = served / (served + results.get(MISS, 0)) if served or results.get(MISS) else 0.0
+        lines.append(f'response_cache_hit_ratio{{view="{name}"}} {round(ratio, 4)!r}')
+    return '\n'.join(lines) + '\n'
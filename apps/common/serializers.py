@@ -0,0 +1,15 @@
+from rest_framework import serializers
+from apps.common.models import RequestProfile
+
+
+class RequestProfileListSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RequestProfile
+        fields = ['id', 'method', 'path', 'view_name', 'status_code', 'duration_ms', 'peak_memory_kb',
+                  'trigger', 'user', 'tenant', 'created_at']
+
+
+class RequestProfileSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RequestProfile
+        exclude = ['profile']
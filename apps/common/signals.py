@@ -0,0 +1,59 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from apps.accounts.models import CustomUser, Role
+from apps.billing.models import Subscription, SubscriptionPlan
+from apps.common.response_cache import bump_all, bump_tenant, bump_user
+from apps.tenants.models import Tenant, TenantImage
+
+# Versions of the response cache (apps/common/response_cache.py). A tenant's
+# version also covers its users' cached responses, which show the tenant name
+# and role member counts.
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def bump_user_responses(sender, instance, update_fields=None, **kwargs):
+    # Logins only touch last_login, which no cached response shows
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    bump_user(instance.pk)
+    # Tenant user counts
+    bump_tenant(instance.tenant_id)
+
+
+@receiver(m2m_changed, sender=CustomUser.roles.through)
+def bump_role_membership_responses(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        bump_user(*(pk_set or ()))
+    else:
+        bump_user(instance.pk)
+    bump_tenant(instance.tenant_id)
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def bump_role_responses(sender, instance, **kwargs):
+    bump_tenant(instance.tenant_id)
+
+
+@receiver(post_save, sender=Tenant)
+@receiver(post_delete, sender=Tenant)
+def bump_tenant_responses(sender, instance, **kwargs):
+    bump_tenant(instance.pk)
+
+
+@receiver(post_save, sender=TenantImage)
+@receiver(post_delete, sender=TenantImage)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def bump_tenant_related_responses(sender, instance, **kwargs):
+    bump_tenant(instance.tenant_id)
+
+
+@receiver(post_save, sender=SubscriptionPlan)
+@receiver(post_delete, sender=SubscriptionPlan)
+def bump_plan_responses(sender, instance, **kwargs):
+    # Plans are shared by many tenants
+    bump_all()
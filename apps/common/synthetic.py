@@ -0,0 +1,342 @@
+"""
+Synthetic data for scale testing.
+
+``generate`` creates tenants with roles, users, a subscription each, their
+invoice history and usage rows, with skewed tenant sizes and realistic
+status, plan and billing cycle mixes. The output is a pure function of the
+seed, prefix and anchor date, apart from invoice numbers, which are reserved
+from the live sequence.
+
+Rows are written as raw column values, bypassing model ``save()`` and
+signals: ``COPY`` on PostgreSQL, batched ``executemany`` INSERTs elsewhere.
+Every user shares one precomputed password hash. Revenue rollups are
+rebuilt afterwards.
+"""
+
+import io
+import json
+import math
+import random
+import time
+import uuid
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from apps.accounts.models import CustomUser, Role
+from apps.billing.models import Invoice, Subscription, SubscriptionPlan, TenantUsage
+from apps.billing.numbering import format_invoice_number, reserve_block
+from apps.common.constants import BILLING_PERIOD_DAYS
+from apps.common.logger import get_logger
+from apps.tenants.models import Tenant
+
+logger = get_logger(__name__)
+
+# slug suffix, name, monthly, yearly, max users, modules, trial
+PLANS = [
+    ('trial', 'Trial', '0.00', '0.00', 5, ['crm'], True),
+    ('starter', 'Starter', '999.00', '9990.00', 10, ['crm'], False),
+    ('growth', 'Growth', '4999.00', '49990.00', 100, ['crm', 'meetings'], False),
+    ('enterprise', 'Enterprise', '19999.00', '199990.00', None, ['crm', 'meetings', 'whatsapp'], False),
+]
+STATUS_WEIGHTS = {'ACTIVE': 72, 'TRIAL': 8, 'PAST_DUE': 6, 'CANCELLED': 8, 'EXPIRED': 6}
+TRIAL_DAYS = 14
+ROLE_NAMES = ['Admin', 'Manager', 'Sales', 'Support', 'Marketing', 'Finance', 'Operations', 'Viewer']
+ROLE_PERMISSIONS = [
+    {'crm': {'leads': {'view': 'all', 'create': True, 'edit': 'all', 'delete': 'all'}}},
+    {'crm': {'leads': {'view': 'team', 'create': True, 'edit': 'team', 'delete': 'own'}}},
+    {'crm': {'leads': {'view': 'own', 'create': True, 'edit': 'own', 'delete': False}}},
+    {'crm': {'leads': {'view': 'all', 'create': False, 'edit': False, 'delete': False}}},
+]
+FIRST_NAMES = ['Aarav', 'Ananya', 'Arjun', 'Diya', 'Ishaan', 'Kavya', 'Rohan', 'Saanvi', 'Vihaan', 'Zara',
+               'Emma', 'Liam', 'Olivia', 'Noah', 'Sofia', 'Lucas', 'Mia', 'Ethan', 'Amara', 'Kenji']
+LAST_NAMES = ['Sharma', 'Patel', 'Iyer', 'Reddy', 'Gupta', 'Khan', 'Singh', 'Nair', 'Das', 'Mehta',
+              'Smith', 'Garcia', 'Müller', 'Rossi', 'Silva', 'Kim', 'Okafor', 'Novak', 'Tanaka', 'Cohen']
+
+
+class TableWriter:
+    """Buffer rows for one table and write them in batches."""
+
+    def __init__(self, model, columns, batch_size):
+        self.model = model
+        self.table = model._meta.db_table
+        self.columns = columns
+        self.batch_size = batch_size
+        self.rows = []
+        self.count = 0
+        self.copy = connection.vendor == 'postgresql'
+        fields = [model._meta.get_field(column) for column in columns]
+        self.converters = [self._converter(field) for field in fields]
+
+    def _converter(self, field):
+        kind = field.target_field.get_internal_type() if field.is_relation else field.get_internal_type()
+        if self.copy:
+            if kind == 'DateTimeField':
+                return lambda v: r'\N' if v is None else v.isoformat()
+            if kind == 'BooleanField':
+                return lambda v: 't' if v else 'f'
+            if kind == 'JSONField':
+                return lambda v: _copy_escape(json.dumps(v))
+            if kind == 'UUIDField':
+                return lambda v: r'\N' if v is None else str(v)
+            return lambda v: r'\N' if v is None else _copy_escape(str(v))
+        if kind == 'DateTimeField':
+            return connection.ops.adapt_datetimefield_value
+        if kind == 'JSONField':
+            return json.dumps
+        if kind == 'UUIDField':
+            native = connection.features.has_native_uuid_field
+            return lambda v: v if v is None or native else v.hex
+        if kind == 'DecimalField':
+            return lambda v: None if v is None else str(v)
+        return lambda v: v
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        converters = self.converters
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            if self.copy:
+                data = '\n'.join(
+                    '\t'.join([convert(value) for convert, value in zip(converters, row)]) for row in self.rows
+                ) + '\n'
+                sql = f'COPY {quote(self.table)} ({", ".join(quote(c) for c in self.columns)}) FROM STDIN'
+                raw = cursor.cursor
+                if hasattr(raw, 'copy_expert'):
+                    raw.copy_expert(sql, io.StringIO(data))
+                else:
+                    with raw.copy(sql) as copy:
+                        copy.write(data)
+            else:
+                sql = (
+                    f'INSERT INTO {quote(self.table)} ({", ".join(quote(c) for c in self.columns)}) '
+                    f'VALUES ({", ".join(["%s"] * len(self.columns))})'
+                )
+                cursor.executemany(sql, [[convert(value) for convert, value in zip(converters, row)] for row in self.rows])
+        self.count += len(self.rows)
+        self.rows = []
+
+
+def _copy_escape(value):
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def tenant_sizes(rng, tenants, total_users):
+    """Skewed (log-normal) users per tenant, at least 1, summing to ``total_users``."""
+    weights = [rng.lognormvariate(0, 1.2) for _ in range(tenants)]
+    scale = (total_users - tenants) / sum(weights)
+    raw = [w * scale for w in weights]
+    sizes = [1 + int(r) for r in raw]
+    # Largest remainders get the users lost to rounding down
+    missing = total_users - sum(sizes)
+    for i in sorted(range(tenants), key=lambda i: raw[i] - int(raw[i]), reverse=True)[:missing]:
+        sizes[i] += 1
+    return sizes
+
+
+def ensure_plans(prefix):
+    plans = {}
+    for order, (key, name, monthly, yearly, max_users, modules, is_trial) in enumerate(PLANS):
+        plans[key], _ = SubscriptionPlan.objects.get_or_create(
+            slug=f'{prefix}-{key}',
+            defaults={
+                'name': f'{name} ({prefix})', 'price_monthly': Decimal(monthly), 'price_yearly': Decimal(yearly),
+                'max_users': max_users, 'included_modules': modules, 'is_trial': is_trial,
+                'trial_days': TRIAL_DAYS if is_trial else 0, 'sort_order': order,
+            },
+        )
+    return plans
+
+
+def _plan_for(rng, size):
+    if size <= 5:
+        return rng.choices(['starter', 'growth'], weights=[85, 15])[0]
+    if size <= 50:
+        return rng.choices(['starter', 'growth', 'enterprise'], weights=[30, 60, 10])[0]
+    return rng.choices(['growth', 'enterprise'], weights=[40, 60])[0]
+
+
+def plan_tenant(rng, index, size, plans, anchor, history_days):
+    """Everything about one tenant that is needed before writing rows."""
+    status = rng.choices(list(STATUS_WEIGHTS), weights=list(STATUS_WEIGHTS.values()))[0]
+    if status == 'TRIAL':
+        created = anchor - timedelta(seconds=rng.randrange(TRIAL_DAYS * 86400))
+        plan_key, cycle = 'trial', 'MONTHLY'
+    else:
+        # Skewed towards recent sign-ups
+        created = anchor - timedelta(seconds=int(history_days * 86400 * rng.random() ** 1.5) + 86400)
+        plan_key = _plan_for(rng, size)
+        cycle = 'YEARLY' if rng.random() < 0.2 else 'MONTHLY'
+
+    period = timedelta(days=BILLING_PERIOD_DAYS[cycle])
+    if status == 'TRIAL':
+        periods = []
+        current = (created, created + timedelta(days=TRIAL_DAYS))
+    else:
+        elapsed = max(1, math.ceil((anchor - created) / period))
+        if status in ('CANCELLED', 'EXPIRED'):
+            elapsed = max(1, elapsed - rng.randrange(0, 3))
+        periods = [(created + period * i, created + period * (i + 1)) for i in range(elapsed)]
+        current = periods[-1]
+    return {
+        'index': index,
+        'size': size,
+        'status': status,
+        'plan': plans[plan_key],
+        'cycle': cycle,
+        'created': created,
+        'periods': periods,
+        'current': current,
+    }
+
+
+def generate(tenants, users, roles_per_tenant, seed=0, prefix='gen', anchor=None, history_days=730,
+             batch_size=50000, rebuild_revenue=True, progress=None):
+    """
+    Generate ``tenants`` tenants with ``users`` users in total and
+    ``roles_per_tenant`` roles each. Returns ``{table: rows written}``.
+    """
+    from apps.billing.revenue import rebuild_rollups
+
+    if Tenant.objects.filter(slug__startswith=f'{prefix}-').exists():
+        raise ValueError(f'Tenants with the prefix "{prefix}" already exist; use another --prefix')
+    if users < tenants:
+        raise ValueError('Need at least one user per tenant')
+    progress = progress or (lambda message: None)
+    rng = random.Random(seed)
+    # Ids also depend on the prefix so one seed can be generated under several prefixes
+    ids = random.Random(f'{prefix}:{seed}')
+
+    def new_id():
+        return uuid.UUID(int=ids.getrandbits(128), version=4)
+
+    if anchor is None:
+        anchor = datetime.combine(datetime.now(dt_timezone.utc).date(), dt_time.min, tzinfo=dt_timezone.utc)
+    password = make_password('Synthetic123!')
+    started = time.perf_counter()
+
+    with transaction.atomic():
+        plans = ensure_plans(prefix)
+        sizes = tenant_sizes(rng, tenants, users)
+        plan = [plan_tenant(rng, i, size, plans, anchor, history_days) for i, size in enumerate(sizes)]
+        invoice_count = sum(len(t['periods']) for t in plan)
+        next_number = reserve_block(invoice_count) if invoice_count else 0
+        progress(f'Planned {tenants} tenants, {users} users, {invoice_count} invoices')
+
+        writers = {
+            'tenants': TableWriter(Tenant, ['id', 'name', 'slug', 'enabled_modules', 'settings', 'is_active',
+                                            'trial_ends_at', 'created_at', 'updated_at'], batch_size),
+            'subscriptions': TableWriter(Subscription, [
+                'id', 'tenant_id', 'plan_id', 'status', 'billing_cycle', 'current_period_start',
+                'current_period_end', 'cancel_at_period_end', 'cancelled_at', 'created_at', 'updated_at',
+            ], batch_size),
+            'tenant_usage': TableWriter(TenantUsage, ['tenant_id', 'user_count', 'lead_count', 'storage_bytes',
+                                                      'updated_at'], batch_size),
+            'roles': TableWriter(Role, ['id', 'tenant_id', 'name', 'description', 'permissions', 'is_active',
+                                        'created_at', 'updated_at'], batch_size),
+            'users': TableWriter(CustomUser, [
+                'id', 'password', 'last_login', 'is_superuser', 'first_name', 'last_name', 'is_staff',
+                'is_active', 'date_joined', 'email', 'tenant_id', 'is_super_admin', 'timezone', 'preferences',
+            ], batch_size),
+            'users_roles': TableWriter(CustomUser.roles.through, ['customuser_id', 'role_id'], batch_size),
+            'invoices': TableWriter(Invoice, [
+                'id', 'tenant_id', 'subscription_id', 'invoice_number', 'amount', 'currency', 'status',
+                'period_start', 'period_end', 'due_date', 'paid_at', 'document_hash', 'created_at', 'updated_at',
+            ], batch_size),
+        }
+        due_days = timedelta(days=settings.INVOICE_DUE_DAYS)
+        user_number = 0
+        for tenant in plan:
+            tenant_id, created, status = new_id(), tenant['created'], tenant['status']
+            subscription_plan = tenant['plan']
+            slug = f'{prefix}-{tenant["index"]}'
+            trial_ends_at = created + timedelta(days=TRIAL_DAYS) if status == 'TRIAL' else None
+            writers['tenants'].add((
+                tenant_id, f'{rng.choice(LAST_NAMES)} {rng.choice(["Labs", "Traders", "Systems", "Retail", "Group"])} {tenant["index"]}',
+                slug, subscription_plan.included_modules, {}, status != 'EXPIRED', trial_ends_at, created, anchor,
+            ))
+
+            subscription_id = new_id()
+            start, end = tenant['current']
+            ended = status in ('CANCELLED', 'EXPIRED')
+            writers['subscriptions'].add((
+                subscription_id, tenant_id, subscription_plan.id, status, tenant['cycle'], start, end,
+                status == 'CANCELLED', end if status == 'CANCELLED' else None, created, end if ended else anchor,
+            ))
+            writers['tenant_usage'].add((tenant_id, tenant['size'], 0, 0, anchor))
+
+            role_ids = []
+            for r in range(roles_per_tenant):
+                role_id = new_id()
+                role_ids.append(role_id)
+                name = ROLE_NAMES[r % len(ROLE_NAMES)] + (f' {r // len(ROLE_NAMES) + 1}' if r >= len(ROLE_NAMES) else '')
+                writers['roles'].add((
+                    role_id, tenant_id, name, '', ROLE_PERMISSIONS[min(r, len(ROLE_PERMISSIONS) - 1)], True,
+                    created, created,
+                ))
+
+            span = max(int((anchor - created).total_seconds()), 1)
+            for u in range(tenant['size']):
+                user_id = new_id()
+                first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+                joined = created + timedelta(seconds=0 if u == 0 else rng.randrange(span))
+                last_login = anchor - timedelta(seconds=rng.randrange(30 * 86400)) if rng.random() < 0.7 else None
+                if last_login is not None and last_login < joined:
+                    last_login = joined
+                writers['users'].add((
+                    user_id, password, last_login, False, first, last, False, rng.random() < 0.97, joined,
+                    f'{first.lower()}.{user_number}@{slug}.example.com', tenant_id, False, 'Asia/Kolkata', {},
+                ))
+                user_number += 1
+                if not role_ids:
+                    continue
+                if u == 0:
+                    writers['users_roles'].add((user_id, role_ids[0]))
+                    continue
+                roll = rng.random()
+                if roll < 0.05:
+                    continue
+                picked = {role_ids[min(int(rng.expovariate(1.0)) + 1, len(role_ids) - 1)]}
+                if roll > 0.85:
+                    picked.add(rng.choice(role_ids))
+                for role_id in picked:
+                    writers['users_roles'].add((user_id, role_id))
+
+            periods = tenant['periods']
+            price = subscription_plan.price_yearly if tenant['cycle'] == 'YEARLY' else subscription_plan.price_monthly
+            for i, (period_start, period_end) in enumerate(periods):
+                latest = i == len(periods) - 1
+                if latest and status == 'PAST_DUE':
+                    invoice_status, paid_at = 'FAILED', None
+                elif latest and status == 'ACTIVE' and rng.random() < 0.3:
+                    invoice_status, paid_at = 'PENDING', None
+                else:
+                    invoice_status = 'PAID'
+                    paid_at = min(period_start + timedelta(seconds=rng.randrange(5 * 86400)), anchor)
+                writers['invoices'].add((
+                    new_id(), tenant_id, subscription_id,
+                    format_invoice_number(next_number), price, subscription_plan.currency, invoice_status,
+                    period_start, period_end, period_start + due_days, paid_at, '', period_start,
+                    paid_at or period_start,
+                ))
+                next_number += 1
+
+        for name, writer in writers.items():
+            writer.flush()
+            progress(f'{name}: {writer.count} rows')
+
+    counts = {name: writer.count for name, writer in writers.items()}
+    elapsed = time.perf_counter() - started
+    logger.info('Generated %s in %.1fs', counts, elapsed)
+    if rebuild_revenue:
+        progress('Rebuilding revenue rollups')
+        counts['revenue_rollups'] = rebuild_rollups()
+    return counts
@@ -0,0 +1,70 @@
+"""
+Minimal in-process background execution.
+
+Work that should not block a request (file cleanup, provisioning, document
+rendering, ...) is handed to a shared thread pool once the surrounding
+transaction commits. Every job that uses this module is also backed by a
+database queue and a management command, so work lost on a process restart is
+picked up by the next command run.
+
+Usage:
+    from apps.common.tasks import run_on_commit
+
+    run_on_commit(sweep_pending_deletions)
+
+Set ``BACKGROUND_TASKS_EAGER = True`` to run jobs inline (useful in scripts
+and tests).
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from apps.common.logger import get_logger
+
+logger = get_logger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide thread pool, creating it on first use."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.BACKGROUND_TASK_WORKERS,
+                    thread_name_prefix='background-task',
+                )
+    return _executor
+
+
+def _run(fn, args, kwargs):
+    try:
+        return fn(*args, **kwargs)
+    except Exception:
+        logger.exception('Background task %s failed', getattr(fn, '__qualname__', fn))
+
+
+def _run_in_worker(fn, args, kwargs):
+    # Pool threads keep their own connections between jobs
+    close_old_connections()
+    try:
+        return _run(fn, args, kwargs)
+    finally:
+        close_old_connections()
+
+
+def run_in_background(fn, *args, **kwargs):
+    """Run ``fn(*args, **kwargs)`` on the background pool."""
+    if settings.BACKGROUND_TASKS_EAGER:
+        return _run(fn, args, kwargs)
+    return get_executor().submit(_run_in_worker, fn, args, kwargs)
+
+
+def run_on_commit(fn, *args, **kwargs):
+    """Run ``fn`` in the background after the current transaction commits."""
+    transaction.on_commit(lambda: run_in_background(fn, *args, **kwargs))
@@ -0,0 +1,670 @@
+import gzip
+import json
+import logging
+import marshal
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
+import uuid
+
+from io import BytesIO, StringIO
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+from apps.accounts.models import CustomUser
+from apps.common import invalidation, metrics, query_stats, response_cache
+from apps.common.models import RequestProfile
+from apps.common.profiling import prune_profiles
+from apps.common.synthetic import generate
+from apps.common.logger import CompressingRotatingFileHandler, JsonFormatter, QueueListenerHandler
+from apps.common.throttling import TenantRateLimiter
+
+
+class TenantRateLimiterTests(SimpleTestCase):
+    def test_allows_burst_up_to_rate_then_waits(self):
+        limiter = TenantRateLimiter(shards=4)
+        now = 1000.0
+        for _ in range(60):
+            self.assertEqual(limiter.consume('tenant-a', 60, now), 0.0)
+        wait = limiter.consume('tenant-a', 60, now)
+        self.assertAlmostEqual(wait, 1.0)
+        # Tokens refill at rate / 60 per second
+        self.assertEqual(limiter.consume('tenant-a', 60, now + 1.0), 0.0)
+
+    def test_tenants_are_independent(self):
+        limiter = TenantRateLimiter(shards=4)
+        now = 1000.0
+        self.assertEqual(limiter.consume('tenant-a', 1, now), 0.0)
+        self.assertGreater(limiter.consume('tenant-a', 1, now), 0.0)
+        self.assertEqual(limiter.consume('tenant-b', 1, now), 0.0)
+
+    def test_sync_blocks_tenant_over_cluster_limit(self):
+        cache.clear()
+        node_a = TenantRateLimiter(shards=4, sync_interval=3600)
+        node_b = TenantRateLimiter(shards=4, sync_interval=3600)
+        now = 1000.0
+        for _ in range(5):
+            node_a.consume('tenant-a', 10, now)
+            node_b.consume('tenant-a', 10, now)
+        node_a.sync(now)
+        node_b.sync(now)
+        self.assertGreater(node_b.consume('tenant-a', 10, now), 0.0)
+
+
+class LoggingPipelineTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.logger = logging.getLogger('apps.tests.logging_pipeline')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+
+    def attach(self, handler):
+        self.logger.addHandler(handler)
+        self.addCleanup(self.logger.removeHandler, handler)
+        self.addCleanup(handler.close)
+
+    def test_json_records_written_by_listener_thread(self):
+        path = os.path.join(self.tmp.name, 'app.log')
+        target = CompressingRotatingFileHandler(path)
+        target.setFormatter(JsonFormatter())
+        queue_handler = QueueListenerHandler([target])
+        self.attach(queue_handler)
+
+        data = {'plan': 'basic'}
+        self.logger.info('Tenant %s created with %s', 'acme', data, extra={'tenant_id': 7})
+        data['plan'] = 'changed'
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            self.logger.exception('Failed')
+        self.logger.debug('Not emitted %s', object())
+        queue_handler.close()
+        target.close()
+
+        with open(path) as f:
+            entries = [json.loads(line) for line in f]
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(entries[0]['message'], "Tenant acme created with {'plan': 'basic'}")
+        self.assertEqual(entries[0]['tenant_id'], 7)
+        self.assertEqual(entries[0]['level'], 'INFO')
+        self.assertIn('ValueError: boom', entries[1]['exc_info'])
+
+    def test_rotated_backups_are_gzipped(self):
+        path = os.path.join(self.tmp.name, 'app.log')
+        handler = CompressingRotatingFileHandler(path, maxBytes=200, backupCount=2)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self.attach(handler)
+        for i in range(20):
+            self.logger.info('line %d %s', i, 'x' * 40)
+        handler.close()
+
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ['app.log', 'app.log.1.gz', 'app.log.2.gz'])
+        with gzip.open(path + '.1.gz', 'rt') as f:
+            self.assertIn('line', f.read())
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def test_requests_recorded_per_route(self):
+        for _ in range(3):
+            self.client.get('/api/plans/')
+        self.client.get('/no-such-page/')
+
+        body = self.client.get('/metrics').content.decode()
+        line = next(
+            line for line in body.splitlines()
+            if line.startswith('http_request_duration_seconds_count') and 'plans' in line
+        )
+        self.assertIn('method="GET"', line)
+        self.assertIn('status="200"', line)
+        self.assertTrue(line.endswith(' 3'))
+        self.assertIn('route="<unmatched>",status="404"', body)
+        self.assertIn('# TYPE http_request_db_queries histogram', body)
+        self.assertIn('http_request_db_duration_seconds_total{', body)
+
+    def test_db_queries_counted(self):
+        self.client.get('/api/plans/')
+        totals = metrics.snapshot()
+        series = next(series for (_, route, _), series in totals.items() if 'plans' in route)
+        self.assertGreaterEqual(series[metrics.QUERIES_SUM], 1)
+        self.assertGreater(series[metrics.SIZE_SUM], 0)
+
+    def test_streamed_download_size_from_content_length(self):
+        from django.http import FileResponse
+        from django.test import RequestFactory
+        from apps.common.middleware import MetricsMiddleware
+
+        request = RequestFactory().get('/download')
+        request.resolver_match = None
+        MetricsMiddleware(lambda request: FileResponse(BytesIO(b'x' * 5000)))(request)
+        series = metrics.snapshot()[('GET', '<unmatched>', '200')]
+        self.assertEqual(series[metrics.SIZE_SUM], 5000)
+
+    @override_settings(METRICS_TOKEN='scrape-token')
+    def test_token_required(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+
+    def test_without_token_only_allowed_networks(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.7').status_code, 403)
+        with override_settings(METRICS_ALLOWED_NETWORKS=['203.0.113.0/24']):
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.7').status_code, 200)
+
+    def test_processes_merged_through_shared_directory(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            metrics.observe('GET', 'api/plans/', 200, 0.02, 1, 0.001, 500)
+            metrics.flush()
+            # Another worker's totals for the same series
+            os.rename(os.path.join(directory, f'metrics-{os.getpid()}.json'),
+                      os.path.join(directory, 'metrics-1.json'))
+            metrics.reset()
+            metrics.observe('GET', 'api/plans/', 200, 0.2, 3, 0.002, 500)
+
+            series = metrics.collect()[('GET', 'api/plans/', '200')]
+            metrics.wait_for_flushes()
+        self.assertEqual(series[metrics.COUNT], 2)
+        self.assertEqual(series[metrics.QUERIES_SUM], 4)
+
+
+class QueryStatsTests(APITestCase):
+    def setUp(self):
+        query_stats.reset()
+        self.admin = CustomUser.objects.create_superuser(email='root@example.com', password='pass12345')
+
+    def test_fingerprint_normalizes_values(self):
+        self.assertEqual(
+            query_stats.fingerprint("SELECT  * FROM t WHERE a = 'x''y' AND b = 42 AND c IN (%s, %s, %s)"),
+            'SELECT * FROM t WHERE a = ? AND b = ? AND c IN (...)',
+        )
+        self.assertEqual(
+            query_stats.fingerprint('SELECT * FROM t WHERE id IN (%s)'),
+            query_stats.fingerprint('SELECT * FROM t WHERE id IN (%s, %s)'),
+        )
+
+    @override_settings(QUERY_STATS_SLOW_MS=0)
+    def test_queries_grouped_by_view_with_samples(self):
+        self.client.force_authenticate(self.admin)
+        self.client.get('/api/users/')
+        self.client.get('/api/users/')
+
+        response = self.client.get('/api/query-stats/', {'view': 'user-list'})
+        self.assertEqual(response.status_code, 200)
+        rows = response.data['queries']
+        self.assertTrue(rows)
+        self.assertTrue(all(row['view'] == 'user-list' for row in rows))
+        self.assertTrue(any(row['count'] == 2 for row in rows))
+        sample = response.data['slow'][0]
+        self.assertEqual(sample['view'], 'user-list')
+        self.assertNotIn('params', sample)
+
+    def test_requires_super_admin(self):
+        self.assertEqual(self.client.get('/api/query-stats/').status_code, 401)
+
+    def test_report_command_reads_worker_files(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            self.client.force_authenticate(self.admin)
+            self.client.get('/api/users/')
+            metrics.flush()
+            query_stats.reset()
+            out = StringIO()
+            call_command('query_report', '--view', 'user-list', stdout=out)
+            # A background flush must not write into the directory while it is removed
+            metrics.wait_for_flushes()
+        self.assertIn('user-list', out.getvalue())
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class RequestProfilingTests(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.admin = CustomUser.objects.create_superuser(email='root@example.com', password='pass12345')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def auth_header(self, user):
+        return f'Bearer {RefreshToken.for_user(user).access_token}'
+
+    def test_super_admin_header_profiles_request(self):
+        response = self.client.get('/api/users/', HTTP_AUTHORIZATION=self.auth_header(self.admin), HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, 200)
+
+        profile = RequestProfile.objects.get(id=response['X-Profile-Id'])
+        self.assertEqual((profile.view_name, profile.trigger, profile.user_id), ('user-list', 'header', self.admin.id))
+        self.assertTrue(profile.top_functions)
+        self.assertTrue(profile.top_allocations)
+
+        self.client.force_authenticate(self.admin)
+        detail = self.client.get(f'/api/profiles/{profile.id}/')
+        self.assertEqual(detail.data['view_name'], 'user-list')
+        download = self.client.get(f'/api/profiles/{profile.id}/download/')
+        self.assertEqual(download.status_code, 200)
+        stats = marshal.loads(b''.join(download.streaming_content) if download.streaming else download.content)
+        self.assertTrue(stats)
+
+    def test_header_ignored_for_other_users(self):
+        user = CustomUser.objects.create_user(email='member@example.com', password='pass12345')
+        response = self.client.get('/api/plans/', HTTP_AUTHORIZATION=self.auth_header(user), HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Id', response)
+        self.client.get('/api/plans/', HTTP_X_PROFILE='1')
+        self.assertFalse(RequestProfile.objects.exists())
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0, PROFILING_MAX_PROFILES=2)
+    def test_sampled_requests_pruned_to_newest(self):
+        for _ in range(3):
+            self.client.get('/api/plans/')
+        self.assertEqual(RequestProfile.objects.filter(trigger='sample').count(), 2)
+        self.assertEqual(prune_profiles(keep=0), 2)
+
+    def test_profiles_require_super_admin(self):
+        user = CustomUser.objects.create_user(email='member@example.com', password='pass12345')
+        self.client.force_authenticate(user)
+        self.assertEqual(self.client.get('/api/profiles/').status_code, 403)
+
+
+class SyntheticDataTests(TestCase):
+    def test_generate_writes_consistent_rows(self):
+        from apps.billing.models import Invoice, Subscription, TenantUsage
+        from apps.tenants.models import Tenant
+
+        counts = generate(tenants=5, users=40, roles_per_tenant=3, seed=7, rebuild_revenue=False)
+        self.assertEqual(counts['tenants'], 5)
+        self.assertEqual(CustomUser.objects.filter(tenant__slug__startswith='gen-').count(), 40)
+        self.assertEqual(Subscription.objects.filter(tenant__slug__startswith='gen-').count(), 5)
+        self.assertEqual(Invoice.objects.count(), counts['invoices'])
+        usage = TenantUsage.objects.filter(tenant__slug__startswith='gen-')
+        self.assertEqual(sum(row.user_count for row in usage), 40)
+        for tenant in Tenant.objects.filter(slug__startswith='gen-'):
+            self.assertEqual(tenant.users.count(), tenant.usage.user_count)
+            self.assertEqual(tenant.roles.count(), 3)
+
+        first = list(CustomUser.objects.filter(tenant__slug__startswith='gen-').order_by('email').values_list('email', flat=True))
+        generate(tenants=5, users=40, roles_per_tenant=3, seed=7, prefix='again', rebuild_revenue=False)
+        again = CustomUser.objects.filter(tenant__slug__startswith='again-').order_by('email').values_list('email', flat=True)
+        self.assertEqual([email.replace('@gen-', '@again-') for email in first], list(again))
+
+    def test_command_rejects_existing_prefix(self):
+        out = StringIO()
+        call_command('generate_data', tenants=2, users=4, roles=1, skip_rollups=True, stdout=out)
+        self.assertIn("'users': 4", out.getvalue())
+        with self.assertRaisesMessage(CommandError, 'already exist'):
+            call_command('generate_data', tenants=2, users=4, roles=1, skip_rollups=True, stdout=StringIO())
+
+
+@override_settings(ROOT_URLCONF='config.asgi_urls')
+class AsyncViewsTests(TestCase):
+    """The async fast path answers like the DRF views it stands in for"""
+
+    def setUp(self):
+        from datetime import timedelta
+        from decimal import Decimal
+        from django.utils import timezone
+        from apps.accounts.models import Role
+        from apps.billing.catalog import invalidate_catalog
+        from apps.billing.entitlements import invalidate_entitlements
+        from apps.billing.models import Subscription, SubscriptionPlan
+        from apps.tenants.models import Tenant
+
+        invalidate_catalog()
+        invalidate_entitlements()
+        self.plan = SubscriptionPlan.objects.create(
+            name='Starter', slug='starter', price_monthly=Decimal('999.00'), price_yearly=Decimal('9999.00'),
+        )
+        self.tenant = Tenant.objects.create(name='Acme', slug='acme')
+        now = timezone.now()
+        Subscription.objects.create(
+            tenant=self.tenant, plan=self.plan, status='ACTIVE',
+            current_period_start=now, current_period_end=now + timedelta(days=30),
+        )
+        self.admin = CustomUser.objects.create_superuser(email='root@example.com', password='pass12345',
+                                                         tenant=self.tenant)
+        self.member = CustomUser.objects.create_user(email='member@example.com', password='pass12345',
+                                                     tenant=self.tenant)
+        role = Role.objects.create(tenant=self.tenant, name='Sales', permissions={'crm': {'view': True}})
+        self.member.roles.add(role)
+        self.admin.roles.add(role)
+
+    def bearer(self, user):
+        return f'Bearer {RefreshToken.for_user(user).access_token}'
+
+    def both(self, method, path, data=None, **headers):
+        """The same request through the regular views and the async views."""
+        kwargs = {'headers': headers}
+        if data is not None:
+            kwargs.update(data=json.dumps(data), content_type='application/json')
+        with override_settings(ROOT_URLCONF='config.urls'):
+            regular = getattr(self.client, method)(path, **kwargs)
+        fast = async_to_sync(getattr(self.async_client, method))(path, **kwargs)
+        self.assertEqual(fast.status_code, regular.status_code, path)
+        if regular.get('Content-Type') == 'application/json':
+            self.assertEqual(fast.json(), regular.json(), path)
+        return regular, fast
+
+    def test_read_endpoints_match_regular_views(self):
+        for user in (self.member, self.admin):
+            for path in ('/api/users/me/', '/api/tenants/me/', '/api/subscriptions/my_subscription/'):
+                self.both('get', path, Authorization=self.bearer(user))
+        _, fast = self.both('get', '/api/plans/')
+        self.assertEqual(fast.json()['count'], 1)
+        self.both('get', f'/api/plans/{self.plan.id}/')
+        _, fast = self.both('get', '/api/users/me/', Authorization=self.bearer(self.member))
+        self.assertEqual(fast.json()['roles'][0]['member_count'], 2)
+
+    def test_errors_match_regular_views(self):
+        _, fast = self.both('get', '/api/users/me/')
+        self.assertEqual(fast['WWW-Authenticate'], 'Bearer realm="api"')
+        self.both('get', '/api/users/me/', Authorization='Bearer not-a-token')
+        self.both('get', '/api/tenants/me/', Authorization=self.bearer(self.member))
+        self.both('post', '/api/users/me/', data={}, Authorization=self.bearer(self.member))
+
+    def test_token_verify(self):
+        token = str(RefreshToken.for_user(self.member).access_token)
+        self.both('post', '/api/auth/token/verify/', data={'token': token})
+        self.both('post', '/api/auth/token/verify/', data={'token': token + 'x'})
+        self.both('post', '/api/auth/token/verify/', data={})
+
+    def test_queries_counted_in_metrics(self):
+        metrics.reset()
+        async_to_sync(self.async_client.get)('/api/users/me/', headers={'Authorization': self.bearer(self.member)})
+        series = next(series for (_, route, _), series in metrics.snapshot().items() if route == 'api/users/me/')
+        self.assertGreaterEqual(series[metrics.QUERIES_SUM], 2)
+
+    def test_tenant_throttle_applies(self):
+        from apps.common.throttling import tenant_rate_limiter
+
+        tenant_rate_limiter.reset()
+        self.plan.api_rate_limit = 1
+        self.plan.save()
+        headers = {'Authorization': self.bearer(self.member)}
+        self.assertEqual(async_to_sync(self.async_client.get)('/api/users/me/', headers=headers).status_code, 200)
+        response = async_to_sync(self.async_client.get)('/api/users/me/', headers=headers)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_profiling_header_on_async_request(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media, BACKGROUND_TASKS_EAGER=True):
+            response = async_to_sync(self.async_client.get)(
+                '/api/users/me/', headers={'Authorization': self.bearer(self.admin), 'X-Profile': '1'},
+            )
+        profile = RequestProfile.objects.get(id=response['X-Profile-Id'])
+        self.assertEqual((profile.view_name, profile.user_id), ('user-me', self.admin.id))
+
+
+class ProjectionTests(APITestCase):
+    """List endpoints served from projections return what their serializers return"""
+
+    ENDPOINTS = {
+        '/api/users/': 'apps.accounts.views.UserViewSet',
+        '/api/invoices/': 'apps.billing.views.InvoiceViewSet',
+        '/api/subscriptions/': 'apps.billing.views.SubscriptionViewSet',
+        '/api/tenants/': 'apps.tenants.views.TenantViewSet',
+    }
+
+    def setUp(self):
+        from apps.billing.models import Invoice
+        from apps.tenants.models import Tenant, TenantImage
+
+        generate(tenants=3, users=30, roles_per_tenant=2, seed=3, rebuild_revenue=False)
+        tenant = Tenant.objects.filter(slug__startswith='gen-').first()
+        TenantImage.objects.bulk_create([TenantImage(tenant=tenant, image='tenants/logo.png', label='Logo', size_bytes=10)])
+        Invoice.objects.filter(pk=Invoice.objects.first().pk).update(document='invoices/first.pdf')
+        admin = CustomUser.objects.create_superuser(email='root@example.com', password='pass12345')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(admin).access_token}')
+
+    def serialized(self, path, viewset):
+        from unittest import mock
+        from django.utils.module_loading import import_string
+
+        with mock.patch.object(import_string(viewset), 'list_projection', None):
+            return self.client.get(path)
+
+    def test_projection_matches_serializer(self):
+        for path, viewset in self.ENDPOINTS.items():
+            url = path
+            while url:
+                projected = self.client.get(url)
+                self.assertEqual(projected.status_code, 200, url)
+                self.assertEqual(projected.json(), self.serialized(url, viewset).json(), url)
+                url = projected.json()['next']
+                self.assertNotIn(' '.encode(), projected.content)
+
+    def test_tenant_filter_and_indent(self):
+        tenant = CustomUser.objects.filter(tenant__isnull=False).first().tenant
+        response = self.client.get('/api/users/', HTTP_X_TENANT_ID=str(tenant.id))
+        self.assertEqual({user['tenant'] for user in response.json()['results']}, {str(tenant.id)})
+        self.assertEqual(response.json()['count'], tenant.users.count())
+
+        indented = self.client.get('/api/users/', HTTP_ACCEPT='application/json; indent=2')
+        self.assertIn(b'\n  "count"', indented.content)
+        self.assertEqual(indented.json(), self.client.get('/api/users/').json())
+
+    def test_page_queries_do_not_grow_with_rows(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as few:
+            self.client.get('/api/tenants/')
+        generate(tenants=6, users=24, roles_per_tenant=2, seed=4, prefix='more', rebuild_revenue=False)
+        with CaptureQueriesContext(connection) as more:
+            self.client.get('/api/tenants/')
+        self.assertEqual(len(more), len(few))
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class ResponseCacheTests(APITestCase):
+    """Cached per-user and per-tenant reads follow the changes of what they show"""
+
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from apps.accounts.models import Role
+        from apps.billing.models import Subscription, SubscriptionPlan
+        from apps.tenants.models import Tenant
+
+        cache.clear()
+        response_cache.reset()
+        plan = SubscriptionPlan.objects.create(name='Starter', slug='starter', price_monthly=10, price_yearly=100)
+        self.tenant = Tenant.objects.create(name='Acme', slug='acme')
+        now = timezone.now()
+        self.subscription = Subscription.objects.create(
+            tenant=self.tenant, plan=plan, status='ACTIVE',
+            current_period_start=now, current_period_end=now + timedelta(days=30),
+        )
+        self.admin = CustomUser.objects.create_superuser(email='root@example.com', password='pass12345',
+                                                         tenant=self.tenant)
+        self.role = Role.objects.create(tenant=self.tenant, name='Sales')
+        self.admin.roles.add(self.role)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.admin).access_token}')
+
+    def test_hit_skips_the_view(self):
+
+        first = self.client.get('/api/users/me/')
+        with self.assertNumQueries(1):  # the user of the token
+            second = self.client.get('/api/users/me/')
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(response_cache.snapshot(), {('user-me', 'hit'): 1, ('user-me', 'miss'): 1})
+        self.assertIn('response_cache_hit_ratio{view="user-me"} 0.5', self.client.get('/metrics').content.decode())
+        # Not cached: query strings and the browsable API
+        self.client.get('/api/users/me/?x=1')
+        self.client.get('/api/users/me/', HTTP_ACCEPT='text/html')
+        self.assertEqual(sum(response_cache.snapshot().values()), 2)
+
+    def test_changes_bump_versions(self):
+        from apps.tenants.models import TenantImage
+
+        self.client.get('/api/users/me/')
+        self.client.get('/api/tenants/me/')
+        self.client.get('/api/subscriptions/my_subscription/')
+
+        self.admin.first_name = 'Ada'
+        self.admin.save()
+        self.assertEqual(self.client.get('/api/users/me/').json()['first_name'], 'Ada')
+        self.role.name = 'Support'
+        self.role.save()
+        self.assertEqual(self.client.get('/api/users/me/').json()['roles'][0]['name'], 'Support')
+        self.admin.roles.clear()
+        self.assertEqual(self.client.get('/api/users/me/').json()['roles'], [])
+
+        self.tenant.name = 'Acme Inc'
+        self.tenant.save()
+        self.assertEqual(self.client.get('/api/users/me/').json()['tenant_name'], 'Acme Inc')
+        self.assertEqual(self.client.get('/api/tenants/me/').json()['name'], 'Acme Inc')
+        TenantImage.objects.bulk_create([TenantImage(tenant=self.tenant, image='tenants/a.png', label='a')])
+        # bulk_create sends no signals: stale until bumped
+        self.assertEqual(self.client.get('/api/tenants/me/').json()['gallery_images'], [])
+        TenantImage.objects.get().save()
+        self.assertEqual(len(self.client.get('/api/tenants/me/').json()['gallery_images']), 1)
+
+        self.subscription.status = 'PAST_DUE'
+        self.subscription.save()
+        self.assertEqual(self.client.get('/api/subscriptions/my_subscription/').json()['status'], 'PAST_DUE')
+
+    def test_concurrent_misses_computed_once(self):
+        import threading
+        import time
+
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return b'{}'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(response_cache.get_or_compute('rc:test', 'test', compute)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual({body for body, _ in results}, {b'{}'})
+        counts = response_cache.snapshot()
+        self.assertEqual(counts[('test', 'miss')], 1)
+        self.assertEqual(counts.get(('test', 'coalesced'), 0) + counts.get(('test', 'hit'), 0), 7)
+
+    @override_settings(ROOT_URLCONF='config.asgi_urls')
+    def test_async_view_answers_hits(self):
+        headers = {'Authorization': f'Bearer {RefreshToken.for_user(self.admin).access_token}'}
+        first = async_to_sync(self.async_client.get)('/api/tenants/me/', headers=headers)
+        second = async_to_sync(self.async_client.get)('/api/tenants/me/', headers=headers)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(response_cache.snapshot()[('tenant-me', 'hit')], 1)
+
+    @override_settings(ROOT_URLCONF='config.asgi_urls')
+    def test_async_view_computes_misses_for_the_sync_view(self):
+        headers = {'Authorization': f'Bearer {RefreshToken.for_user(self.admin).access_token}'}
+        for name, path in (('user-me', '/api/users/me/'), ('tenant-me', '/api/tenants/me/'),
+                           ('subscription-my-subscription', '/api/subscriptions/my_subscription/')):
+            fast = async_to_sync(self.async_client.get)(path, headers=headers)
+            with override_settings(ROOT_URLCONF='config.urls'):
+                regular = self.client.get(path)
+            self.assertEqual(fast.status_code, 200)
+            self.assertEqual(regular.content, fast.content, path)
+            self.assertEqual(response_cache.snapshot()[(name, 'miss')], 1)
+            self.assertEqual(response_cache.snapshot()[(name, 'hit')], 1)
+
+    @override_settings(ROOT_URLCONF='config.asgi_urls', RESPONSE_CACHE_ENABLED=False)
+    def test_async_views_serialize_when_disabled(self):
+        headers = {'Authorization': f'Bearer {RefreshToken.for_user(self.admin).access_token}'}
+        for path in ('/api/users/me/', '/api/tenants/me/', '/api/subscriptions/my_subscription/'):
+            fast = async_to_sync(self.async_client.get)(path, headers=headers)
+            with override_settings(ROOT_URLCONF='config.urls'):
+                regular = self.client.get(path)
+            self.assertEqual(fast.json(), regular.json(), path)
+        self.assertEqual(response_cache.snapshot(), {})
+
+
+class InvalidationBusTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        invalidation.register_handler('test')(self.calls.append)
+        self.addCleanup(invalidation._handlers.pop, 'test')
+
+    def event(self, version, keys, node='other-host:1'):
+        body = json.dumps({'node': node, 'kind': 'test', 'keys': keys, 'sent': time.time()})
+        return f'{version}:{body}'
+
+    def test_publish_bumps_counter_on_commit(self):
+        with override_settings(INVALIDATION_BUS=True), self.captureOnCommitCallbacks(execute=True) as callbacks:
+            invalidation.publish('test', [uuid.uuid4()])
+            self.assertEqual(invalidation.current_version(), 0)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(invalidation.current_version(), 1)
+        with self.captureOnCommitCallbacks() as callbacks:
+            invalidation.publish('test')
+        self.assertEqual(callbacks, [])
+
+    def test_listener_applies_events_of_other_processes(self):
+        listener = invalidation.Listener()
+        listener.version = 4
+        listener.receive(self.event(5, ['a', 'b']))
+        listener.receive(self.event(6, ['c'], node=invalidation._node()))
+        self.assertEqual(self.calls, [['a', 'b']])
+        self.assertEqual(listener.version, 6)
+
+    def test_gap_drops_everything(self):
+        listener = invalidation.Listener()
+        listener.version = 4
+        listener.receive(self.event(7, ['a']))
+        self.assertEqual(self.calls, [None])
+        self.assertEqual(listener.version, 7)
+
+    def test_poll_drops_everything_when_counter_moved(self):
+        listener = invalidation.Listener()
+        listener.poll()
+        listener.poll()
+        self.assertEqual(self.calls, [])
+        invalidation.send('test', None)
+        listener.poll()
+        self.assertEqual(self.calls, [None])
+
+    def test_entitlement_snapshots_dropped_by_published_ids(self):
+        from apps.billing import entitlements
+        tenant_id = uuid.uuid4()
+        entitlements._snapshots[tenant_id] = object()
+        self.addCleanup(entitlements._snapshots.pop, tenant_id, None)
+        invalidation.apply('entitlements', [str(tenant_id)])
+        self.assertNotIn(tenant_id, entitlements._snapshots)
+
+
+@unittest.skipIf(connection.vendor == 'sqlite', 'LISTEN/NOTIFY needs PostgreSQL')
+@override_settings(INVALIDATION_BUS=True, INVALIDATION_LISTEN=True)
+class InvalidationListenerTests(TransactionTestCase):
+    def test_notification_reaches_listener(self):
+        received = threading.Event()
+        invalidation.register_handler('test')(lambda keys: received.set())
+        self.addCleanup(invalidation._handlers.pop, 'test')
+        listener = invalidation.Listener()
+        listener.start()
+        self.addCleanup(listener.join)
+        self.addCleanup(listener.stop)
+        deadline = time.monotonic() + 5
+        while listener.version is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # Events of the same process are skipped: publish as another node
+        with unittest.mock.patch.object(invalidation, '_node', return_value='other-host:1'):
+            invalidation.publish('test', ['a'])
+        self.assertTrue(received.wait(5))
@@ -0,0 +1,170 @@
+"""
+Per-tenant API throttling by plan tier.
+
+Each tenant gets a token bucket sized by its plan's ``api_rate_limit``
+(requests per minute, read from the cached entitlement snapshot). Buckets
+live in process memory, spread over lock-striped shards so concurrent
+requests of different tenants rarely contend.
+
+With several processes or nodes, every process still enforces its own
+bucket. With ``THROTTLE_SYNC_INTERVAL`` set, it also periodically adds its
+consumption to a per-minute counter in the Django cache. A tenant whose
+cluster-wide count for the current minute reaches the limit is blocked
+locally until the minute ends.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+from apps.common.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Bucket state slots: tokens, last refill, requests not yet synced, blocked until, rate
+TOKENS, UPDATED, UNSYNCED, BLOCKED_UNTIL, RATE = range(5)
+IDLE_BUCKET_SECONDS = 120
+
+
+class _Shard:
+    __slots__ = ('lock', 'buckets')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+
+class TenantRateLimiter:
+    """
+    Sharded in-process token buckets with optional cluster reconciliation.
+
+    ``consume`` returns 0.0 if the request is allowed, otherwise the number of
+    seconds until it would be.
+    """
+
+    def __init__(self, shards=64, sync_interval=0, cache_alias='default'):
+        if shards & (shards - 1):
+            raise ValueError('shards must be a power of two')
+        self._shards = [_Shard() for _ in range(shards)]
+        self._mask = shards - 1
+        self.sync_interval = sync_interval
+        self.cache_alias = cache_alias
+        self._next_sync = time.monotonic() + sync_interval
+        self._sync_lock = threading.Lock()
+
+    def consume(self, key, rate, now=None):
+        now = now or time.monotonic()
+        shard = self._shards[hash(key) & self._mask]
+        with shard.lock:
+            state = shard.buckets.get(key)
+            if state is None:
+                state = shard.buckets[key] = [float(rate), now, 0, 0.0, rate]
+            state[RATE] = rate
+            if state[BLOCKED_UNTIL] > now:
+                wait = state[BLOCKED_UNTIL] - now
+            else:
+                tokens = min(float(rate), state[TOKENS] + (now - state[UPDATED]) * rate / 60.0)
+                state[UPDATED] = now
+                if tokens >= 1.0:
+                    state[TOKENS] = tokens - 1.0
+                    state[UNSYNCED] += 1
+                    wait = 0.0
+                else:
+                    state[TOKENS] = tokens
+                    wait = (1.0 - tokens) * 60.0 / rate
+
+        if self.sync_interval and now >= self._next_sync:
+            self.sync(now)
+        return wait
+
+    def _drain(self, now):
+        """Collect unsynced counts and drop idle buckets."""
+        pending = []
+        for shard in self._shards:
+            with shard.lock:
+                for key, state in list(shard.buckets.items()):
+                    if state[UNSYNCED]:
+                        pending.append((key, state[UNSYNCED], state[RATE]))
+                        state[UNSYNCED] = 0
+                    elif now - state[UPDATED] > IDLE_BUCKET_SECONDS and state[BLOCKED_UNTIL] <= now:
+                        del shard.buckets[key]
+        return pending
+
+    def sync(self, now=None):
+        """Push local counts to the shared cache and apply cluster-wide blocks."""
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            now = now or time.monotonic()
+            self._next_sync = now + self.sync_interval
+            pending = self._drain(now)
+            if not pending:
+                return
+            cache = caches[self.cache_alias]
+            wall = time.time()
+            window = int(wall // 60)
+            window_remaining = 60 - (wall % 60)
+            for key, count, rate in pending:
+                cache_key = f'throttle:{key}:{window}'
+                cache.add(cache_key, 0, 120)
+                try:
+                    total = cache.incr(cache_key, count)
+                except ValueError:
+                    # Expired between add() and incr()
+                    cache.set(cache_key, count, 120)
+                    total = count
+                if total >= rate:
+                    self._block(key, now + window_remaining)
+        except Exception:
+            logger.exception('Throttle counter sync failed')
+        finally:
+            self._sync_lock.release()
+
+    def _block(self, key, until):
+        shard = self._shards[hash(key) & self._mask]
+        with shard.lock:
+            state = shard.buckets.get(key)
+            if state is not None:
+                state[BLOCKED_UNTIL] = max(state[BLOCKED_UNTIL], until)
+
+    def reset(self):
+        for shard in self._shards:
+            with shard.lock:
+                shard.buckets.clear()
+
+
+tenant_rate_limiter = TenantRateLimiter(
+    shards=settings.THROTTLE_SHARDS,
+    sync_interval=settings.THROTTLE_SYNC_INTERVAL,
+)
+
+
+class TenantPlanRateThrottle(BaseThrottle):
+    """
+    Throttle keyed by tenant with the rate of the tenant's subscription plan.
+    Anonymous requests, super admins and users without a tenant are not
+    throttled here.
+    """
+    limiter = tenant_rate_limiter
+
+    def allow_request(self, request, view):
+        self._wait = 0.0
+        # Already counted by the async fast path handing the request on (apps/common/async_views.py)
+        if getattr(request, 'tenant_throttle_consumed', False):
+            return True
+        user = request.user
+        if not user or not user.is_authenticated or user.is_super_admin or not user.tenant_id:
+            return True
+
+        from apps.billing.entitlements import get_entitlements
+        rate = get_entitlements(user.tenant_id).rate_limit
+        if not rate:
+            return True
+
+        self._wait = self.limiter.consume(user.tenant_id, rate)
+        return self._wait == 0.0
+
+    def wait(self):
+        return self._wait
@@ -0,0 +1,11 @@
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from apps.common import views
+
+router = DefaultRouter()
+router.register('profiles', views.RequestProfileViewSet, basename='request-profile')
+
+urlpatterns = [
+    path('query-stats/', views.QueryStatsView.as_view(), name='query-stats'),
+    path('', include(router.urls)),
+]
@@ -0,0 +1,74 @@
+import hmac
+import ipaddress
+
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from apps.common import metrics, query_stats, response_cache
+from apps.common.models import RequestProfile
+from apps.common.permissions import IsSuperAdmin
+from apps.common.serializers import RequestProfileListSerializer, RequestProfileSerializer
+from apps.tenants.media import PassthroughRenderer, serve_media_file
+
+
+def _from_allowed_network(request):
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network, strict=False) for network in settings.METRICS_ALLOWED_NETWORKS)
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint.
+
+    Requires ``Authorization: Bearer <METRICS_TOKEN>`` when ``METRICS_TOKEN``
+    is set; otherwise only clients in ``METRICS_ALLOWED_NETWORKS`` are served.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse(status=401)
+    elif not _from_allowed_network(request):
+        return HttpResponse(status=403)
+    return HttpResponse(
+        metrics.render(metrics.collect()) + response_cache.render(response_cache.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+class QueryStatsView(APIView):
+    """SQL fingerprints per view ordered by total time, and the slowest samples (super admins)"""
+    permission_classes = [IsSuperAdmin]
+
+    def get(self, request):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 50)), 1), 500)
+        except ValueError:
+            limit = 50
+        return Response(query_stats.report(view=request.query_params.get('view') or None, limit=limit))
+
+
+class RequestProfileViewSet(viewsets.ReadOnlyModelViewSet):
+    """Captured request profiles (see apps/common/profiling.py), for super admins"""
+    queryset = RequestProfile.objects.all()
+    permission_classes = [IsSuperAdmin]
+    filterset_fields = ['view_name', 'trigger', 'tenant', 'status_code']
+    ordering_fields = ['created_at', 'duration_ms', 'peak_memory_kb']
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return RequestProfileListSerializer
+        return RequestProfileSerializer
+
+    @action(detail=True, methods=['get'], renderer_classes=[PassthroughRenderer])
+    def download(self, request, pk=None):
+        """Download the pstats file"""
+        profile = self.get_object()
+        response = serve_media_file(request, profile.profile.name, storage=profile.profile.storage)
+        response['Content-Disposition'] = f'attachment; filename="{profile.id}.prof"'
+        return response
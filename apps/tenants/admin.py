@@ -1,5 +1,5 @@
 from django.contrib import admin
-from apps.tenants.models import Tenant, TenantImage
+from apps.tenants.models import Tenant, TenantImage, PendingFileDeletion, ProvisioningJob
 
 
 @admin.register(Tenant)
@@ -30,3 +30,19 @@ class TenantImageAdmin(admin.ModelAdmin):
         ('Options', {'fields': ('order', 'is_active')}),
         ('Metadata', {'fields': ('id', 'created_at', 'updated_at')}),
     )
+
+
+@admin.register(PendingFileDeletion)
+class PendingFileDeletionAdmin(admin.ModelAdmin):
+    list_display = ['name', 'attempts', 'created_at']
+    search_fields = ['name']
+    readonly_fields = ['name', 'attempts', 'last_error', 'created_at']
+
+
+@admin.register(ProvisioningJob)
+class ProvisioningJobAdmin(admin.ModelAdmin):
+    list_display = ['tenant', 'status', 'current_step', 'attempts', 'created_at', 'finished_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['tenant__name', 'tenant__slug']
+    readonly_fields = ['id', 'completed_steps', 'error', 'attempts', 'started_at', 'finished_at',
+                       'created_at', 'updated_at']
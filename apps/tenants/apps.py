@@ -5,3 +5,6 @@ class TenantsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.tenants'
     label = 'tenants'
+
+    def ready(self):
+        from apps.tenants import signals  # noqa: F401
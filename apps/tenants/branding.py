@@ -0,0 +1,81 @@
+"""
+Per-tenant branding manifest.
+
+The frontend needs every active tenant image (logo, banner, favicon, ...) on
+page load. Instead of one ``by_label`` request per label, the manifest groups
+them by label. It is built once per tenant, stored pre-encoded in Django's
+cache and invalidated by the ``TenantImage`` signals in
+``apps/tenants/signals.py``, in other processes through the invalidation
+bus (``apps/common/invalidation.py``).
+"""
+
+import hashlib
+import json
+import os
+
+from django.core.cache import cache
+from django.db import transaction
+from django.urls import reverse
+from apps.common import invalidation
+from apps.tenants.media import file_etag
+from apps.tenants.models import TenantImage
+
+CACHE_KEY = 'tenant-branding:{generation}:{tenant_id}'
+CACHE_TIMEOUT = 60 * 60 * 24
+
+# Bumped to drop every manifest this process cached
+_generation = 0
+
+
+def _image_url(image):
+    url = reverse('tenant-image-file', args=[image.id])
+    try:
+        stat_result = os.stat(image.image.path)
+    except (NotImplementedError, FileNotFoundError, ValueError):
+        return url
+    # Versioned URL: the file endpoint serves it with a long-lived Cache-Control
+    version = file_etag(image.image.name, stat_result).strip('"')
+    return f'{url}?v={version}'
+
+
+def build_manifest(tenant_id):
+    """Build the manifest body and ETag for a tenant from the database."""
+    images = TenantImage.objects.filter(tenant_id=tenant_id, is_active=True).order_by('order', '-created_at')
+    manifest = {}
+    for image in images:
+        manifest[image.label] = {
+            'id': str(image.id),
+            'url': _image_url(image),
+            'description': image.description,
+            'order': image.order,
+            'updated_at': image.updated_at.isoformat(),
+        }
+    body = json.dumps({'tenant': str(tenant_id), 'images': manifest}, separators=(',', ':')).encode()
+    etag = '"%s"' % hashlib.sha1(body).hexdigest()
+    return {'etag': etag, 'body': body}
+
+
+def get_manifest(tenant_id):
+    """Return the cached manifest for a tenant, building it on a miss."""
+    key = CACHE_KEY.format(generation=_generation, tenant_id=tenant_id)
+    manifest = cache.get(key)
+    if manifest is None:
+        manifest = build_manifest(tenant_id)
+        cache.set(key, manifest, CACHE_TIMEOUT)
+    return manifest
+
+
+def invalidate_manifest(tenant_id):
+    """Drop a tenant's manifest now and again on commit, in case it was rebuilt from rows not yet committed."""
+    _drop_manifests([tenant_id])
+    transaction.on_commit(lambda: _drop_manifests([tenant_id]))
+    invalidation.publish('branding', [tenant_id])
+
+
+@invalidation.register_handler('branding')
+def _drop_manifests(tenant_ids):
+    global _generation
+    if tenant_ids is None:
+        _generation += 1
+        return
+    cache.delete_many([CACHE_KEY.format(generation=_generation, tenant_id=tenant_id) for tenant_id in tenant_ids])
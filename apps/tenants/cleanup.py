@@ -0,0 +1,157 @@
+"""
+Deferred removal of media files.
+
+Deleting a ``TenantImage`` row only queues its storage key in
+``PendingFileDeletion`` (inside the same transaction, see
+``apps/tenants/signals.py``). The sweeper below removes the files in batches
+off the request path, and ``reconcile_media_files`` finds files under
+``MEDIA_ROOT`` that no row references at all.
+"""
+
+import os
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.db.models import F
+from apps.common.logger import get_logger
+from apps.common.tasks import run_in_background
+from apps.tenants.models import PendingFileDeletion
+
+logger = get_logger(__name__)
+
+_sweep_lock = threading.Lock()
+_sweep_pending = False
+
+
+def file_fields():
+    """Return ``(model, field_name)`` for every FileField of every installed model."""
+    return [
+        (model, field.name)
+        for model in apps.get_models()
+        for field in model._meta.concrete_fields
+        if isinstance(field, models.FileField)
+    ]
+
+
+def referenced_names(names):
+    """Return the subset of storage ``names`` still referenced by a FileField."""
+    names = list(names)
+    referenced = set()
+    for model, field_name in file_fields():
+        referenced.update(
+            model._default_manager.filter(**{f'{field_name}__in': names}).values_list(field_name, flat=True)
+        )
+    return referenced
+
+
+def sweep_pending_deletions(batch_size=None, max_attempts=None):
+    """
+    Delete queued files in batches of ``batch_size``.
+
+    Rows are claimed with ``SELECT ... FOR UPDATE SKIP LOCKED`` so several
+    sweepers can run at once. Files that are referenced again (e.g. a restored
+    row) are kept. Failures are retried up to ``max_attempts`` times.
+
+    Returns:
+        int: number of files deleted
+    """
+    batch_size = batch_size or settings.FILE_DELETION_BATCH_SIZE
+    max_attempts = max_attempts or settings.FILE_DELETION_MAX_ATTEMPTS
+    deleted = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                PendingFileDeletion.objects.select_for_update(skip_locked=True)
+                .filter(id__gt=last_id, attempts__lt=max_attempts)
+                .order_by('id')[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].id
+            in_use = referenced_names({pending.name for pending in batch})
+            done, failed = [], []
+            for pending in batch:
+                if pending.name in in_use:
+                    done.append(pending.id)
+                    continue
+                try:
+                    default_storage.delete(pending.name)
+                except OSError as e:
+                    logger.warning('Could not delete file %s: %s', pending.name, e)
+                    failed.append((pending.id, str(e)))
+                    continue
+                done.append(pending.id)
+                deleted += 1
+            PendingFileDeletion.objects.filter(id__in=done).delete()
+            for pending_id, error in failed:
+                PendingFileDeletion.objects.filter(id=pending_id).update(
+                    attempts=F('attempts') + 1, last_error=error
+                )
+        if len(batch) < batch_size:
+            break
+    if deleted:
+        logger.info('Deleted %d queued media file(s)', deleted)
+    return deleted
+
+
+def _run_scheduled_sweep():
+    global _sweep_pending
+    with _sweep_lock:
+        _sweep_pending = False
+    sweep_pending_deletions()
+
+
+def schedule_sweep():
+    """Queue one background sweep; calls made while one is pending are coalesced."""
+    global _sweep_pending
+    with _sweep_lock:
+        if _sweep_pending:
+            return
+        _sweep_pending = True
+    run_in_background(_run_scheduled_sweep)
+
+
+def iter_media_files(root, min_age_seconds=0):
+    """
+    Yield storage names (relative, ``/``-separated) of files under ``root``.
+
+    Directories are walked lazily with ``os.scandir`` so memory stays flat for
+    any tree size. Files modified within ``min_age_seconds`` are skipped to
+    avoid racing uploads whose rows are not committed yet.
+    """
+    cutoff = time.time() - min_age_seconds
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = os.scandir(directory)
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False) and entry.stat().st_mtime <= cutoff:
+                    yield os.path.relpath(entry.path, root).replace(os.sep, '/')
+
+
+def find_orphaned_files(root=None, batch_size=1000, min_age_seconds=0):
+    """Yield batches of files under ``root`` that no FileField references."""
+    root = root or settings.MEDIA_ROOT
+    batch = []
+    for name in iter_media_files(root, min_age_seconds):
+        batch.append(name)
+        if len(batch) >= batch_size:
+            orphans = set(batch) - referenced_names(batch)
+            if orphans:
+                yield sorted(orphans)
+            batch = []
+    if batch:
+        orphans = set(batch) - referenced_names(batch)
+        if orphans:
+            yield sorted(orphans)
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from apps.tenants.cleanup import find_orphaned_files
+
+
+class Command(BaseCommand):
+    help = 'Find and remove files under MEDIA_ROOT that no database row references'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only list orphaned files')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--min-age-hours', type=float, default=24,
+            help='Ignore files modified more recently than this (in-flight uploads)'
+        )
+
+    def handle(self, *args, **options):
+        orphaned = 0
+        for batch in find_orphaned_files(
+            settings.MEDIA_ROOT,
+            batch_size=options['batch_size'],
+            min_age_seconds=options['min_age_hours'] * 3600,
+        ):
+            for name in batch:
+                if options['dry_run']:
+                    self.stdout.write(name)
+                else:
+                    default_storage.delete(name)
+            orphaned += len(batch)
+
+        action = 'Found' if options['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(f'{action} {orphaned} orphaned file(s)'))
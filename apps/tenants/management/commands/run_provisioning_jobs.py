@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from apps.tenants.provisioning import retry_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run pending tenant provisioning jobs and retry failed or stalled ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-attempts', type=int, default=None)
+
+    def handle(self, *args, **options):
+        count = retry_jobs(max_attempts=options['max_attempts'])
+        self.stdout.write(self.style.SUCCESS(f'Ran {count} provisioning job(s)'))
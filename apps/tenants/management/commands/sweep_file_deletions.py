@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.tenants.cleanup import sweep_pending_deletions
+
+
+class Command(BaseCommand):
+    help = 'Delete media files queued by deleted rows (PendingFileDeletion)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.FILE_DELETION_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        deleted = sweep_pending_deletions(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} file(s)'))
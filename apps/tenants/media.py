@@ -0,0 +1,212 @@
+"""
+Production delivery of media files stored on the local filesystem.
+
+Django only serves ``MEDIA_URL`` under ``DEBUG``. The helpers here build
+responses for already-authorized files with:
+
+- strong ETags and ``If-None-Match`` / ``If-Range`` handling
+- single byte-range requests (``206`` / ``416``)
+- hand-off to the front-end server through ``X-Accel-Redirect`` (nginx) or
+  ``X-Sendfile`` (Apache/lighttpd) when ``MEDIA_SENDFILE_BACKEND`` is set
+- a ``FileResponse`` fallback so WSGI servers can use ``sendfile`` for full
+  responses
+"""
+
+import hashlib
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import (
+    FileResponse,
+    HttpResponse,
+    HttpResponseNotModified,
+    HttpResponseRedirect,
+    StreamingHttpResponse,
+)
+from django.utils.http import http_date
+from rest_framework.renderers import BaseRenderer
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class PassthroughRenderer(BaseRenderer):
+    """
+    Renderer that accepts any media type so DRF content negotiation never
+    rejects image requests (browsers send ``Accept: image/*``). Views using it
+    return plain Django responses.
+    """
+    media_type = '*/*'
+    format = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
+def file_etag(name, stat_result):
+    """Strong ETag derived from the storage name, size and modification time."""
+    token = f'{name}:{stat_result.st_size}:{stat_result.st_mtime_ns}'
+    return '"%s"' % hashlib.sha1(token.encode()).hexdigest()
+
+
+def _opaque_tag(tag):
+    tag = tag.strip()
+    return tag[2:] if tag.startswith('W/') else tag
+
+
+def etag_matches(header, etag, weak=True):
+    """
+    Return True if an ``If-None-Match`` / ``If-Range`` header matches ``etag``.
+
+    ``If-None-Match`` uses the weak comparison, which ignores ``W/``
+    prefixes (RFC 9110, 13.1.2); pass ``weak=False`` for the strong
+    comparison ``If-Range`` requires.
+    """
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    tags = [tag.strip() for tag in header.split(',')]
+    if not weak:
+        return etag in tags
+    return _opaque_tag(etag) in [_opaque_tag(tag) for tag in tags]
+
+
+def parse_range_header(header, size):
+    """
+    Parse a single ``bytes=`` range against a file of ``size`` bytes.
+
+    Returns:
+        None if the header is absent, malformed or asks for several ranges
+        (the full file is served in that case), ``(start, end)`` inclusive
+        offsets for a satisfiable range, or ``False`` if the range cannot be
+        satisfied.
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if last and start > end:
+        return None
+    if start >= size:
+        return False
+    return start, min(end, size - 1)
+
+
+def _iter_file_range(path, start, length):
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = fh.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _cache_control(request, etag):
+    # URLs carrying the current version (``?v=<etag>``) are content-addressed
+    # and can be cached for a long time; anything else must revalidate, which
+    # costs a stat() and a 304.
+    if request.GET.get('v') == etag.strip('"'):
+        return f'private, max-age={settings.MEDIA_CACHE_MAX_AGE}, immutable'
+    return 'private, no-cache'
+
+
+def serve_media_file(request, name, storage=None):
+    """
+    Build the response for the stored file ``name``.
+
+    Authorization must already have been performed by the caller.
+    """
+    storage = storage or default_storage
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        # Remote storage: let the storage backend serve the object itself
+        return HttpResponseRedirect(storage.url(name))
+
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        return HttpResponse(status=404)
+
+    size = stat_result.st_size
+    etag = file_etag(name, stat_result)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat_result.st_mtime),
+        'Cache-Control': _cache_control(request, etag),
+        'Accept-Ranges': 'bytes',
+    }
+
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        response = HttpResponseNotModified()
+        for key, value in headers.items():
+            response[key] = value
+        return response
+
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    backend = settings.MEDIA_SENDFILE_BACKEND
+    if backend:
+        # The front-end server handles ranges and the body transfer
+        response = HttpResponse(content_type=content_type)
+        if backend == 'nginx':
+            response['X-Accel-Redirect'] = settings.MEDIA_SENDFILE_PREFIX.rstrip('/') + '/' + quote(name)
+        else:
+            response['X-Sendfile'] = path
+        for key, value in headers.items():
+            response[key] = value
+        return response
+
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if not if_range or etag_matches(if_range, etag, weak=False):
+        byte_range = parse_range_header(request.headers.get('Range'), size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        if request.method == 'HEAD':
+            response = HttpResponse(status=206, content_type=content_type)
+        else:
+            response = StreamingHttpResponse(
+                _iter_file_range(path, start, length),
+                status=206,
+                content_type=content_type,
+            )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(length)
+    elif request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+        response['Content-Length'] = str(size)
+    else:
+        # FileResponse exposes the file to wsgi.file_wrapper (sendfile)
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+
+    for key, value in headers.items():
+        response[key] = value
+    return response
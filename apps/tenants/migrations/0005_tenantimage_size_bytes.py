@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-19 03:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenants', '0004_provisioningjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tenantimage',
+            name='size_bytes',
+            field=models.BigIntegerField(default=0, editable=False, help_text='Stored bytes of the file, counted against the plan storage limit'),
+        ),
+    ]
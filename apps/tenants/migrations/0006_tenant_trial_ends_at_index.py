@@ -0,0 +1,17 @@
+# Generated by Django 5.0.14 on 2026-10-19 03:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenants', '0005_tenantimage_size_bytes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tenant',
+            index=models.Index(fields=['trial_ends_at'], name='tenants_trial_e_1a24dc_idx'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 import uuid
-from django.db import models
+from django.db import models, transaction
+from apps.common.constants import PROVISIONING_STATUS_CHOICES
 
 
 class Tenant(models.Model):
@@ -23,6 +24,9 @@ class Tenant(models.Model):
     class Meta:
         db_table = 'tenants'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['trial_ends_at']),
+        ]
 
     def __str__(self):
         return self.name
@@ -58,6 +62,11 @@ class TenantImage(models.Model):
         default=True,
         help_text="Whether this image is active"
     )
+    size_bytes = models.BigIntegerField(
+        default=0,
+        editable=False,
+        help_text="Stored bytes of the file, counted against the plan storage limit"
+    )
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -73,3 +82,71 @@ class TenantImage(models.Model):
 
     def __str__(self):
         return f"{self.tenant.name} - {self.label}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored file so save() only re-measures replaced files
+        instance._loaded_image_name = instance.__dict__.get('image')
+        return instance
+
+    def save(self, *args, **kwargs):
+        """Record the file size and move the tenant storage counter in the same transaction."""
+        from apps.billing.quotas import consume_quota, release_quota
+
+        if not self._state.adding and self.image.name == getattr(self, '_loaded_image_name', self.image.name):
+            super().save(*args, **kwargs)
+            return
+
+        previous_size = 0 if self._state.adding else self.size_bytes
+        self.size_bytes = self.image.size if self.image else 0
+        delta = self.size_bytes - previous_size
+        with transaction.atomic(using=kwargs.get('using')):
+            if delta > 0:
+                consume_quota(self.tenant_id, 'storage', delta)
+            elif delta < 0:
+                release_quota(self.tenant_id, 'storage', -delta)
+            super().save(*args, **kwargs)
+        self._loaded_image_name = self.image.name
+
+
+class PendingFileDeletion(models.Model):
+    """Storage key whose row was deleted; the file is removed by the background sweeper"""
+    name = models.CharField(max_length=500, help_text="Storage name of the file to delete")
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'pending_file_deletions'
+        ordering = ['id']
+
+    def __str__(self):
+        return self.name
+
+
+class ProvisioningJob(models.Model):
+    """Background setup of a newly registered tenant (database, default roles, seed data, email)"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='provisioning_jobs')
+    status = models.CharField(max_length=20, choices=PROVISIONING_STATUS_CHOICES, default='PENDING')
+    completed_steps = models.JSONField(default=list, help_text="Names of finished steps, skipped on retry")
+    current_step = models.CharField(max_length=50, blank=True)
+    payload = models.JSONField(default=dict, help_text="Inputs for the steps, e.g. the admin user id")
+    error = models.TextField(blank=True, null=True)
+    attempts = models.IntegerField(default=0)
+
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'provisioning_jobs'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.tenant.name} - {self.status}"
@@ -0,0 +1,198 @@
+"""
+Background provisioning of newly registered tenants.
+
+``RegisterSerializer`` creates the tenant, admin user, admin role and trial
+subscription in one transaction and queues a ``ProvisioningJob``. The slow,
+non-essential steps run here afterwards, in order. Each step is idempotent
+and recorded in ``ProvisioningJob.completed_steps``, so a failed job can be
+retried with ``python manage.py run_provisioning_jobs`` without repeating
+finished work.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from apps.common.constants import PERMISSION_SCHEMA, DEFAULT_TENANT_ROLES, DEFAULT_TENANT_SETTINGS
+from apps.common.logger import get_logger
+from apps.common.tasks import run_on_commit
+from apps.tenants.models import ProvisioningJob
+
+logger = get_logger(__name__)
+
+
+def provision_database(job):
+    """
+    Create a dedicated PostgreSQL database when TENANT_DATABASE_ADMIN_URL is
+    configured. Only its name is stored: the admin credentials must not end
+    up on tenant rows, where the admin site, the API and dumps show them.
+    """
+    tenant = job.tenant
+    admin_url = settings.TENANT_DATABASE_ADMIN_URL
+    if not admin_url or tenant.database_name:
+        return
+
+    import psycopg2
+    from psycopg2 import errors, sql
+
+    database_name = f"tenant_{tenant.slug.replace('-', '_')}"
+    connection = psycopg2.connect(admin_url)
+    try:
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            try:
+                cursor.execute(sql.SQL('CREATE DATABASE {}').format(sql.Identifier(database_name)))
+            except errors.DuplicateDatabase:
+                # Created by an earlier attempt that failed later on
+                pass
+    finally:
+        connection.close()
+
+    tenant.database_name = database_name
+    tenant.save(update_fields=['database_name', 'updated_at'])
+
+
+def build_role_permissions(enabled_modules, scope, actions=None):
+    """Nested permissions for every resource of the enabled modules."""
+    permissions = {}
+    for module in enabled_modules:
+        schema = PERMISSION_SCHEMA.get(module)
+        if not schema:
+            continue
+        module_perms = permissions.setdefault(module, {})
+        for resource, resource_schema in schema['resources'].items():
+            resource_perms = module_perms.setdefault(resource, {})
+            for action, action_schema in resource_schema['actions'].items():
+                if action_schema['type'] == 'scope':
+                    resource_perms[action] = scope
+                else:
+                    resource_perms[action] = actions is None or action in actions
+    return permissions
+
+
+def create_default_roles(job):
+    from apps.accounts.models import Role
+
+    tenant = job.tenant
+    Role.objects.bulk_create(
+        [
+            Role(
+                tenant=tenant,
+                name=role['name'],
+                description=role['description'],
+                permissions=build_role_permissions(tenant.enabled_modules, role['scope'], role['actions']),
+                created_by_id=job.payload.get('admin_user_id'),
+            )
+            for role in DEFAULT_TENANT_ROLES
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def seed_tenant_settings(job):
+    tenant = job.tenant
+    merged = {**DEFAULT_TENANT_SETTINGS, **tenant.settings}
+    if merged != tenant.settings:
+        tenant.settings = merged
+        tenant.save(update_fields=['settings', 'updated_at'])
+
+
+def send_welcome_email(job):
+    from apps.accounts.models import CustomUser
+
+    user = CustomUser.objects.filter(id=job.payload.get('admin_user_id')).first()
+    if not user:
+        return
+    send_mail(
+        subject=f'Welcome to {job.tenant.name}',
+        message=(
+            f'Hi {user.first_name or user.email},\n\n'
+            f'Your workspace "{job.tenant.name}" is ready. '
+            f'Sign in with {user.email} to get started.'
+        ),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        recipient_list=[user.email],
+    )
+
+
+STEPS = [
+    ('database', provision_database),
+    ('default_roles', create_default_roles),
+    ('seed_data', seed_tenant_settings),
+    ('welcome_email', send_welcome_email),
+]
+
+
+def enqueue_provisioning(tenant, admin_user):
+    """Create a job for ``tenant`` and start it once the transaction commits."""
+    job = ProvisioningJob.objects.create(tenant=tenant, payload={'admin_user_id': str(admin_user.id)})
+    run_on_commit(run_job, job.id)
+    return job
+
+
+def run_job(job_id):
+    """Run the remaining steps of a job. Returns False if another worker owns it."""
+    claimed = ProvisioningJob.objects.filter(id=job_id, status='PENDING').update(
+        status='RUNNING', started_at=timezone.now(), attempts=F('attempts') + 1, error=None
+    )
+    if not claimed:
+        return False
+
+    job = ProvisioningJob.objects.select_related('tenant').get(id=job_id)
+    for name, step in STEPS:
+        if name in job.completed_steps:
+            continue
+        job.current_step = name
+        job.save(update_fields=['current_step', 'updated_at'])
+        try:
+            with transaction.atomic():
+                step(job)
+        except Exception as e:
+            logger.error('Provisioning step %s failed for tenant %s: %s', name, job.tenant.slug, e, exc_info=True)
+            job.status = 'FAILED'
+            job.error = f'{name}: {e}'
+            job.finished_at = timezone.now()
+            job.save(update_fields=['status', 'error', 'finished_at', 'updated_at'])
+            return True
+        job.completed_steps.append(name)
+        job.save(update_fields=['completed_steps', 'updated_at'])
+
+    job.status = 'SUCCEEDED'
+    job.current_step = ''
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'current_step', 'finished_at', 'updated_at'])
+    logger.info('Tenant %s provisioned', job.tenant.slug)
+    return True
+
+
+def retry_jobs(max_attempts=None, stale_after=None):
+    """
+    Requeue failed jobs and jobs whose worker died, then run all pending jobs.
+
+    Returns:
+        int: number of jobs run
+    """
+    max_attempts = max_attempts or settings.PROVISIONING_MAX_ATTEMPTS
+    stale_after = stale_after or timedelta(minutes=settings.PROVISIONING_STALE_MINUTES)
+    ProvisioningJob.objects.filter(
+        Q(status='FAILED') | Q(status='RUNNING', updated_at__lt=timezone.now() - stale_after),
+        attempts__lt=max_attempts,
+    ).update(status='PENDING')
+
+    pending = ProvisioningJob.objects.filter(status='PENDING').order_by('created_at').values_list('id', flat=True)
+    return sum(1 for job_id in list(pending) if run_job(job_id))
+
+
+def get_job_status(job_id):
+    """Status row for polling, read with a single primary-key lookup."""
+    job = (
+        ProvisioningJob.objects.filter(id=job_id)
+        .values('id', 'status', 'completed_steps', 'current_step', 'updated_at')
+        .first()
+    )
+    if job:
+        job['total_steps'] = len(STEPS)
+    return job
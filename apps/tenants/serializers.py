@@ -9,8 +9,8 @@ class TenantImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = TenantImage
         fields = ['id', 'tenant', 'image', 'image_url', 'label', 'description',
-                  'order', 'is_active', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'created_at', 'updated_at']
+                  'order', 'is_active', 'size_bytes', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'size_bytes', 'created_at', 'updated_at']
 
     def get_image_url(self, obj):
         """Return the full URL for the image"""
@@ -38,14 +38,26 @@ class TenantImageCreateSerializer(serializers.ModelSerializer):
 
 class TenantSerializer(serializers.ModelSerializer):
     user_count = serializers.SerializerMethodField()
+    storage_used_bytes = serializers.SerializerMethodField()
     gallery_images = TenantImageSerializer(many=True, read_only=True)
 
     class Meta:
         model = Tenant
         fields = ['id', 'name', 'slug', 'domain', 'database_name', 'database_url',
                   'enabled_modules', 'settings', 'is_active', 'trial_ends_at',
-                  'user_count', 'gallery_images', 'created_at', 'updated_at']
+                  'user_count', 'storage_used_bytes', 'gallery_images', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
 
     def get_user_count(self, obj):
-        return obj.users.count()
+        # Annotated where the tenant is loaded for serialization (see async_tenant_me_view)
+        count = getattr(obj, 'user_count', None)
+        return obj.users.count() if count is None else count
+
+    def get_storage_used_bytes(self, obj):
+        return get_storage_used_bytes(obj)
+
+
+def get_storage_used_bytes(tenant):
+    """Running storage total from the usage counter; 0 before the first upload."""
+    usage = getattr(tenant, 'usage', None)
+    return usage.storage_bytes if usage else 0
@@ -0,0 +1,20 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from apps.tenants.models import TenantImage, PendingFileDeletion
+from apps.tenants.branding import invalidate_manifest
+from apps.tenants.cleanup import schedule_sweep
+
+
+@receiver(post_save, sender=TenantImage)
+@receiver(post_delete, sender=TenantImage)
+def invalidate_branding_manifest(sender, instance, **kwargs):
+    invalidate_manifest(instance.tenant_id)
+
+
+@receiver(post_delete, sender=TenantImage)
+def queue_image_file_deletion(sender, instance, **kwargs):
+    """Queue the file in the delete's transaction; remove it after commit"""
+    if instance.image:
+        PendingFileDeletion.objects.create(name=instance.image.name)
+        transaction.on_commit(schedule_sweep)
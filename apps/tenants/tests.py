@@ -0,0 +1,261 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework import status
+from apps.accounts.models import CustomUser, Role
+from apps.billing.models import SubscriptionPlan, Subscription, TenantUsage
+from apps.billing.quotas import QuotaExceeded
+from apps.tenants.models import Tenant, TenantImage, PendingFileDeletion
+from apps.tenants.cleanup import sweep_pending_deletions
+
+
+IMAGE_BYTES = b'GIF89a' + bytes(range(256)) * 4
+
+
+class TenantImageTestMixin:
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        cache.clear()
+
+        self.tenant = Tenant.objects.create(name='Test Company', slug='test-company')
+        self.user = CustomUser.objects.create_user(
+            email='admin@example.com',
+            password='TestPass123!',
+            tenant=self.tenant
+        )
+        self.admin_role = Role.objects.create(
+            tenant=self.tenant,
+            name='Admin',
+            permissions={'admin': {'full_access': True}},
+            created_by=self.user
+        )
+        self.user.roles.add(self.admin_role)
+        self.image = TenantImage.objects.create(
+            tenant=self.tenant,
+            image=SimpleUploadedFile('logo.gif', IMAGE_BYTES, content_type='image/gif'),
+            label='logo'
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+
+class TenantImageFileTests(TenantImageTestMixin, APITestCase):
+    def url(self):
+        return f'/api/tenant-images/{self.image.id}/file/'
+
+    def test_full_download(self):
+        response = self.client.get(self.url(), HTTP_ACCEPT='image/*')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), IMAGE_BYTES)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertTrue(response['ETag'].startswith('"'))
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get(self.url())['ETag']
+        response = self.client.get(self.url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_weak_validators(self):
+        etag = self.client.get(self.url())['ETag']
+        # If-None-Match compares weakly: a proxy's W/ prefix still matches
+        response = self.client.get(self.url(), HTTP_IF_NONE_MATCH=f'"other", W/{etag}')
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        # If-Range compares strongly: a weak validator gets the full file
+        response = self.client.get(self.url(), HTTP_RANGE='bytes=6-15', HTTP_IF_RANGE=f'W/{etag}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(self.url(), HTTP_RANGE='bytes=6-15', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+
+    def test_versioned_url_is_long_lived(self):
+        etag = self.client.get(self.url())['ETag']
+        response = self.client.get(self.url(), {'v': etag.strip('"')})
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_byte_range(self):
+        response = self.client.get(self.url(), HTTP_RANGE='bytes=6-15')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Range'], f'bytes 6-15/{len(IMAGE_BYTES)}')
+        self.assertEqual(b''.join(response.streaming_content), IMAGE_BYTES[6:16])
+
+    def test_suffix_range(self):
+        response = self.client.get(self.url(), HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(response.streaming_content), IMAGE_BYTES[-4:])
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url(), HTTP_RANGE=f'bytes={len(IMAGE_BYTES)}-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+    @override_settings(MEDIA_SENDFILE_BACKEND='nginx', MEDIA_SENDFILE_PREFIX='/protected-media/')
+    def test_accel_redirect(self):
+        response = self.client.get(self.url())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['X-Accel-Redirect'].startswith('/protected-media/tenant_gallery/'))
+
+    def test_other_tenant_cannot_download(self):
+        other_tenant = Tenant.objects.create(name='Other', slug='other')
+        other_user = CustomUser.objects.create_user(
+            email='other@example.com',
+            password='TestPass123!',
+            tenant=other_tenant
+        )
+        self.client.force_authenticate(user=other_user)
+        response = self.client.get(self.url())
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BrandingManifestTests(TenantImageTestMixin, APITestCase):
+    url = '/api/tenant-images/branding/'
+
+    def test_manifest_keyed_by_label(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        images = response.json()['images']
+        self.assertEqual(list(images), ['logo'])
+        self.assertIn(f'/api/tenant-images/{self.image.id}/file/?v=', images['logo']['url'])
+
+    def test_cache_hit_runs_no_queries(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_invalidated_on_save_and_delete(self):
+        self.client.get(self.url)
+        banner = TenantImage.objects.create(
+            tenant=self.tenant,
+            image=SimpleUploadedFile('banner.gif', IMAGE_BYTES, content_type='image/gif'),
+            label='banner'
+        )
+        self.assertEqual(set(self.client.get(self.url).json()['images']), {'logo', 'banner'})
+        banner.delete()
+        self.assertEqual(set(self.client.get(self.url).json()['images']), {'logo'})
+
+    def test_manifest_rebuilt_before_commit_is_dropped_on_commit(self):
+        from apps.tenants import branding
+        with self.captureOnCommitCallbacks(execute=True):
+            self.image.label = 'emblem'
+            self.image.save()
+            # Stands in for a request that read the rows before the save committed
+            key = branding.CACHE_KEY.format(generation=branding._generation, tenant_id=self.tenant.id)
+            cache.set(key, {'etag': '"stale"', 'body': b'{}'})
+        self.assertEqual(set(self.client.get(self.url).json()['images']), {'emblem'})
+
+
+class FileCleanupTests(TenantImageTestMixin, APITestCase):
+    def test_delete_by_label_queues_and_sweeps_file(self):
+        path = self.image.image.path
+        super_admin = CustomUser.objects.create_superuser(email='root@example.com', password='TestPass123!')
+        self.client.force_authenticate(user=super_admin)
+        response = self.client.delete('/api/tenant-images/delete_by_label/?label=logo')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Deleted 1 image(s)', response.data['message'])
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(PendingFileDeletion.objects.count(), 1)
+
+        self.assertEqual(sweep_pending_deletions(), 1)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(PendingFileDeletion.objects.exists())
+
+    def test_sweep_keeps_referenced_files(self):
+        PendingFileDeletion.objects.create(name=self.image.image.name)
+        self.assertEqual(sweep_pending_deletions(), 0)
+        self.assertTrue(os.path.exists(self.image.image.path))
+        self.assertFalse(PendingFileDeletion.objects.exists())
+
+    def test_reconcile_removes_orphans(self):
+        orphan = os.path.join(self.media_root, 'tenant_gallery', 'orphan.gif')
+        with open(orphan, 'wb') as fh:
+            fh.write(IMAGE_BYTES)
+        call_command('reconcile_media_files', min_age_hours=0, stdout=open(os.devnull, 'w'))
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(self.image.image.path))
+
+
+class StorageUsageTests(TenantImageTestMixin, APITestCase):
+    def storage_used(self):
+        return TenantUsage.objects.get(tenant=self.tenant).storage_bytes
+
+    def upload(self, label, content=IMAGE_BYTES):
+        return TenantImage.objects.create(
+            tenant=self.tenant,
+            image=SimpleUploadedFile(f'{label}.gif', content, content_type='image/gif'),
+            label=label
+        )
+
+    def test_size_recorded_and_counted(self):
+        self.assertEqual(self.image.size_bytes, len(IMAGE_BYTES))
+        self.upload('banner')
+        self.assertEqual(self.storage_used(), 2 * len(IMAGE_BYTES))
+
+        self.image.delete()
+        self.assertEqual(self.storage_used(), len(IMAGE_BYTES))
+
+    def test_replacing_file_moves_counter_by_difference(self):
+        image = TenantImage.objects.get(pk=self.image.pk)
+        image.image = SimpleUploadedFile('small.gif', b'GIF89a', content_type='image/gif')
+        image.save()
+        self.assertEqual(image.size_bytes, 6)
+        self.assertEqual(self.storage_used(), 6)
+
+        image.label = 'renamed'
+        image.save()
+        self.assertEqual(self.storage_used(), 6)
+
+    def test_storage_quota_enforced(self):
+        plan = SubscriptionPlan.objects.create(
+            name='Tiny', slug='tiny', price_monthly=0, price_yearly=0, storage_gb=0
+        )
+        Subscription.objects.create(
+            tenant=self.tenant, plan=plan, status='ACTIVE',
+            current_period_start=timezone.now(),
+            current_period_end=timezone.now() + timedelta(days=30)
+        )
+        with self.assertRaises(QuotaExceeded):
+            self.upload('banner')
+        self.assertEqual(self.storage_used(), len(IMAGE_BYTES))
+
+    def test_exposed_on_tenant_endpoint(self):
+        admin = CustomUser.objects.create_superuser(email='root@example.com', password='TestPass123!')
+        self.client.force_authenticate(user=admin)
+        response = self.client.get(f'/api/tenants/{self.tenant.id}/')
+        self.assertEqual(response.data['storage_used_bytes'], len(IMAGE_BYTES))
+
+    def test_reconcile_repairs_sizes_and_counters(self):
+        TenantImage.objects.filter(pk=self.image.pk).update(size_bytes=1)
+        TenantUsage.objects.filter(tenant=self.tenant).update(storage_bytes=5)
+        call_command('reconcile_storage_usage', stdout=open(os.devnull, 'w'))
+        self.assertEqual(TenantImage.objects.get(pk=self.image.pk).size_bytes, len(IMAGE_BYTES))
+        self.assertEqual(self.storage_used(), len(IMAGE_BYTES))
+
+    @override_settings(RESPONSE_CACHE_ENABLED=True)
+    def test_reconcile_refreshes_cached_tenant_response(self):
+        self.user.cached_permissions = {'admin.full_access': True}
+        TenantUsage.objects.filter(tenant=self.tenant).update(storage_bytes=5)
+        self.assertEqual(self.client.get('/api/tenants/me/').json()['storage_used_bytes'], 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reconcile_storage_usage', stdout=open(os.devnull, 'w'))
+        # force_authenticate hands the view this user, with the usage row cached on its tenant
+        self.user.tenant.refresh_from_db()
+        self.assertEqual(self.client.get('/api/tenants/me/').json()['storage_used_bytes'], len(IMAGE_BYTES))
+
+    def test_tenant_delete_cascades(self):
+        self.tenant.delete()
+        self.assertFalse(TenantUsage.objects.exists())
@@ -1,19 +1,45 @@
+import uuid
 from rest_framework import viewsets, status, serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
+from django.db.models import Count
+from django.http import HttpResponse, HttpResponseNotModified
 from apps.tenants.models import Tenant, TenantImage
 from apps.tenants.serializers import (
     TenantSerializer,
     TenantImageSerializer,
     TenantImageCreateSerializer
 )
-from apps.common.permissions import IsSuperAdmin, IsTenantAdmin
+from apps.tenants.media import PassthroughRenderer, serve_media_file, etag_matches
+from apps.tenants.branding import get_manifest
+from apps.common.async_views import async_api_view, json_response
+from apps.common.response_cache import acache_response, cache_response
+from apps.common.projections import Projection, Column, ProjectedListMixin, Related, file_url
+from apps.common.permissions import IsSuperAdmin, IsTenantAdmin, IsTenantMember
 
 
-class TenantViewSet(viewsets.ModelViewSet):
-    queryset = Tenant.objects.all()
+def load_user_counts(keys, request):
+    return dict(Tenant.objects.filter(pk__in=keys).annotate(count=Count('users')).values_list('pk', 'count'))
+
+
+def load_gallery_images(keys, request):
+    return tenant_image_projection.grouped(TenantImage.objects.filter(tenant__in=keys), 'tenant', request)
+
+
+tenant_image_projection = Projection(TenantImageSerializer, image_url=file_url(TenantImage, 'image'))
+tenant_projection = Projection(
+    TenantSerializer,
+    user_count=Related(load_user_counts, default=0),
+    storage_used_bytes=Column('usage__storage_bytes', default=0),
+    gallery_images=Related(load_gallery_images, default=[]),
+)
+
+
+class TenantViewSet(ProjectedListMixin, viewsets.ModelViewSet):
+    queryset = Tenant.objects.select_related('usage')
     serializer_class = TenantSerializer
+    list_projection = tenant_projection
 
     def get_permissions(self):
         if self.action in ['me', 'update_me']:
@@ -21,6 +47,7 @@ class TenantViewSet(viewsets.ModelViewSet):
         return [IsSuperAdmin()]
 
     @action(detail=False, methods=['get'], permission_classes=[IsTenantAdmin])
+    @cache_response('tenant-me', scopes=('tenant',))
     def me(self, request):
         tenant = request.user.tenant
         if not tenant:
@@ -51,6 +78,8 @@ class TenantImageViewSet(viewsets.ModelViewSet):
 
     def get_permissions(self):
         """Allow tenant admins to manage their own images"""
+        if self.action in ['file', 'branding']:
+            return [IsTenantMember()]
         if self.action in ['list', 'retrieve']:
             return [IsTenantAdmin()]
         return [IsTenantAdmin()]
@@ -61,7 +90,7 @@ class TenantImageViewSet(viewsets.ModelViewSet):
         user = self.request.user
 
         # SuperAdmins can see all images
-        if user.role == 'superadmin':
+        if user.is_super_admin:
             return queryset
 
         # Tenant admins and users can only see their tenant's images
@@ -81,7 +110,7 @@ class TenantImageViewSet(viewsets.ModelViewSet):
         user = self.request.user
 
         # SuperAdmins must specify tenant explicitly
-        if user.role == 'superadmin':
+        if user.is_super_admin:
             if 'tenant' not in self.request.data:
                 raise serializers.ValidationError({
                     'tenant': 'SuperAdmins must specify a tenant_id'
@@ -102,6 +131,34 @@ class TenantImageViewSet(viewsets.ModelViewSet):
                 })
             serializer.save(tenant=user.tenant)
 
+    @action(detail=True, methods=['get'], renderer_classes=[PassthroughRenderer])
+    def file(self, request, pk=None):
+        """Serve the image file with ETag, range and sendfile support"""
+        image = self.get_object()
+        return serve_media_file(request, image.image.name, storage=image.image.storage)
+
+    @action(detail=False, methods=['get'])
+    def branding(self, request):
+        """All active images for the tenant keyed by label, served from cache"""
+        user = request.user
+        tenant_id = user.tenant_id
+        if user.is_super_admin and request.query_params.get('tenant'):
+            try:
+                tenant_id = uuid.UUID(request.query_params['tenant'])
+            except ValueError:
+                return Response({'tenant': 'Invalid tenant id'}, status=status.HTTP_400_BAD_REQUEST)
+        if not tenant_id:
+            return Response({'error': 'User not associated with any tenant'}, status=status.HTTP_400_BAD_REQUEST)
+
+        manifest = get_manifest(tenant_id)
+        if etag_matches(request.headers.get('If-None-Match'), manifest['etag']):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(manifest['body'], content_type='application/json')
+        response['ETag'] = manifest['etag']
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
     @action(detail=False, methods=['get'], permission_classes=[IsTenantAdmin])
     def by_label(self, request):
         """Get images filtered by label for the current tenant"""
@@ -128,12 +185,26 @@ class TenantImageViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        user = request.user
+        # Files are queued by the post_delete signal and removed in the background
         queryset = self.get_queryset().filter(label=label)
-        count = queryset.count()
-        queryset.delete()
+        _, deleted = queryset.delete()
+        count = deleted.get(TenantImage._meta.label, 0)
 
         return Response(
             {'message': f'Deleted {count} image(s) with label "{label}"'},
             status=status.HTTP_200_OK
         )
+
+
+# Async version of a hot read endpoint, routed by config/asgi_urls.py
+
+@async_api_view(TenantViewSet.as_view({'get': 'me'}), permission_classes=(IsTenantAdmin,))
+@acache_response('tenant-me', scopes=('tenant',))
+async def async_tenant_me_view(request):
+    if not request.user.tenant_id:
+        return json_response({'error': 'User not associated with any tenant'}, status=400)
+    tenant = await (
+        Tenant.objects.select_related('usage').prefetch_related('gallery_images')
+        .annotate(user_count=Count('users')).aget(pk=request.user.tenant_id)
+    )
+    return json_response(TenantSerializer(tenant, context={'request': request}).data)
@@ -0,0 +1,142 @@
+"""
+Concurrency benchmark for the async read endpoints under ASGI.
+
+Serves ``config.asgi.application`` in-process the way uvicorn does (one
+asyncio task per connection, no thread pool in front) and keeps
+``--concurrency`` requests in flight against the hot read endpoints
+(``users/me``, ``tenants/me``, ``subscriptions/my_subscription``, the plan
+catalog and token verify), first with the regular sync DRF views
+(``config.urls``) and then with the async views (``config.asgi_urls``).
+
+A slow database is simulated by sleeping ``--db-latency`` ms in every
+query, so requests spend their time waiting on the database rather than in
+SQLite.
+
+Run with: python benchmarks/async_views_bench.py [--concurrency 1 16 64] [--db-latency 5]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import ASGIDriver, admin_email, percentile, seed, setup_django
+
+URLCONFS = {'sync': 'config.urls', 'async': 'config.asgi_urls'}
+
+
+def slow_database(seconds):
+    """Delay every query on every connection by ``seconds``."""
+    from django.db.backends.signals import connection_created
+
+    def delay(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        if delay not in connection.execute_wrappers:
+            connection.execute_wrappers.append(delay)
+
+    connection_created.connect(install, weak=False)
+
+
+def requests_for(member, admin, plan_id):
+    """``(name, method, path, headers, body)`` of the endpoints, members and admins mixed."""
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    member_token = str(RefreshToken.for_user(member).access_token)
+    admin_token = str(RefreshToken.for_user(admin).access_token)
+    return [
+        ('users_me', 'GET', '/api/users/me/', {'Authorization': f'Bearer {member_token}'}, None),
+        ('tenants_me', 'GET', '/api/tenants/me/', {'Authorization': f'Bearer {admin_token}'}, None),
+        ('my_subscription', 'GET', '/api/subscriptions/my_subscription/',
+         {'Authorization': f'Bearer {admin_token}'}, None),
+        ('plan_list', 'GET', '/api/plans/', {}, None),
+        ('plan_detail', 'GET', f'/api/plans/{plan_id}/', {}, None),
+        ('token_verify', 'POST', '/api/auth/token/verify/', {}, {'token': member_token}),
+    ]
+
+
+def run_level(driver, requests, concurrency, duration, rng_seed):
+    latencies = []
+    errors = 0
+
+    async def worker(index):
+        nonlocal errors
+        rng = random.Random(rng_seed + index)
+        while time.perf_counter() < deadline:
+            _, method, path, headers, body = rng.choice(requests)
+            start = time.perf_counter()
+            status, _ = await driver.send(method, path, headers, body)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors += 1
+
+    async def main():
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+    asyncio.run(main())
+    elapsed = time.perf_counter() - start
+    values = sorted(latencies)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'throughput_rps': round(len(values) / elapsed, 1),
+        'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(values, 0.95) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 64])
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds per mode and concurrency level')
+    parser.add_argument('--db-latency', type=float, default=5.0, help='Simulated ms per query')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(f'sqlite:///{os.path.join(tmp, "async_views.sqlite3")}')
+        from django.conf import settings
+        from django.urls import clear_url_caches
+        from apps.accounts.models import CustomUser
+        from apps.billing.models import SubscriptionPlan
+
+        seed('load', tenants=2, users_per_tenant=5)
+        member = CustomUser.objects.filter(tenant__isnull=False).first()
+        # IsTenantAdmin passes super admins; give this one a tenant so the tenant endpoints return data
+        admin = CustomUser.objects.get(email=admin_email('load'))
+        admin.tenant_id = member.tenant_id
+        admin.save()
+        requests = requests_for(member, admin, SubscriptionPlan.objects.get(slug='load').id)
+        slow_database(args.db_latency / 1000)
+        driver = ASGIDriver()
+
+        results = {}
+        for mode, urlconf in URLCONFS.items():
+            settings.ROOT_URLCONF = urlconf
+            clear_url_caches()
+            run_level(driver, requests, 4, 1.0, args.seed)  # warm up
+            for concurrency in args.concurrency:
+                result = run_level(driver, requests, concurrency, args.duration, args.seed)
+                results.setdefault(str(concurrency), {})[mode] = result
+                print(f'{mode:>5} c={concurrency:<3} {result["throughput_rps"]:>8.1f} req/s  '
+                      f'p50 {result["p50_ms"]:>7.2f} ms  p95 {result["p95_ms"]:>7.2f} ms  '
+                      f'errors {result["errors"]}', file=sys.stderr)
+
+    for level in results.values():
+        level['speedup'] = round(level['async']['throughput_rps'] / level['sync']['throughput_rps'], 2)
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,469 @@
+"""
+Local API load test.
+
+Seeds a throwaway database, then drives a weighted mix of API calls at a
+fixed concurrency against either
+
+* ``wsgi``: ``config.wsgi.application`` behind a threaded wsgiref server on
+  127.0.0.1, one client thread per concurrent user, or
+* ``asgi``: ``config.asgi.application`` called in-process, one asyncio task
+  per concurrent user.
+
+Each virtual user logs in as a tenant member. User and tenant listing need
+an admin, so those calls use a super admin token (users filtered to the
+member's tenant with ``X-Tenant-Id``). Throughput and p50/p95/p99 latency (overall and per scenario)
+are printed as JSON. With ``--baseline`` the run is compared to the stored
+results for the same app and exits with status 1 on a regression:
+throughput below, or p95 above, the baseline by more than ``--tolerance``
+(overall, and for scenarios with at least ``--min-samples`` requests), or
+any failed request.
+
+Run with:
+    python benchmarks/load_test.py --app wsgi --concurrency 8 --duration 20
+    python benchmarks/load_test.py --app wsgi --save-baseline   # after an intended change
+
+``--database-url`` runs against another database (e.g. a local PostgreSQL);
+the default is a temporary SQLite file. That database is modified: the run
+applies migrations and seeds plans, tenants and users under a prefix unique
+to the run, which it deletes again at the end. Baselines are machine
+specific: record them on the machine that runs the comparison.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.client import HTTPConnection
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baselines', 'load_test.json')
+PASSWORD = 'LoadTest123!'
+
+# name -> weight; each virtual user picks the next call at random
+MIX = {
+    'login': 4,
+    'token_refresh': 4,
+    'users_me': 30,
+    'user_list': 20,
+    'role_list': 15,
+    'tenant_list': 10,
+    'plan_catalog': 17,
+}
+
+
+def setup_django(database_url):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['DEBUG'] = 'False'
+    import django
+    django.setup()
+    import logging
+    # Per-request INFO lines would dominate the measurement. Not a logger
+    # level: loading config.wsgi/asgi configures logging again.
+    logging.disable(logging.INFO)
+
+
+def admin_email(prefix):
+    return f'root@{prefix}.example.com'
+
+
+def seed(prefix, tenants, users_per_tenant):
+    """
+    Create plans, tenants, roles and users named after ``prefix``; returns
+    ``(email, tenant id)`` of the members.
+    """
+    from datetime import timedelta
+
+    from django.contrib.auth.hashers import make_password
+    from django.core.management import call_command
+    from django.utils import timezone
+    from apps.accounts.models import CustomUser, Role
+    from apps.billing.models import Subscription, SubscriptionPlan
+    from apps.tenants.models import Tenant
+
+    call_command('migrate', verbosity=0)
+    password = make_password(PASSWORD)
+    plan = SubscriptionPlan.objects.create(name='Load', slug=prefix, price_monthly=999, price_yearly=9999,
+                                           included_modules=['crm'])
+    for i in range(3):
+        SubscriptionPlan.objects.create(name=f'Plan {i}', slug=f'{prefix}-plan-{i}', price_monthly=100 * i,
+                                        price_yearly=1000 * i, sort_order=i)
+    now = timezone.now()
+    members_by_tenant = []
+    for t in range(tenants):
+        tenant = Tenant.objects.create(name=f'Load Tenant {t}', slug=f'{prefix}-tenant-{t}', enabled_modules=['crm'])
+        Subscription.objects.create(tenant=tenant, plan=plan, status='ACTIVE', current_period_start=now,
+                                    current_period_end=now + timedelta(days=30))
+        roles = Role.objects.bulk_create([
+            Role(tenant=tenant, name=f'Role {r}', permissions={'crm': {'view': 'all'}}) for r in range(5)
+        ])
+        members = CustomUser.objects.bulk_create([
+            CustomUser(email=f'user{u}@tenant{t}.{prefix}.example.com',
+                       password=password, tenant=tenant)
+            for u in range(users_per_tenant)
+        ])
+        for member in members:
+            member.roles.add(roles[0])
+        members_by_tenant.extend((member.email, str(tenant.id)) for member in members)
+    CustomUser.objects.create(email=admin_email(prefix), password=password,
+                              is_super_admin=True, is_staff=True, is_superuser=True)
+    return members_by_tenant
+
+
+def clean_up(prefix):
+    """Delete what ``seed(prefix, ...)`` created, with everything that references it."""
+    from apps.accounts.models import CustomUser
+    from apps.billing.models import SubscriptionPlan
+    from apps.tenants.models import Tenant
+
+    CustomUser.objects.filter(email__endswith=f'{prefix}.example.com').delete()
+    Tenant.objects.filter(slug__startswith=f'{prefix}-tenant-').delete()
+    SubscriptionPlan.objects.filter(slug__startswith=prefix).delete()
+
+
+class VirtualUser:
+    """Tokens of one simulated client and the requests it sends."""
+
+    def __init__(self, email, tenant_id, admin_access):
+        self.email = email
+        self.tenant_id = tenant_id
+        self.access = None
+        self.refresh = None
+        self.admin_access = admin_access
+
+    def request_for(self, name):
+        """``(method, path, headers, body)`` for scenario ``name``."""
+        bearer = {'Authorization': f'Bearer {self.access}'}
+        if name == 'login':
+            return 'POST', '/api/auth/login/', {}, {'email': self.email, 'password': PASSWORD}
+        if name == 'token_refresh':
+            return 'POST', '/api/auth/token/refresh/', {}, {'refresh': self.refresh}
+        if name == 'users_me':
+            return 'GET', '/api/users/me/', bearer, None
+        if name == 'user_list':
+            return 'GET', '/api/users/', {'Authorization': f'Bearer {self.admin_access}', 'X-Tenant-Id': self.tenant_id}, None
+        if name == 'role_list':
+            return 'GET', '/api/roles/', bearer, None
+        if name == 'tenant_list':
+            return 'GET', '/api/tenants/', {'Authorization': f'Bearer {self.admin_access}'}, None
+        if name == 'plan_catalog':
+            return 'GET', '/api/plans/', {}, None
+        raise ValueError(name)
+
+    def handle_response(self, name, status, body):
+        if status != 200:
+            return
+        if name == 'login':
+            tokens = json.loads(body)['tokens']
+            self.access, self.refresh = tokens['access'], tokens['refresh']
+        elif name == 'token_refresh':
+            data = json.loads(body)
+            self.access = data['access']
+            self.refresh = data.get('refresh', self.refresh)
+
+
+def _encode(headers, body):
+    headers = dict(headers)
+    payload = b''
+    if body is not None:
+        payload = json.dumps(body).encode()
+        headers['Content-Type'] = 'application/json'
+    headers['Content-Length'] = str(len(payload))
+    return headers, payload
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class WSGIDriver:
+    def __init__(self):
+        from config.wsgi import application
+        self.server = make_server('127.0.0.1', 0, application, server_class=_ThreadingWSGIServer,
+                                  handler_class=_QuietHandler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def send(self, method, path, headers, body):
+        headers, payload = _encode(headers, body)
+        connection = HTTPConnection('127.0.0.1', self.port, timeout=60)
+        try:
+            connection.request(method, path, body=payload, headers=headers)
+            response = connection.getresponse()
+            return response.status, response.read()
+        finally:
+            connection.close()
+
+    def run(self, users, deadline, record, seed_value):
+        def worker(index, user):
+            rng = random.Random(seed_value + index)
+            while time.perf_counter() < deadline:
+                run_one(self.send, user, rng, record)
+
+        threads = [threading.Thread(target=worker, args=(i, user)) for i, user in enumerate(users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def close(self):
+        self.server.shutdown()
+
+
+class ASGIDriver:
+    def __init__(self):
+        from config.asgi import application
+        self.application = application
+
+    async def send(self, method, path, headers, body):
+        headers, payload = _encode(headers, body)
+        path, _, query = path.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': method, 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+            'query_string': query.encode(), 'root_path': '',
+            'headers': [(key.lower().encode(), value.encode()) for key, value in headers.items()],
+            'client': ('127.0.0.1', 0), 'server': ('127.0.0.1', 80),
+        }
+        response = {'status': 500, 'body': []}
+        done = asyncio.Event()
+        request_sent = False
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {'type': 'http.request', 'body': payload, 'more_body': False}
+            await done.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+            elif message['type'] == 'http.response.body':
+                response['body'].append(message.get('body', b''))
+                if not message.get('more_body'):
+                    done.set()
+
+        await self.application(scope, receive, send)
+        return response['status'], b''.join(response['body'])
+
+    def run(self, users, deadline, record, seed_value):
+        async def worker(index, user):
+            rng = random.Random(seed_value + index)
+            while time.perf_counter() < deadline:
+                await run_one_async(self.send, user, rng, record)
+
+        async def main():
+            await asyncio.gather(*(worker(i, user) for i, user in enumerate(users)))
+
+        asyncio.run(main())
+
+    def close(self):
+        pass
+
+
+def _pick(rng):
+    return rng.choices(list(MIX), weights=list(MIX.values()))[0]
+
+
+def run_one(send, user, rng, record):
+    name = _pick(rng)
+    start = time.perf_counter()
+    status, body = send(*user.request_for(name))
+    record(name, time.perf_counter() - start, status)
+    user.handle_response(name, status, body)
+
+
+async def run_one_async(send, user, rng, record):
+    name = _pick(rng)
+    start = time.perf_counter()
+    status, body = await send(*user.request_for(name))
+    record(name, time.perf_counter() - start, status)
+    user.handle_response(name, status, body)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    values = sorted(latencies)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'throughput_rps': round(len(values) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(values, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+    }
+
+
+def compare(result, baseline, tolerance, min_samples):
+    """
+    Regression messages of ``result`` against ``baseline`` (same shape).
+    Scenarios with fewer than ``min_samples`` requests are only checked for
+    errors, their percentiles are too noisy.
+    """
+    problems = []
+    pairs = [('total', result['total'], baseline.get('total'))]
+    pairs += [(name, stats, baseline.get('scenarios', {}).get(name)) for name, stats in result['scenarios'].items()]
+    for name, current, base in pairs:
+        if current['errors']:
+            problems.append(f"{name}: {current['errors']} failed request(s)")
+        if not base or (name != 'total' and current['requests'] < min_samples):
+            continue
+        if current['throughput_rps'] < base['throughput_rps'] * (1 - tolerance):
+            problems.append(f"{name}: throughput {current['throughput_rps']} rps < baseline {base['throughput_rps']} rps")
+        if current['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            problems.append(f"{name}: p95 {current['p95_ms']} ms > baseline {base['p95_ms']} ms")
+    return problems
+
+
+def run(args):
+    prefix = f'load-{uuid.uuid4().hex[:8]}'
+    try:
+        return measure(args, prefix, seed(prefix, args.tenants, args.users_per_tenant))
+    finally:
+        clean_up(prefix)
+
+
+def measure(args, prefix, members):
+    driver = WSGIDriver() if args.app == 'wsgi' else ASGIDriver()
+    rng = random.Random(args.seed)
+
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from apps.accounts.models import CustomUser
+    admin_access = str(RefreshToken.for_user(CustomUser.objects.get(email=admin_email(prefix))).access_token)
+    users = [
+        VirtualUser(email, tenant_id, admin_access)
+        for email, tenant_id in rng.sample(members, min(args.concurrency, len(members)))
+    ]
+
+    # Log everyone in (also warms up connections and caches)
+    for user in users:
+        status, body = _call(driver, 'login', user)
+        user.handle_response('login', status, body)
+        if status != 200:
+            raise SystemExit(f'Login failed for {user.email}: {status} {body[:200]!r}')
+
+    lock = threading.Lock()
+    samples = {name: [] for name in MIX}
+    errors = {name: 0 for name in MIX}
+
+    def record(name, seconds, status):
+        with lock:
+            samples[name].append(seconds)
+            if status >= 400:
+                errors[name] += 1
+
+    if args.warmup:
+        driver.run(users, time.perf_counter() + args.warmup, lambda *a: None, args.seed)
+    start = time.perf_counter()
+    driver.run(users, start + args.duration, record, args.seed)
+    elapsed = time.perf_counter() - start
+    driver.close()
+
+    from django.db import connection
+    return {
+        'app': args.app,
+        'concurrency': len(users),
+        'duration_s': round(elapsed, 2),
+        'environment': {
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'machine': platform.machine(),
+        },
+        'total': summarize([s for values in samples.values() for s in values], sum(errors.values()), elapsed),
+        'scenarios': {name: summarize(samples[name], errors[name], elapsed) for name in MIX},
+    }
+
+
+def _call(driver, name, user):
+    request = user.request_for(name)
+    if isinstance(driver, ASGIDriver):
+        return asyncio.run(driver.send(*request))
+    return driver.send(*request)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--app', choices=['wsgi', 'asgi'], default='wsgi')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20.0, help='Measured seconds')
+    parser.add_argument('--warmup', type=float, default=3.0, help='Unmeasured seconds before the run')
+    parser.add_argument('--tenants', type=int, default=5)
+    parser.add_argument('--users-per-tenant', type=int, default=25)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database-url', help='Default: a temporary SQLite file')
+    parser.add_argument('--output', help='Also write the JSON result to this file')
+    parser.add_argument('--baseline', nargs='?', const=DEFAULT_BASELINE,
+                        help=f'Compare with a baseline file (default {os.path.relpath(DEFAULT_BASELINE)})')
+    parser.add_argument('--save-baseline', nargs='?', const=DEFAULT_BASELINE,
+                        help='Store this run as the baseline for --app')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative regression')
+    parser.add_argument('--min-samples', type=int, default=100,
+                        help='Fewest requests of a scenario for its own latency/throughput check')
+    args = parser.parse_args()
+
+    # As config.asgi would, when it is not the one loading the settings
+    os.environ.setdefault('ASYNC_VIEWS', str(args.app == 'asgi'))
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(args.database_url or f'sqlite:///{os.path.join(tmp, "load_test.sqlite3")}')
+        result = run(args)
+
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+    if args.save_baseline:
+        baselines = {}
+        if os.path.exists(args.save_baseline):
+            with open(args.save_baseline) as f:
+                baselines = json.load(f)
+        baselines[args.app] = result
+        os.makedirs(os.path.dirname(args.save_baseline), exist_ok=True)
+        with open(args.save_baseline, 'w') as f:
+            json.dump(baselines, f, indent=2)
+            f.write('\n')
+        print(f'Saved baseline for {args.app} to {args.save_baseline}', file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f).get(args.app)
+        if baseline is None:
+            print(f'No {args.app} baseline in {args.baseline}', file=sys.stderr)
+            return 1
+        problems = compare(result, baseline, args.tolerance, args.min_samples)
+        for problem in problems:
+            print(f'REGRESSION {problem}', file=sys.stderr)
+        if problems:
+            return 1
+        print(f'No regression against {args.baseline} (tolerance {args.tolerance:.0%})', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Micro-benchmark for per-request logging overhead.
+
+Replays the log calls of one user-create request (three INFO lines and two
+DEBUG lines with the request and response payloads, DEBUG disabled as in
+production) against:
+
+* before: eager f-strings, RotatingFileHandlers written on the calling thread
+* after:  lazy %-style arguments, QueueListenerHandler with JSON output
+
+Only the time spent on the calling (request) thread is measured; the
+listener is drained afterwards.
+
+Run with: python benchmarks/logging_bench.py [--requests 20000] [--threads 4]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apps.common.logger import CompressingRotatingFileHandler, JsonFormatter, QueueListenerHandler
+
+VERBOSE = logging.Formatter(
+    '[{levelname}] {asctime} {name} {module} {funcName} - {message}', '%Y-%m-%d %H:%M:%S', style='{'
+)
+SIMPLE = logging.Formatter('[{levelname}] {asctime} - {message}', '%Y-%m-%d %H:%M:%S', style='{')
+
+REQUEST_DATA = {
+    'email': 'new.user@example.com',
+    'first_name': 'New',
+    'last_name': 'User',
+    'role': 'MEMBER',
+    'permissions': ['crm.view', 'crm.edit', 'billing.view'] * 5,
+}
+RESPONSE_DATA = dict(REQUEST_DATA, id='0b7e5a4c-8f9e-4b59-9f6e-3d0c6c1f2a11', is_active=True)
+
+
+def request_before(logger, user):
+    logger.info(f'Create user request from: {user}')
+    logger.debug(f'Request data: {REQUEST_DATA}')
+    logger.info(f'Tenant ID extracted from x-tenant-id header: {user}')
+    logger.info(f'User created successfully: {user} (ID: 42) in tenant: acme')
+    logger.debug(f'Response data: {RESPONSE_DATA}')
+
+
+def request_after(logger, user):
+    logger.info('Create user request from: %s', user)
+    logger.debug('Request data: %s', REQUEST_DATA)
+    logger.info('Tenant ID extracted from x-tenant-id header: %s', user)
+    logger.info('User created successfully: %s (ID: %s) in tenant: %s', user, 42, 'acme')
+    logger.debug('Response data: %s', RESPONSE_DATA)
+
+
+def file_handlers(directory, handler_class, formatter):
+    handlers = []
+    for name, level, fmt in (('info', logging.INFO, formatter or SIMPLE), ('error', logging.ERROR, formatter or VERBOSE)):
+        handler = handler_class(os.path.join(directory, f'{name}.log'), maxBytes=10 * 1024 * 1024, backupCount=5)
+        handler.setLevel(level)
+        handler.setFormatter(fmt)
+        handlers.append(handler)
+    return handlers
+
+
+def make_logger(name, handlers):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    for handler in handlers:
+        logger.addHandler(handler)
+    return logger
+
+
+def timed(fn, logger, requests, threads):
+    per_thread = requests // threads
+
+    def worker():
+        for _ in range(per_thread):
+            fn(logger, 'admin@example.com')
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return (time.perf_counter() - start) / (per_thread * threads) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as before_dir, tempfile.TemporaryDirectory() as after_dir:
+        before_handlers = file_handlers(before_dir, RotatingFileHandler, None)
+        before = make_logger('bench.before', before_handlers)
+
+        targets = file_handlers(after_dir, CompressingRotatingFileHandler, JsonFormatter())
+        queue_handler = QueueListenerHandler(targets)
+        after = make_logger('bench.after', [queue_handler])
+
+        for threads in (1, args.threads):
+            before_us = timed(request_before, before, args.requests, threads)
+            after_us = timed(request_after, after, args.requests, threads)
+            print(
+                f'{threads} thread(s): before {before_us:.1f} us/request, after {after_us:.1f} us/request '
+                f'({before_us / after_us:.1f}x)'
+            )
+
+        drain_start = time.perf_counter()
+        queue_handler.close()
+        print(f'listener drained in {time.perf_counter() - drain_start:.2f}s')
+        for handler in before_handlers + targets:
+            handler.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Serialization benchmark for the projected list endpoints.
+
+Generates synthetic tenants, users, roles and invoices into a throwaway
+database and renders ``--rows`` rows of each list endpoint (users, invoices,
+subscriptions, tenants) to JSON bytes in two ways:
+
+* ``serializer``: the endpoint's ``ModelSerializer`` plus ``JSONRenderer``,
+  from model instances loaded up front with every relation prefetched;
+* ``projection``: the endpoint's projection from ``values_list()`` rows
+  and related values (roles, gallery images, counts) fetched up front,
+  encoded once.
+
+``render`` times only that step, with no queries on either side. ``page``
+times a whole page from the database: the viewset's queryset through the
+serializer (as the list endpoints did before projections), against the
+projection's ``values_list()`` and related queries plus encoding.
+
+Run with: python benchmarks/serialization_bench.py [--rows 500] [--repeat 20]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import setup_django
+
+
+def endpoints():
+    """``name: (serializer class, prefetched queryset, viewset queryset, projection)``"""
+    from django.db.models import Count, Prefetch
+    from apps.accounts.models import CustomUser
+    from apps.accounts.serializers import UserSerializer
+    from apps.accounts.views import roles_with_member_count, user_projection
+    from apps.billing.models import Invoice, Subscription
+    from apps.billing.serializers import InvoiceSerializer, SubscriptionSerializer
+    from apps.billing.views import invoice_projection, subscription_projection
+    from apps.tenants.models import Tenant
+    from apps.tenants.serializers import TenantSerializer
+    from apps.tenants.views import tenant_projection
+
+    return {
+        'users': (
+            UserSerializer,
+            CustomUser.objects.select_related('tenant').prefetch_related(
+                Prefetch('roles', queryset=roles_with_member_count())),
+            CustomUser.objects.all(),
+            user_projection,
+        ),
+        'invoices': (
+            InvoiceSerializer, Invoice.objects.select_related('tenant'), Invoice.objects.all(), invoice_projection,
+        ),
+        'subscriptions': (
+            SubscriptionSerializer, Subscription.objects.select_related('plan', 'tenant__usage'),
+            Subscription.objects.select_related('plan', 'tenant__usage'), subscription_projection,
+        ),
+        'tenants': (
+            TenantSerializer,
+            Tenant.objects.select_related('usage').annotate(user_count=Count('users'))
+            .prefetch_related('gallery_images'),
+            Tenant.objects.select_related('usage'),
+            tenant_projection,
+        ),
+    }
+
+
+def preloaded(projection, rows, request):
+    """``projection`` with its related values for ``rows`` loaded once, so rendering runs no queries."""
+    from apps.common.projections import Projection, Related
+
+    keys = [row[0] for row in rows]
+    overrides = dict(projection.overrides)
+    for name, spec in projection.overrides.items():
+        if isinstance(spec, Related):
+            loaded = spec.loader(keys, request)
+            overrides[name] = Related(lambda keys, request, loaded=loaded: loaded, spec.default)
+    return Projection(projection.serializer_class, **overrides)
+
+
+def best_of(repeat, function):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=500, help='Rows rendered per endpoint')
+    parser.add_argument('--repeat', type=int, default=20, help='Runs per measurement; the fastest counts')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(f'sqlite:///{os.path.join(tmp, "serialization.sqlite3")}')
+        from django.core.management import call_command
+        from rest_framework.renderers import JSONRenderer
+        from rest_framework.request import Request
+        from rest_framework.test import APIRequestFactory
+        from apps.common.synthetic import generate
+
+        call_command('migrate', verbosity=0)
+        # Enough tenants for --rows tenants and subscriptions, several users and invoices each
+        generate(tenants=args.rows, users=args.rows * 4, roles_per_tenant=3, seed=args.seed,
+                 history_days=365, rebuild_revenue=False)
+        request = Request(APIRequestFactory().get('/api/'))
+        renderer = JSONRenderer()
+
+        results = {}
+        for name, (serializer_class, prefetched, queryset, projection) in endpoints().items():
+            instances = list(prefetched[:args.rows])
+            rows = list(projection.values(queryset)[:args.rows])
+            loaded = preloaded(projection, rows, request)
+            context = {'request': request}
+
+            def render_serializer(objects):
+                return renderer.render(serializer_class(objects, many=True, context=context).data)
+
+            by_id = lambda body: sorted(json.loads(body), key=lambda item: item['id'])  # noqa: E731
+            assert by_id(render_serializer(instances)) == by_id(loaded.encode(rows, request)), name
+            render = {
+                'serializer_ms': best_of(args.repeat, lambda: render_serializer(instances)),
+                'projection_ms': best_of(args.repeat, lambda: loaded.encode(rows, request)),
+            }
+            page = {
+                'serializer_ms': best_of(args.repeat, lambda: render_serializer(queryset[:args.rows])),
+                'projection_ms': best_of(args.repeat,
+                                         lambda: projection.encode(projection.values(queryset)[:args.rows], request)),
+            }
+            results[name] = {}
+            for step, timing in (('render', render), ('page', page)):
+                results[name][step] = {key: round(value * 1000, 2) for key, value in timing.items()}
+                results[name][step]['speedup'] = round(timing['serializer_ms'] / timing['projection_ms'], 1)
+                print(f'{name:>13} {step:<6} serializer {timing["serializer_ms"] * 1000:>8.2f} ms  '
+                      f'projection {timing["projection_ms"] * 1000:>7.2f} ms  '
+                      f'{results[name][step]["speedup"]:>5.1f}x', file=sys.stderr)
+
+    print(json.dumps({'rows': args.rows, 'results': results}, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
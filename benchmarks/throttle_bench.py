@@ -0,0 +1,94 @@
+"""
+Micro-benchmark for the per-tenant throttle hot path.
+
+Measures TenantPlanRateThrottle.allow_request with a warm entitlement
+snapshot (what every authenticated API request pays), single-threaded and
+with several threads hitting different tenants.
+
+Run with: python benchmarks/throttle_bench.py [--tenants 10000] [--threads 8]
+Exits with status 1 if the single-threaded cost exceeds --budget-us.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+import django
+
+django.setup()
+
+from apps.billing import entitlements
+from apps.common.throttling import TenantPlanRateThrottle, TenantRateLimiter
+
+
+def make_requests(count):
+    requests = []
+    for _ in range(count):
+        tenant_id = uuid.uuid4()
+        # Warm snapshot, as after the first request of a tenant
+        entitlements._snapshots[tenant_id] = entitlements.Entitlements(
+            tenant_id=tenant_id,
+            tenant_active=True,
+            modules=frozenset(['crm']),
+            status='ACTIVE',
+            rate_limit=10 ** 9,
+            expires_at=time.monotonic() + 3600,
+        )
+        user = SimpleNamespace(is_authenticated=True, is_super_admin=False, tenant_id=tenant_id)
+        requests.append(SimpleNamespace(user=user))
+    return requests
+
+
+def run(requests, iterations):
+    throttle = TenantPlanRateThrottle()
+    allow = throttle.allow_request
+    n = len(requests)
+    start = time.perf_counter()
+    for i in range(iterations):
+        allow(requests[i % n], None)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tenants', type=int, default=10000)
+    parser.add_argument('--iterations', type=int, default=200000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--budget-us', type=float, default=20.0)
+    args = parser.parse_args()
+
+    TenantPlanRateThrottle.limiter = TenantRateLimiter(shards=64)
+    requests = make_requests(args.tenants)
+    run(requests, args.tenants)  # warm buckets
+
+    elapsed = run(requests, args.iterations)
+    per_check = elapsed / args.iterations * 1e6
+    print(f'single thread: {per_check:.2f} us/check ({args.iterations / elapsed:,.0f} checks/s)')
+
+    per_thread = args.iterations // args.threads
+    threads = [threading.Thread(target=run, args=(requests, per_thread)) for _ in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    total = per_thread * args.threads
+    print(f'{args.threads} threads:    {elapsed / total * 1e6:.2f} us/check wall ({total / elapsed:,.0f} checks/s)')
+
+    if per_check > args.budget_us:
+        print(f'FAIL: {per_check:.2f} us exceeds budget of {args.budget_us} us')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
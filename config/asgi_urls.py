@@ -0,0 +1,21 @@
+"""
+URL configuration for config.asgi.
+
+Routes the hottest read endpoints to their async views (see
+apps/common/async_views.py) ahead of the regular URLconf. Selected by
+``ASYNC_VIEWS``.
+"""
+from django.urls import path, re_path
+from apps.accounts.views import async_me_view, async_token_verify_view
+from apps.billing.views import async_my_subscription_view, async_plan_detail_view, async_plan_list_view
+from apps.tenants.views import async_tenant_me_view
+from config.urls import urlpatterns as base_urlpatterns
+
+urlpatterns = [
+    path('api/users/me/', async_me_view, name='user-me'),
+    path('api/auth/token/verify/', async_token_verify_view, name='token_verify'),
+    path('api/tenants/me/', async_tenant_me_view, name='tenant-me'),
+    path('api/subscriptions/my_subscription/', async_my_subscription_view, name='subscription-my-subscription'),
+    path('api/plans/', async_plan_list_view, name='plan-list'),
+    re_path(r'^api/plans/(?P<pk>[^/.]+)/$', async_plan_detail_view, name='plan-detail'),
+] + base_urlpatterns
@@ -31,9 +31,11 @@ INSTALLED_APPS = [
     'apps.accounts',
     'apps.tenants',
     'apps.billing',
+    'apps.common',
 ]
 
 MIDDLEWARE = [
+    'apps.common.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -42,9 +44,14 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'apps.common.profiling.ProfilingMiddleware',
 ]
 
-ROOT_URLCONF = 'config.urls'
+# Serve the hot read endpoints with async views (config/asgi_urls.py).
+# config.asgi turns this on unless set; under WSGI they would only add an event loop per request.
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+
+ROOT_URLCONF = 'config.asgi_urls' if ASYNC_VIEWS else 'config.urls'
 
 TEMPLATES = [
     {
@@ -90,6 +97,122 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Media delivery for tenant images (apps/tenants/media.py)
+# '' serves files from Django, 'nginx' uses X-Accel-Redirect, 'xsendfile' uses X-Sendfile
+MEDIA_SENDFILE_BACKEND = config('MEDIA_SENDFILE_BACKEND', default='')
+# nginx `internal` location aliased to MEDIA_ROOT
+MEDIA_SENDFILE_PREFIX = config('MEDIA_SENDFILE_PREFIX', default='/protected-media/')
+# Max age for versioned (?v=<etag>) media URLs
+MEDIA_CACHE_MAX_AGE = config('MEDIA_CACHE_MAX_AGE', default=60 * 60 * 24 * 365, cast=int)
+# Deleted tenant image files are removed by a background sweeper in batches
+FILE_DELETION_BATCH_SIZE = config('FILE_DELETION_BATCH_SIZE', default=500, cast=int)
+FILE_DELETION_MAX_ATTEMPTS = config('FILE_DELETION_MAX_ATTEMPTS', default=5, cast=int)
+
+# Tenant provisioning jobs (apps/tenants/provisioning.py)
+# Admin connection used to create a dedicated database per tenant; empty = shared database
+TENANT_DATABASE_ADMIN_URL = config('TENANT_DATABASE_ADMIN_URL', default='')
+PROVISIONING_MAX_ATTEMPTS = config('PROVISIONING_MAX_ATTEMPTS', default=5, cast=int)
+PROVISIONING_STALE_MINUTES = config('PROVISIONING_STALE_MINUTES', default=15, cast=int)
+
+# Django cache: LocMem per process, or the file-based backend in CACHE_DIR,
+# shared by the processes of one host
+CACHE_DIR = config('CACHE_DIR', default='')
+CACHE_MAX_ENTRIES = config('CACHE_MAX_ENTRIES', default=10000, cast=int)
+CACHES = {
+    'default': {
+        'BACKEND': (
+            'django.core.cache.backends.filebased.FileBasedCache' if CACHE_DIR
+            else 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': CACHE_DIR,
+        'OPTIONS': {'MAX_ENTRIES': CACHE_MAX_ENTRIES},
+    },
+}
+
+# Cross-process cache invalidation (apps/common/invalidation.py). Opt-in: enable it in deployments
+# with several processes, not for test runs, whose listeners would keep the test database from being dropped.
+INVALIDATION_BUS = config('INVALIDATION_BUS', default=False, cast=bool)
+# False behind poolers without LISTEN support (e.g. PgBouncer in transaction mode): poll only
+INVALIDATION_LISTEN = config('INVALIDATION_LISTEN', default=True, cast=bool)
+# Seconds between counter polls while not listening, and between liveness checks while listening
+INVALIDATION_POLL_INTERVAL = config('INVALIDATION_POLL_INTERVAL', default=30, cast=float)
+
+# Versioned response cache for users/me, tenants/me, my_subscription (apps/common/response_cache.py)
+# On by default only where version bumps reach every process: a shared CACHE_DIR or the invalidation bus
+RESPONSE_CACHE_ENABLED = config('RESPONSE_CACHE_ENABLED', default=bool(CACHE_DIR) or INVALIDATION_BUS, cast=bool)
+RESPONSE_CACHE_TTL = config('RESPONSE_CACHE_TTL', default=300, cast=int)
+# Seconds a request waits for another process computing the same response
+RESPONSE_CACHE_LOCK_WAIT = config('RESPONSE_CACHE_LOCK_WAIT', default=1.0, cast=float)
+
+# Entitlement snapshots (apps/billing/entitlements.py)
+ENTITLEMENT_CACHE_TTL = config('ENTITLEMENT_CACHE_TTL', default=300, cast=int)
+ENTITLEMENT_PAST_DUE_GRACE_DAYS = config('ENTITLEMENT_PAST_DUE_GRACE_DAYS', default=7, cast=int)
+
+# Per-tenant API throttling by plan tier (apps/common/throttling.py)
+# Requests per minute for tenants without a subscription; 0 = unlimited
+DEFAULT_TENANT_RATE_LIMIT = config('DEFAULT_TENANT_RATE_LIMIT', default=0, cast=int) or None
+THROTTLE_SHARDS = config('THROTTLE_SHARDS', default=64, cast=int)
+# Seconds between pushes of local counts to the shared cache; 0 = single node
+THROTTLE_SYNC_INTERVAL = config('THROTTLE_SYNC_INTERVAL', default=0, cast=float)
+
+# Invoice numbers (apps/billing/numbering.py)
+# Numbers a process reserves per round trip; unused ones are skipped on restart
+INVOICE_NUMBER_BLOCK_SIZE = config('INVOICE_NUMBER_BLOCK_SIZE', default=20, cast=int)
+
+# Invoice documents (apps/billing/documents.py)
+# Scheme and host written into Invoice.invoice_url; rendering runs outside any request
+PUBLIC_BASE_URL = config('PUBLIC_BASE_URL', default='http://localhost:5000')
+
+# Period-end billing run (apps/billing/billing_run.py)
+BILLING_RUN_CHUNK_SIZE = config('BILLING_RUN_CHUNK_SIZE', default=1000, cast=int)
+BILLING_RUN_WORKERS = config('BILLING_RUN_WORKERS', default=1, cast=int)
+INVOICE_DUE_DAYS = config('INVOICE_DUE_DAYS', default=7, cast=int)
+
+# Public plan catalog (apps/billing/catalog.py)
+PLAN_CATALOG_TTL = config('PLAN_CATALOG_TTL', default=300, cast=int)
+# Cache-Control max-age for browsers and CDNs
+PLAN_CATALOG_MAX_AGE = config('PLAN_CATALOG_MAX_AGE', default=60, cast=int)
+
+# Payment provider webhooks (apps/billing/webhooks.py)
+PAYMENT_WEBHOOK_PROVIDER = config('PAYMENT_WEBHOOK_PROVIDER', default='default')
+PAYMENT_WEBHOOK_SECRET = config('PAYMENT_WEBHOOK_SECRET', default='')
+# Max age of a signature timestamp in seconds (replay protection)
+PAYMENT_WEBHOOK_TOLERANCE = config('PAYMENT_WEBHOOK_TOLERANCE', default=300, cast=int)
+PAYMENT_WEBHOOK_BATCH_SIZE = config('PAYMENT_WEBHOOK_BATCH_SIZE', default=500, cast=int)
+PAYMENT_WEBHOOK_MAX_ATTEMPTS = config('PAYMENT_WEBHOOK_MAX_ATTEMPTS', default=5, cast=int)
+
+# Subscription lifecycle scheduler (apps/billing/lifecycle.py)
+LIFECYCLE_BATCH_SIZE = config('LIFECYCLE_BATCH_SIZE', default=1000, cast=int)
+
+# Request metrics (apps/common/metrics.py), scraped from /metrics
+# Directory shared by all worker processes; empty = this process only
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=5, cast=int)
+# Bearer token required by /metrics; without one, only clients in METRICS_ALLOWED_NETWORKS
+# (REMOTE_ADDR, i.e. the proxy behind a reverse proxy) are served
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+METRICS_ALLOWED_NETWORKS = config(
+    'METRICS_ALLOWED_NETWORKS',
+    default='127.0.0.1/32,::1/128',
+    cast=lambda v: [s.strip() for s in v.split(',') if s.strip()]
+)
+# SQL fingerprint statistics per view (apps/common/query_stats.py)
+QUERY_STATS_ENABLED = config('QUERY_STATS_ENABLED', default=True, cast=bool)
+# Queries at least this slow are kept as samples
+QUERY_STATS_SLOW_MS = config('QUERY_STATS_SLOW_MS', default=200, cast=int)
+QUERY_STATS_SAMPLES = config('QUERY_STATS_SAMPLES', default=100, cast=int)
+
+# Request profiling (apps/common/profiling.py); super admins send X-Profile: 1
+# Fraction of all requests profiled at random (0 = only on request)
+PROFILING_SAMPLE_RATE = config('PROFILING_SAMPLE_RATE', default=0.0, cast=float)
+PROFILING_MAX_PROFILES = config('PROFILING_MAX_PROFILES', default=200, cast=int)
+# Functions and allocation sites kept per profile
+PROFILING_TOP_N = config('PROFILING_TOP_N', default=30, cast=int)
+
+# In-process background tasks (apps/common/tasks.py)
+BACKGROUND_TASK_WORKERS = config('BACKGROUND_TASK_WORKERS', default=4, cast=int)
+BACKGROUND_TASKS_EAGER = config('BACKGROUND_TASKS_EAGER', default=False, cast=bool)
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'accounts.CustomUser'
@@ -101,11 +224,19 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # JSONRenderer plus pre-encoded list pages (apps/common/projections.py)
+    'DEFAULT_RENDERER_CLASSES': [
+        'apps.common.renderers.PreEncodedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'apps.common.throttling.TenantPlanRateThrottle',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
@@ -163,6 +294,7 @@ CORS_ALLOW_HEADERS = list(default_headers) + [
     'x-tenant-id',
     'x-tenant-slug',
     'tenanttoken',
+    'x-profile',
 ]
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -177,6 +309,8 @@ DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default=EMAIL_HOST_USER)
 # Create logs directory if it doesn't exist
 LOGS_DIR = os.path.join(BASE_DIR, 'logs')
 os.makedirs(LOGS_DIR, exist_ok=True)
+# Write the log files as one JSON object per line
+LOG_JSON = config('LOG_JSON', default=True, cast=bool)
 
 LOGGING = {
     'version': 1,
@@ -192,6 +326,9 @@ LOGGING = {
             'style': '{',
             'datefmt': '%Y-%m-%d %H:%M:%S',
         },
+        'json': {
+            '()': 'apps.common.logger.JsonFormatter',
+        },
     },
     'filters': {
         'require_debug_true': {
@@ -209,54 +346,64 @@ LOGGING = {
         },
         'file_debug': {
             'level': 'DEBUG',
-            'class': 'logging.handlers.RotatingFileHandler',
+            'class': 'apps.common.logger.CompressingRotatingFileHandler',
             'filename': os.path.join(LOGS_DIR, 'debug.log'),
             'maxBytes': 1024 * 1024 * 10,  # 10 MB
             'backupCount': 5,
-            'formatter': 'verbose',
+            'formatter': 'json' if LOG_JSON else 'verbose',
             'filters': ['require_debug_true'],
         },
         'file_info': {
             'level': 'INFO',
-            'class': 'logging.handlers.RotatingFileHandler',
+            'class': 'apps.common.logger.CompressingRotatingFileHandler',
             'filename': os.path.join(LOGS_DIR, 'info.log'),
             'maxBytes': 1024 * 1024 * 10,  # 10 MB
             'backupCount': 5,
-            'formatter': 'simple',
+            'formatter': 'json' if LOG_JSON else 'simple',
         },
         'file_error': {
             'level': 'ERROR',
-            'class': 'logging.handlers.RotatingFileHandler',
+            'class': 'apps.common.logger.CompressingRotatingFileHandler',
             'filename': os.path.join(LOGS_DIR, 'error.log'),
             'maxBytes': 1024 * 1024 * 10,  # 10 MB
             'backupCount': 5,
-            'formatter': 'verbose',
+            'formatter': 'json' if LOG_JSON else 'verbose',
+        },
+        # File handlers run on a listener thread; loggers only enqueue records.
+        # Named so that it sorts after the handlers it references.
+        'queue_all': {
+            '()': 'apps.common.logger.QueueListenerHandler',
+            'handlers': ['cfg://handlers.file_debug', 'cfg://handlers.file_info', 'cfg://handlers.file_error'],
+        },
+        'queue_error': {
+            '()': 'apps.common.logger.QueueListenerHandler',
+            'handlers': ['cfg://handlers.file_error'],
         },
     },
     'loggers': {
         'django': {
-            'handlers': ['console', 'file_info', 'file_error'],
+            'handlers': ['console', 'queue_all'],
             'level': 'INFO',
             'propagate': False,
         },
         'django.request': {
-            'handlers': ['console', 'file_error'],
+            'handlers': ['console', 'queue_error'],
             'level': 'ERROR',
             'propagate': False,
         },
         'django.db.backends': {
-            'handlers': ['console', 'file_debug'] if DEBUG else ['file_info'],
+            'handlers': ['console', 'queue_all'] if DEBUG else ['queue_all'],
             'level': 'DEBUG' if DEBUG else 'INFO',
             'propagate': False,
         },
         'apps': {
-            'handlers': ['console', 'file_debug', 'file_info', 'file_error'],
+            'handlers': ['console', 'queue_all'],
             'level': 'DEBUG' if DEBUG else 'INFO',
             'propagate': False,
         },
     },
     'root': {
-        'handlers': ['console', 'file_info', 'file_error'],
+        'handlers': ['console', 'queue_all'],
         'level': 'DEBUG' if DEBUG else 'INFO',
     },
 }